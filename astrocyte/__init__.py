@@ -1,107 +1,492 @@
-import os, sys, json, glob, re, fnmatch
+import os, sys, json, glob, re, fnmatch, contextlib
 from shutil import copy2 as copy_file
-from appdirs import AppDirs
 from .exceptions import *
+from . import nmodl
+from .profiling import instrument, span
+from .journal import PackageLock, Journal
 
 __version__ = "0.2.4"
 
-app_directories = AppDirs("Astrocyte", "Alexandria")
+
+def __getattr__(name):
+    # Create the app directories on first use, `appdirs` is slow to import.
+    if name == "app_directories":
+        from appdirs import AppDirs
+
+        global app_directories
+        app_directories = AppDirs("Astrocyte", "Alexandria")
+        return app_directories
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def execute_command(cmnd):
+    """
+        Run a command, echoing its stdout. Use :func:`.process.run_command` for
+        control over timeouts and output callbacks.
+
+        :returns: The completed process, its stdout and its stderr.
+    """
     import subprocess
+    from .process import run_command
 
-    process = subprocess.Popen(cmnd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    std_out_str, std_err_str = "", ""
-    for c in iter(lambda: process.stdout.read(1), b""):
-        s = c.decode("UTF-8", "ignore")
-        sys.stdout.write(s)
-        std_out_str += s
-    for c in iter(lambda: process.stderr.read(1), b""):
-        s = c.decode("UTF-8", "ignore")
-        std_err_str += s
-    return process, std_out_str, std_err_str
+    result = run_command(cmnd)
+    process = subprocess.CompletedProcess(cmnd, result.returncode)
+    return process, result.stdout, result.stderr
 
 
 def execute_python(script):
     return execute_command([sys.executable, "-c" + script])
 
 
+@instrument(
+    "package",
+    exclude=(
+        "get_source_path",
+        "get_mod_path",
+        "get_import_name",
+        "touch",
+        "built",
+        "report",
+        "protect",
+    ),
+)
 class Package:
     def __init__(self, path, pkg_data):
-        from git import Repo, Actor
+        from .manifest import Manifest
 
-        self.repo = Repo(path)
         self.data = pkg_data
         self.package_name = pkg_data["pkg_name"]
         self.name = pkg_data["name"]
         self.astro_version = pkg_data["astro_version"]
         self.glia_version = pkg_data["glia_version"]
-        self.author = Actor(pkg_data["author"], pkg_data["email"])
+        self._repo = None
+        self._vcs = None
+        self._init_file = None
+        self._init_cache = None
+        self._touched = set()
+        self._batch = None
+        # Record commits in `.astro/pending` instead, for `astro commit` to make.
+        self.defer_commits = bool(os.getenv("ASTRO_NO_COMMIT"))
+        # Progress messages are printed, or collected in this list if it's set.
+        self.messages = None
         self.set_path(path)
+        self.manifest = Manifest(self)
+        self._lock = None
+        self._ignoring = False
+        self.journal = Journal(self.path)
+
+    @property
+    def repo(self):
+        # GitPython is only imported by commands that use git.
+        if self._repo is None:
+            from git import Repo
+
+            self._repo = Repo(self.path)
+        return self._repo
+
+    @property
+    def vcs(self):
+        """
+            Version control backend of the package, see :mod:`.vcs`.
+        """
+        if self._vcs is None:
+            from .vcs import get_backend, get_backend_name
+
+            self._vcs = get_backend(self.path, get_backend_name(self.data))
+        return self._vcs
+
+    @property
+    def author(self):
+        from git import Actor
+
+        return Actor(self.data["author"], self.data["email"])
 
     def __str__(self):
         return self.package_name + " v" + self.version
 
+    def report(self, *args):
+        """
+            Print a progress message, or add it to :attr:`messages` if it's a list.
+        """
+        if self.messages is None:
+            print(*args)
+        else:
+            self.messages.append(" ".join(str(arg) for arg in args))
+
+    def _echo(self, echo):
+        # The output of commands is only echoed when messages are printed.
+        return echo if self.messages is None else None
+
     def add_mod_file(self, file, name=None, variant="0"):
-        if not os.path.exists(file):
-            raise AstroError("Mod file not found.")
+        with self.lock():
+            if not os.path.exists(file):
+                raise AstroError("Mod file not found.")
+            og_name = get_mod_name_from_path(file)
+            mod_name = self.get_import_name(file, name=name, variant=variant)
+            if name is None and og_name != mod_name:
+                self.report(
+                    "Mod filename changed from '{}' to '{}'".format(og_name, mod_name)
+                )
+            self.import_mod_file(file, self.get_mod_path(mod_name + ".mod"), mod_name)
+            self.commit("Added " + mod_name)
+
+    def add_mod_files(self, sources, variant="0", workers=1):
+        """
+            Import many mod files at once. The sources can be paths to mod files,
+            directories, glob patterns, ``@listfile`` references, archives or git
+            repositories, see :mod:`.archive`. The files are sanitized,
+            ``__init__.py`` is written once and a single commit is made.
+            Files that can't be imported are reported and don't abort the batch.
+
+            :returns: The outcome of each file.
+            :rtype: :class:`ImportReport`
+        """
+        with self.lock():
+            from .archive import Member
+
+            report = ImportReport()
+            # The labels and paths of the imported files, to report duplicates. The
+            # contents of archive members are only kept until they're imported.
+            labels, paths, pending, futures = {}, {}, [], {}
+            if workers > 1:
+                from concurrent.futures import ProcessPoolExecutor as Executor
+            else:
+                from concurrent.futures import ThreadPoolExecutor as Executor
+            with Executor(max_workers=max(workers, 1)) as executor:
+
+                def submit():
+                    # Protected per chunk: the journal is rewritten each time it grows.
+                    self.protect(
+                        *(self.get_mod_path(name + ".mod") for name, _ in pending)
+                    )
+                    for name, file in pending:
+                        futures[name] = executor.submit(
+                            _import_mod_job, file, self.get_mod_path(name + ".mod"), name
+                        )
+                    pending.clear()
+
+                for source, file in expand_mod_sources(sources):
+                    if file is None:
+                        report.fail(source, "No mod files found.")
+                        continue
+                    if isinstance(file, AstroError):
+                        report.fail(source, str(file))
+                        continue
+                    try:
+                        # Members are named after their path inside of the archive.
+                        path = file.name if isinstance(file, Member) else file
+                        mod_name = self.get_import_name(path, variant=variant)
+                    except AstroError as e:
+                        report.fail(str(file), str(e))
+                        continue
+                    if mod_name in labels:
+                        if _is_same_file(file, paths[mod_name]):
+                            continue
+                        report.fail(
+                            str(file), "Duplicate of '{}'.".format(labels[mod_name])
+                        )
+                        continue
+                    labels[mod_name] = str(file)
+                    paths[mod_name] = None if isinstance(file, Member) else file
+                    pending.append((mod_name, file))
+                    if len(pending) >= _IMPORT_CHUNK:
+                        submit()
+                if pending:
+                    submit()
+            with self.transaction():
+                for name, future in futures.items():
+                    try:
+                        Mod(self, name, scan=future.result())
+                    except (OSError, UnicodeDecodeError) as e:
+                        report.fail(labels[name], str(e))
+                    else:
+                        self.touch(self.get_mod_path(name + ".mod"))
+                        report.succeed(labels[name], name)
+            if report.imported:
+                self.commit(
+                    "Added {} mod files\n\n".format(len(report.imported))
+                    + "\n".join(name for _, name in report.imported)
+                )
+            return report
+
+    def get_import_name(self, file, name=None, variant="0"):
+        """
+            Return the namespaced name a mod file will have once imported.
+        """
         extension = os.path.splitext(file)[1]
         if extension != ".mod":
             raise AstroError("This is not a mod file.")
         if name is not None:
-            mod_name = "glia__" + self.name + "__" + name + "__" + variant
-        else:
-            mod_name = get_mod_name_from_path(file)
-            og_name = mod_name
-            if mod_name.startswith("glia__"):
-                if len(mod_name.split("__")) != 4:
-                    raise AstroError(
-                        "Mod files cannot contain double underscores unless the filename follows the Glia naming convention."
-                    )
-                pkg_name, asset, variant = parse_asset_name(mod_name)
-                mod_name = "glia__{}__{}__{}".format(self.name, asset, variant)
-            else:
-                mod_name = "glia__" + self.name + "__" + mod_name + "__" + variant
-            if og_name != mod_name:
-                print("Mod filename changed from '{}' to '{}'".format(og_name, mod_name))
-        self.import_mod_file(
-            file, os.path.join(self.path, self.name, "mod", mod_name + ".mod"), mod_name
-        )
-        self.commit("Added " + mod_name)
+            return "glia__" + self.name + "__" + name + "__" + variant
+        mod_name = get_mod_name_from_path(file)
+        if mod_name.startswith("glia__"):
+            if len(mod_name.split("__")) != 4:
+                raise AstroError(
+                    "Mod files cannot contain double underscores unless the filename follows the Glia naming convention."
+                )
+            pkg_name, asset, variant = parse_asset_name(mod_name)
+            return "glia__{}__{}__{}".format(self.name, asset, variant)
+        return "glia__" + self.name + "__" + mod_name + "__" + variant
 
     def import_mod_file(self, origin, destination, name):
-        from shutil import copy2
+        with self.transaction():
+            self.protect(destination)
+            scan = _import_mod_job(origin, destination, name)
+            self.touch(destination)
+            return Mod(self, name, scan=scan)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+            Context manager that groups all Writer operations inside of it into a
+            single atomic write of ``__init__.py`` when the outermost transaction
+            exits. Nothing is written if an error occurs.
 
-        copy2(origin, destination)
-        mod = Mod(self, name)
-        mod.sanitize_mod_file()
-        return mod
+            :returns: The in-memory model of the ``__init__.py`` file.
+            :rtype: :class:`InitFile`
+        """
+        if self._init_file is not None:
+            # Nested transactions join the outermost transaction.
+            yield self._init_file
+            return
+        with self.lock():
+            path = self.get_source_path("__init__.py")
+            cached = self._init_cache
+            self._init_cache = None
+            if cached is not None and cached[0] == _stat_key(path):
+                # Long-lived packages, such as those of `astro serve`, reuse the parsed
+                # file while nothing else wrote to it.
+                self._init_file = cached[1]
+            else:
+                self._init_file = InitFile(path)
+            try:
+                yield self._init_file
+                if self._init_file.dirty:
+                    self.protect(path)
+                    self._init_file.flush()
+                    self.touch(path)
+                self.manifest.save()
+                self._init_cache = (_stat_key(path), self._init_file)
+            finally:
+                self._init_file = None
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+            Context manager that holds the lock of the package, see :mod:`.journal`.
+            The outermost lock first recovers the package from an interrupted
+            operation, and rolls back the files changed inside of it if an error
+            occurs.
+        """
+        if self._lock is None:
+            lock_path = os.path.join(self.path, ".astro", "lock")
+            self._lock = PackageLock(lock_path)
+        outermost = self._lock.acquire(on_wait=self._report_wait)
+        try:
+            if outermost:
+                self.ignore_local_files()
+                self._recover()
+                # Other processes may have changed the package since it was loaded.
+                self.manifest.expire()
+            try:
+                yield
+            except BaseException:
+                if outermost and self.journal.rollback():
+                    self._reload()
+                raise
+            if outermost:
+                self.journal.discard()
+        finally:
+            self._lock.release()
+
+    def _report_wait(self):
+        self.report("Waiting for another process to release", self.package_name)
+
+    def _recover(self):
+        state = self.journal.read()
+        if state is None:
+            return
+        if "commit" in state:
+            commit = state["commit"]
+            self.vcs.commit(
+                commit["paths"],
+                commit["message"],
+                self.data["author"],
+                self.data["email"],
+            )
+            self.report("Made the commit of an interrupted operation.")
+        else:
+            self.journal.rollback(state["restore"])
+            self.report("Rolled back an interrupted operation.")
+        self.journal.discard()
+        self._reload()
+
+    def _reload(self):
+        # Forget what was read from files that were restored.
+        self._init_cache = None
+        self.version = read_version(self.get_source_path("__init__.py"))
+        self.manifest.expire()
+
+    def protect(self, *paths):
+        """
+            Record the files that the current operation is about to change in the
+            journal, so that they can be restored if it's interrupted.
+        """
+        with self.lock():
+            self.journal.protect(paths)
+
+    @contextlib.contextmanager
+    def batch(self, message=None):
+        """
+            Context manager that turns all commits inside of it into a single commit
+            when the outermost batch exits. Only the paths Astrocyte touched are
+            staged. Nothing is committed if an error occurs.
+
+            :param message: Message of the commit, by default the messages of the
+              commits inside the batch.
+        """
+        if self._batch is not None:
+            yield
+            return
+        with self.lock():
+            self._batch = []
+            try:
+                yield
+                messages = self._batch
+            finally:
+                self._batch = None
+            if messages:
+                if message is None and len(messages) == 1:
+                    message = messages[0]
+                elif message is None:
+                    message = "{} changes\n\n".format(len(messages)) + "\n".join(messages)
+                else:
+                    message = message + "\n\n" + "\n".join(messages)
+                self.commit(message)
+
+    def touch(self, *paths):
+        """
+            Record files that Astrocyte created, modified or removed, to be staged by
+            the next commit.
+        """
+        self._touched.update(os.path.abspath(path) for path in paths)
 
     def edit_asset(self, mod_part, name=None, variant=None):
-        candidates = self.find_mod_candidate(mod_part)
-        mod = Mod(self, candidates[0])
-        mod.set_names(name=name, variant=variant)
+        with self.lock():
+            candidates = self.find_mod_candidate(mod_part)
+            mod = Mod(self, candidates[0])
+            return mod.set_names(name=name, variant=variant)
+
+    def edit_assets(self, pattern, name=None, variant=None, regex=False, dry_run=False):
+        """
+            Rename, or change the variant of, every asset that matches ``pattern``.
+            All renames are planned and checked for collisions before anything is
+            changed, then the files are moved, ``__init__.py`` is written once and a
+            single commit is made.
+
+            :param pattern: Glob pattern that is part of the namespaced names, or with
+              ``regex`` a regular expression that is searched for in them.
+            :param name: New asset name. With ``regex`` it's a template that can refer
+              to the groups of the match, such as ``\\1`` or ``\\g<name>``.
+            :param variant: New variant, a template like ``name``.
+            :param dry_run: Only plan the renames.
+            :returns: Pairs of the old and new namespaced name of the renamed assets.
+            :rtype: list
+        """
+        with self.lock():
+            renames = self.plan_renames(pattern, name=name, variant=variant, regex=regex)
+            if dry_run or not renames:
+                return renames
+            paths = []
+            for old, new in renames:
+                old_path = self.get_mod_path(old + ".mod")
+                paths.append(
+                    (old_path, old_path + ".rename", self.get_mod_path(new + ".mod"))
+                )
+            self.protect(*(path for group in paths for path in group))
+            with self.transaction():
+                mods = [Mod(self, old) for old, _ in renames]
+                # Move through an intermediate name first, so that assets can take
+                # over each other's names.
+                for mod, (old, _), (old_path, tmp_path, _) in zip(mods, renames, paths):
+                    os.rename(old_path, tmp_path)
+                    mod.writer.rename(old, old + ".rename")
+                    self.manifest.forget(old)
+                for mod, (old, new), (old_path, tmp_path, new_path) in zip(
+                    mods, renames, paths
+                ):
+                    os.rename(tmp_path, new_path)
+                    self.touch(old_path, new_path)
+                    mod.writer.rename(old + ".rename", new)
+                    _, mod.asset_name, mod.variant = parse_asset_name(new)
+                    mod.writer.update()
+                    mod.sanitize_mod_file()
+            changes = [
+                "{}.{} to {}.{}".format(
+                    *parse_asset_name(old)[1:], *parse_asset_name(new)[1:]
+                )
+                for old, new in renames
+            ]
+            if len(changes) == 1:
+                self.commit("Renamed " + changes[0])
+            else:
+                self.commit(
+                    "Renamed {} assets\n\n".format(len(changes)) + "\n".join(changes)
+                )
+            return renames
+
+    def plan_renames(self, pattern, name=None, variant=None, regex=False):
+        """
+            Return the renames of :meth:`edit_assets`, without changing anything.
+
+            :raises: :class:`~.exceptions.NameCollisionError` if assets would end up
+              with the same name.
+        """
+        if regex:
+            try:
+                expr = re.compile(pattern)
+            except re.error as e:
+                raise AstroError("Invalid regular expression: {}".format(e)) from None
+            matches = [(n, expr.search(n)) for n in self.manifest.names()]
+            matches = [(n, match) for n, match in matches if match]
+        else:
+            matches = [(n, None) for n in self.get_mod_candidates(pattern)]
+        if not matches:
+            raise AstroError("No assets found matching '{}'".format(pattern))
+        renames = []
+        for old, match in matches:
+            _, old_asset, old_variant = parse_asset_name(old)
+            new_asset = _expand_name_part(match, name) or old_asset
+            new_variant = _expand_name_part(match, variant) or old_variant
+            new = get_asset_name("glia__" + self.name, new_asset, new_variant)
+            if new != old:
+                renames.append((old, new))
+        sources = set(old for old, _ in renames)
+        targets = {}
+        for old, new in renames:
+            targets.setdefault(new, []).append(old)
+        collisions = [
+            "{} <- {}".format(new, ", ".join(olds))
+            for new, olds in sorted(targets.items())
+            if len(olds) > 1 or (new not in sources and self.manifest.get(new))
+        ]
+        if collisions:
+            raise NameCollisionError(
+                "The renames would give assets the same name:\n" + "\n".join(collisions)
+            )
+        return renames
 
     def remove_mod_file(self, mod_filename):
-        candidates = self.get_mod_candidates(mod_filename)
-        if len(candidates) != 1:
-            raise multiple_candidates_error(mod_filename, candidates)
-        mod = Mod(self, mod_filename)
-        mod.delete()
+        with self.lock():
+            candidates = self.get_mod_candidates(mod_filename)
+            if len(candidates) != 1:
+                raise multiple_candidates_error(mod_filename, candidates)
+            mod = Mod(self, mod_filename)
+            mod.delete()
 
     def set_path(self, path):
-        from importlib import reload
-
         self.path = os.path.abspath(path)
-        sys.path.insert(0, self.path)
-        # Reload module.
-        pkg_module = __import__(self.name)
-        reload(pkg_module)
-        rld = __import__(self.name, globals(), locals(), ["__version__"], 0)
-        # Get version from reloaded module
-        self.version = rld.__version__
-        sys.path.remove(self.path)
+        self.version = read_version(self.get_source_path("__init__.py"))
 
     def get_source_path(self, *args):
         return os.path.join(os.path.abspath(self.path), self.name, *args)
@@ -110,12 +495,7 @@ class Package:
         return self.get_source_path("mod", *args)
 
     def get_mod_candidates(self, mod_part):
-        return list(
-            map(
-                lambda x: get_mod_name_from_path(x),
-                find_files(self.get_mod_path("*" + mod_part + "*")),
-            )
-        )
+        return self.manifest.find("*" + mod_part + "*")
 
     def find_mod_candidate(self, mod_part):
         candidates = self.get_mod_candidates(mod_part)
@@ -125,138 +505,315 @@ class Package:
             raise multiple_candidates_error(mod_part, candidates)
         return candidates
 
-    def build(self):
-        import subprocess
+    def build(self, force=False, backend=None):
+        """
+            Build the package into a wheel. The build is skipped and the last wheel
+            is reused if the sources haven't changed since it was built, unless
+            ``force`` is given.
+
+            :param backend: ``"setuptools"`` to run ``setup.py bdist_wheel`` or
+              ``"native"`` to write the wheel directly. Defaults to the
+              ``build_backend`` of the package data, or ``"setuptools"``.
+        """
+        from .buildcache import BuildCache
+
+        with self.lock():
+            backend = backend or self.data.get("build_backend", "setuptools")
+            if backend not in ("setuptools", "native"):
+                raise BuildError("Unknown build backend '{}'.".format(backend))
+
+            cache = BuildCache(self)
+            fingerprint = cache.fingerprint()
+            if not force:
+                artifact = cache.lookup(fingerprint)
+                if artifact is not None:
+                    self.report(
+                        "Glia package", self, "is up to date:", os.path.basename(artifact)
+                    )
+                    self._built = True
+                    return
+            self.increment_version()
+            self.report("Building glia package", self)
+            self.commit("New build, incremented version")
+            if self.ships_interfaces():
+                self.write_interfaces()
+            if backend == "native":
+                from .wheel import build_wheel
+
+                build_wheel(self)
+                self._built = True
+            else:
+                from .process import run_command, echo_stdout, echo_stderr
+
+                result = run_command(
+                    [sys.executable, "setup.py", "bdist_wheel"],
+                    cwd=self.path,
+                    on_stdout=self._echo(echo_stdout),
+                    on_stderr=self._echo(echo_stderr),
+                )
+                self._built = bool(result)
+            if self._built:
+                cache.store(fingerprint, self.get_distribution())
+                self.report("Glia package built.")
 
-        cwd = os.getcwd()
-        os.chdir(self.path)
-        self.increment_version()
-        print("Building glia package", self)
-        self.commit("New build, incremented version")
-        rcode = subprocess.call([sys.executable, "setup.py", "bdist_wheel"])
-        os.chdir(cwd)
-        self._built = rcode == 0
-        if self._built:
-            print("Glia package built.")
+    def ships_interfaces(self):
+        """
+            Return whether the package ships ``mod/interfaces.json``. Packages made
+            by older versions don't include it in their ``setup.py`` nor ignore it in
+            their ``.gitignore``, so it isn't written for them.
+        """
+        for name in ("setup.py", ".gitignore"):
+            try:
+                with open(os.path.join(self.path, name), "r") as f:
+                    if "interfaces.json" not in f.read():
+                        return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    def write_interfaces(self):
+        """
+            Write the interfaces of the mod files, as scanned when they were added or
+            changed, to ``mod/interfaces.json``. The file is shipped in the wheel, so
+            that consumers can select mechanisms without parsing their mod files.
+
+            :returns: Path of the written file.
+        """
+        path = self.get_mod_path("interfaces.json")
+        index = {"version": 1, "mods": self.manifest.interfaces()}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(index, separators=(",", ":")))
+        os.replace(tmp_path, path)
+        return path
+
+    def check(self, jobs=1, compiler=None, use_cache=True):
+        """
+            Compile check all mod files of the package.
+
+            :param compiler: NMODL compiler command, see :func:`.check.get_compiler`.
+            :returns: The failed checks.
+            :rtype: list of :class:`.check.CheckResult`
+        """
+        from .check import Checker
+
+        checker = Checker(self, compiler=compiler, use_cache=use_cache)
+        results = checker.check(jobs=jobs)
+        failed = [result for result in results if not result.ok]
+        for result in failed:
+            self.report("Compilation of", result.name, "failed:")
+            self.report(result.log)
+        cached = sum(result.cached for result in results)
+        self.report(
+            "Checked {} mod files ({} cached), {} failed.".format(
+                len(results), cached, len(failed)
+            )
+        )
+        return failed
 
     def built(self):
         return hasattr(self, "_built") and self._built
 
-    def upload(self):
-        import subprocess
-
-        cwd = os.getcwd()
-        os.chdir(self.path)
-        print("Uploading glia package", self)
-        cmnd = [
-            "twine",
-            "upload",
-            "--disable-progress-bar",
-            os.path.join("dist", "*{}*".format(self.version)),
-        ]
-        process, out, err = execute_command(cmnd)
-        process.communicate()
-        process.wait()
-        os.chdir(cwd)
-        self._uploaded = process.returncode == 0
-        if not self._uploaded:
-            if err.find("InvalidDistributionError") != -1:
-                raise InvalidDistributionError(
-                    "No build files for " + str(self) + ". Use `astro build`."
-                )
-            elif err.find("Error: Use a valid email address") != -1:
-                raise InvalidMetaError("The package author email metadata is invalid.")
-            else:
-                sys.stderr.write(err)
-        else:
-            print("Uploaded glia package", self)
+    def upload(self, uploader=None, **options):
+        """
+            Upload the wheels of the current version.
+
+            :param uploader: Uploader to reuse, by default the one of this process for
+              the given options.
+            :type uploader: :class:`.upload.Uploader`
+            :param options: Options of :class:`.upload.Uploader`, such as ``username``,
+              ``password`` and ``repository_url``.
+            :returns: The uploaded paths.
+        """
+        from .upload import get_uploader
 
-    def link(self):
-        import subprocess, site
+        uploader = uploader or get_uploader(**options)
+        self.report("Uploading glia package", self)
+        paths = glob.glob(
+            os.path.join(self.path, "dist", "*-{}-*.whl".format(self.version))
+        )
+        if not paths:
+            raise InvalidDistributionError(
+                "No build files for " + str(self) + ". Use `astro build`."
+            )
+        uploaded = uploader.upload(sorted(paths), report=self.report)
+        self._uploaded = True
+        if uploaded:
+            self.report("Uploaded glia package", self)
+        return uploaded
 
-        cwd = os.getcwd()
-        os.chdir(self.path)
+    def link(self):
+        from .process import run_command, echo_stdout
 
         cmnd = [sys.executable, "-m", "pip", "install", "-e", "."]
-        process, out, err = execute_command(cmnd)
-        process.communicate()
-        self._linked = process.returncode == 0
-
-        os.chdir(cwd)
+        result = run_command(cmnd, cwd=self.path, on_stdout=self._echo(echo_stdout))
+        self._linked = bool(result)
         if not self._linked:
-            raise BuildError("Could not create egg link:" + err)
+            raise BuildError("Could not create egg link:" + result.stderr)
         else:
-            print(self, "egg linked.")
+            self.report(self, "egg linked.")
 
-    def install(self):
-        import subprocess, site
+    def install(self, backend=None):
+        """
+            Install the wheel of the current version.
 
-        site_packages = list(
-            filter(lambda s: s.find("site-packages") != -1, site.getsitepackages())
-        )
+            :param backend: ``"native"`` unpacks the wheel in-process, ``"pip"`` runs
+              pip. Defaults to the ``install_backend`` of the package data, or native.
+              Wheels the native installer can't handle are installed with pip.
+        """
         distfile = self.get_distribution()
-        old_dir = os.getcwd()
-        if len(site_packages) > 0:
-            os.chdir(site_packages[0])
-        print("Installing glia package", self)
-        cmnd = [sys.executable, "-m", "pip", "install", distfile]
-        process, out, err = execute_command(cmnd)
-        # Extra call to communicate required or subprocess freezes.
-        process.communicate()
-        process.wait()
-        os.chdir(old_dir)
-        self._installed = process.returncode == 0
-        if not self._installed:
-            raise BuildError("Could not install build:" + err)
-        elif not os.getenv("CI"):
-            print("Installed glia package", self)
-            import glia
-
-    def uninstall(self):
-        import subprocess, site
+        backend = backend or self.data.get("install_backend", "native")
+        self.report("Installing glia package", self)
+        if backend == "native":
+            from .install import Wheel, requires_pip, install_wheels
+
+            wheel = Wheel(distfile)
+            reason = requires_pip(wheel)
+            wheel.close()
+            if reason is None:
+                install_wheels([distfile])
+            else:
+                self.report("Installing with pip because", reason)
+                backend = "pip"
+        if backend == "pip":
+            from .process import run_command, echo_stdout
+
+            cmnd = [sys.executable, "-m", "pip", "install", distfile]
+            echo = self._echo(echo_stdout)
+            result = run_command(cmnd, cwd=get_site_packages(), on_stdout=echo)
+            if not result:
+                raise BuildError("Could not install build:" + result.stderr)
+        self._installed = True
+        if not os.getenv("CI"):
+            self.report("Installed glia package", self)
+            with span("import glia", "import"):
+                import glia
+
+    def uninstall(self, backend=None):
+        """
+            Uninstall the package, see :meth:`install` for the backends.
+        """
+        backend = backend or self.data.get("install_backend", "native")
+        self.report("Uninstalling glia package", self)
+        if backend == "native":
+            from .install import uninstall_distribution
 
-        site_packages = list(
-            filter(lambda s: s.find("site-packages") != -1, site.getsitepackages())
-        )
-        distfile = self.get_distribution()
-        old_dir = os.getcwd()
-        if len(site_packages) > 0:
-            os.chdir(site_packages[0])
-        print("Uninstalling glia package", self)
-        cmnd = [sys.executable, "-m", "pip", "uninstall", "-y", distfile]
-        process, out, err = execute_command(cmnd)
-        # Extra call to communicate required or subprocess freezes.
-        process.communicate()
-        process.wait()
-        os.chdir(old_dir)
-        self._installed = process.returncode != 0
-        if self._installed:
-            raise BuildError("Could not uninstall:" + err)
+            if not uninstall_distribution(self.name):
+                raise BuildError("Could not uninstall: {} is not installed.".format(self))
         else:
-            print("Uninstalled glia package", self)
+            from .process import run_command, echo_stdout
+
+            cmnd = [sys.executable, "-m", "pip", "uninstall", "-y", self.name]
+            echo = self._echo(echo_stdout)
+            result = run_command(cmnd, cwd=get_site_packages(), on_stdout=echo)
+            if not result:
+                raise BuildError("Could not uninstall:" + result.stderr)
+        self._installed = False
+        self.report("Uninstalled glia package", self)
+        with span("import glia", "import"):
             import glia
 
     def increment_version(self):
-        from time import sleep
+        from importlib.util import cache_from_source
 
         splits = self.version.split(".")
         new_version = ".".join(splits[0:-1]) + "." + str(int(splits[-1]) + 1)
         v = lambda v: '__version__ = "{}"'.format(v)
-        with open(self.get_source_path("__init__.py"), "r") as file:
+        init_path = self.get_source_path("__init__.py")
+        with open(init_path, "r") as file:
             content = file.read().replace(v(self.version), v(new_version))
-        with open(self.get_source_path("__init__.py"), "w") as file:
+        self.protect(init_path)
+        tmp_path = init_path + ".tmp"
+        with open(tmp_path, "w") as file:
             file.write(content)
-            self.version = new_version
-            sleep(0.5)
+        os.replace(tmp_path, init_path)
+        self.version = new_version
+        self._init_cache = None
+        self.touch(init_path)
+        # The bytecode cache can't tell versions of equal length apart when they're
+        # written within the same second, so remove it for `setup.py` to see the change.
+        try:
+            os.remove(cache_from_source(init_path))
+        except FileNotFoundError:
+            pass
 
     def commit(self, message):
-        # Add modified files to commit
-        self.repo.git.add(update=True)
-        index = self.repo.index
-        # Add new files to commit
-        index.add(self.repo.untracked_files)
-        # Make commit
-        index.commit(message, author=self.author, committer=self.author)
+        """
+            Commit the touched files. Inside of a :meth:`batch` the commit is made when
+            the batch exits, and with :attr:`defer_commits` it is left for
+            :meth:`commit_pending`.
+        """
+        if self._batch is not None:
+            self._batch.append(message)
+            return
+        with self.lock():
+            paths = self._get_touched_paths()
+            if self.defer_commits:
+                return self._defer_commit(paths, message)
+            self.journal.commit(paths, message)
+            self.vcs.commit(paths, message, self.data["author"], self.data["email"])
+            self.journal.discard()
+
+    def commit_pending(self, message=None):
+        """
+            Make a single commit of the commits deferred to ``.astro/pending``.
+
+            :returns: Whether there was anything to commit.
+        """
+        with self.lock():
+            pending_file = os.path.join(self.path, ".astro", "pending")
+            try:
+                with open(pending_file, "r") as f:
+                    pending = json.load(f)
+            except FileNotFoundError:
+                return False
+            messages = pending["messages"]
+            if message is None and len(messages) == 1:
+                message = messages[0]
+            elif message is None:
+                message = "{} changes\n\n".format(len(messages)) + "\n".join(messages)
+            paths = set(pending["paths"]) | self._get_touched_paths()
+            self.vcs.commit(paths, message, self.data["author"], self.data["email"])
+            os.remove(pending_file)
+            return True
+
+    def _get_touched_paths(self):
+        # Paths relative to the package.
+        touched = {os.path.relpath(path, self.path) for path in self._touched}
+        self._touched = set()
+        return touched
+
+    def ignore_local_files(self):
+        """
+            Make sure that version control ignores the local state in ``.astro``.
+            The ignore file of packages made by older versions is replaced and
+            committed on its own, so that it isn't left changed by operations that
+            don't commit.
+        """
+        if self._ignoring:
+            return
+        if write_astro_ignore_file(self.path):
+            path = os.path.join(".astro", ".gitignore")
+            message = "Ignored the local files of Astrocyte"
+            if self.defer_commits:
+                self._defer_commit({path}, message)
+            else:
+                self.vcs.commit([path], message, self.data["author"], self.data["email"])
+        self._ignoring = True
+
+    def _defer_commit(self, paths, message):
+        pending_file = os.path.join(self.path, ".astro", "pending")
+        try:
+            with open(pending_file, "r") as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            pending = {"paths": [], "messages": []}
+        pending["paths"] = sorted(set(pending["paths"]) | paths)
+        pending["messages"].append(message)
+        tmp_path = pending_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(pending, f)
+        os.replace(tmp_path, pending_file)
 
     def get_distribution(self):
         try:
@@ -269,6 +826,83 @@ class Package:
             )
 
 
+def _stat_key(path):
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+_version_cache = {}
+_version_pattern = re.compile(r"^__version__\s*=\s*[\"']([^\"']*)[\"']", re.MULTILINE)
+
+
+def read_version(path):
+    """
+        Read ``__version__`` from a Python file without importing it. The result is
+        cached against the mtime and size of the file.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _version_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, "r") as file:
+        source = file.read()
+    match = _version_pattern.search(source)
+    if match:
+        version = match.group(1)
+    else:
+        # Fall back to the syntax tree for unusual assignments.
+        import ast
+
+        version = None
+        for node in ast.parse(source).body:
+            if isinstance(node, ast.Assign) and any(
+                getattr(t, "id", None) == "__version__" for t in node.targets
+            ):
+                try:
+                    version = str(ast.literal_eval(node.value))
+                except ValueError:
+                    pass
+        if version is None:
+            raise StructureError("No `__version__` found in " + path)
+    _version_cache[path] = (key, version)
+    return version
+
+
+def get_site_packages():
+    """
+        Return the first site-packages directory, or ``None`` if there is none.
+    """
+    import site
+
+    site_packages = list(
+        filter(lambda s: s.find("site-packages") != -1, site.getsitepackages())
+    )
+    return site_packages[0] if site_packages else None
+
+
+def write_astro_ignore_file(path):
+    """
+        Write the ignore file of the ``.astro`` folder of the package at ``path``, which
+        ignores everything but the package data, unless it's already there.
+
+        :returns: Whether the file was written.
+    """
+    from .templates import parse_template
+
+    ignore_file = os.path.join(path, ".astro", ".gitignore")
+    content = parse_template("_astro_gitignore")
+    try:
+        with open(ignore_file, "r") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(ignore_file, "w") as f:
+        f.write(content)
+    return True
+
+
 def get_package(path=None):
     path = path or os.getcwd()
     try:
@@ -280,14 +914,32 @@ def get_package(path=None):
     return pkg
 
 
+@instrument(
+    "mod",
+    exclude=(
+        "get_full_name",
+        "get_writername",
+        "get_name_statement",
+        "get_mod_file",
+        "is_point_process",
+        "is_artificial_cell",
+    ),
+)
 class Mod:
-    def __init__(self, pkg, namespaced_name):
+    def __init__(self, pkg, namespaced_name, scan=None):
         self.pkg = pkg
         self.pkg_name = pkg.name
         splits = namespaced_name.split("__")
         self.asset_name = "__".join(splits[2:-1])
         self.variant = splits[-1]
         self.namespace = "__".join(splits[:2])
+        # Single read of the mod file, unless the caller already scanned it.
+        if scan is None:
+            scan = nmodl.scan_file(self.get_mod_file())
+        else:
+            # The caller wrote the file from this scan.
+            pkg.manifest.record(namespaced_name, scan)
+        self.scan = scan
         self._is_point_process = self.is_point_process()
         self._is_artificial_cell = self.is_artificial_cell()
         self._name_statement = self.get_name_statement()
@@ -295,8 +947,12 @@ class Mod:
         self.writer.update()
 
     def delete(self):
-        self.writer.remove()
-        os.remove(self.get_mod_file())
+        with self.pkg.lock():
+            self.pkg.protect(self.get_mod_file())
+            self.writer.remove()
+            os.remove(self.get_mod_file())
+            self.pkg.touch(self.get_mod_file())
+            self.pkg.manifest.forget(self.get_full_name())
 
     def get_full_name(self):
         return get_asset_name(self.namespace, self.asset_name, self.variant)
@@ -315,27 +971,34 @@ class Mod:
     def set_names(self, name=None, variant=None):
         """
             Change this Mod's names. Updates the mod file and __init__.py
+
+            :returns: The new namespaced name.
         """
-        old_asset_name = self.asset_name
-        old_variant = self.variant
-        new_asset_name = name or self.asset_name
-        new_variant = variant or self.variant
-        old_name = self.get_full_name()
-        new_name = get_asset_name(self.namespace, new_asset_name, new_variant)
-        os.rename(
-            self.pkg.get_mod_path(old_name) + ".mod",
-            self.pkg.get_mod_path(new_name) + ".mod",
-        )
-        self.writer.replace(old_name, new_name)
-        self.asset_name = new_asset_name
-        self.variant = new_variant
-        self.writer.update()
-        self.sanitize_mod_file()
-        self.pkg.commit(
-            "Renamed {} to {}".format(
-                old_asset_name + "." + old_variant, new_asset_name + "." + new_variant
+        with self.pkg.lock():
+            old_asset_name = self.asset_name
+            old_variant = self.variant
+            new_asset_name = name or self.asset_name
+            new_variant = variant or self.variant
+            old_name = self.get_full_name()
+            new_name = get_asset_name(self.namespace, new_asset_name, new_variant)
+            old_path = self.pkg.get_mod_path(old_name) + ".mod"
+            new_path = self.pkg.get_mod_path(new_name) + ".mod"
+            self.pkg.protect(old_path, new_path)
+            os.rename(old_path, new_path)
+            self.pkg.touch(old_path, new_path)
+            with self.pkg.transaction():
+                self.writer.rename(old_name, new_name)
+                self.asset_name = new_asset_name
+                self.variant = new_variant
+                self.writer.update()
+                self.pkg.manifest.forget(old_name)
+                self.sanitize_mod_file()
+            self.pkg.commit(
+                "Renamed {} to {}".format(
+                    old_asset_name + "." + old_variant, new_asset_name + "." + new_variant
+                )
             )
-        )
+            return new_name
 
     def get_mod_file(self):
         """
@@ -344,47 +1007,69 @@ class Mod:
         return self.pkg.get_mod_path(self.get_full_name()) + ".mod"
 
     def sanitize_mod_file(self):
-        # Read the mod file.
-        with open(self.get_mod_file(), "r") as f:
-            lines = f.readlines()
-        inserts = []
-        # Define the statement that needs to be replaced with the new name
-        # For a mechanism that's "SUFFIX <name>"
-        # For a point_process it's "POINT_PROCESS <name>"
-        name_statement = self._name_statement
-        # Iterate over all lines to find name statements and the correct position
-        # to insert our new name statement (as the first line of the NEURON block)
-        for i, l in enumerate(lines):
-            # Remove all previous name statements
-            if l.lower().strip().startswith(name_statement.lower()):
-                lines.remove(l)
-            if l.replace("{", "").lower().strip() == "neuron":
-                # Add the name statement to be inserted.
-                inserts.append(
-                    (i + 1, name_statement + " " + self.get_full_name() + "\n")
-                )
-        # Inser the new statements
-        for i, l in enumerate(inserts):
-            lines.insert(i + l[0], l[1])
+        lines = self.scan.rename(self.get_full_name(), self._name_statement)
         # Write the new mod file.
-        with open(self.get_mod_file(), "w") as f:
+        self.pkg.protect(self.get_mod_file())
+        tmp_path = self.get_mod_file() + ".tmp"
+        with open(tmp_path, "w") as f:
             f.writelines(lines)
+        os.replace(tmp_path, self.get_mod_file())
+        self.pkg.touch(self.get_mod_file())
+        self.scan = nmodl.scan(lines)
+        self.pkg.manifest.record(self.get_full_name(), self.scan)
 
     def is_point_process(self):
-        with open(self.get_mod_file(), "r") as f:
-            lines = f.readlines()
-        for line in lines:
-            if line.strip().lower().startswith("point_process"):
-                return True
-        return False
+        return self.scan.kind == "POINT_PROCESS"
 
     def is_artificial_cell(self):
-        with open(self.get_mod_file(), "r") as f:
-            lines = f.readlines()
-        for line in lines:
-            if line.strip().lower().startswith("artificial_cell"):
-                return True
+        return self.scan.kind == "ARTIFICIAL_CELL"
+
+
+def _import_mod_job(origin, destination, name):
+    # Module level so that it can be sent to worker processes.
+    from .archive import Member
+
+    if isinstance(origin, Member):
+        scan = nmodl.scan(origin.readlines())
+    else:
+        scan = nmodl.scan_file(origin)
+    lines = scan.rename(name)
+    tmp_path = destination + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, destination)
+    return nmodl.scan(lines)
+
+
+# Number of mod files that are protected and submitted for import at a time.
+_IMPORT_CHUNK = 256
+
+
+def _is_same_file(file, other):
+    # Archive members are never the same file as another source.
+    if not isinstance(file, str) or not isinstance(other, str):
         return False
+    return os.path.samefile(file, other)
+
+
+class ImportReport:
+    """
+        Outcome of a bulk import: which files were imported under which name, and
+        which files failed and why.
+    """
+
+    def __init__(self):
+        self.imported = []
+        self.failed = []
+
+    def succeed(self, source, name):
+        self.imported.append((source, name))
+
+    def fail(self, source, reason):
+        self.failed.append((source, reason))
+
+    def __bool__(self):
+        return not self.failed
 
 
 def get_glia_version():
@@ -397,9 +1082,31 @@ def get_minimum_glia_version():
     return get_glia_version()
 
 
+@instrument(
+    "writer",
+    exclude=(
+        "get_init_path",
+        "get_tagline",
+        "get_endline",
+        "header",
+        "content",
+        "footer",
+        "line",
+        "property_line",
+        "row",
+    ),
+)
 class Writer:
-    exclude = ["pkg", "writer"]
+    """
+        Writes the generated entry of an object into the package ``__init__.py``: a row
+        of its asset table, or a block of statements in packages created before the
+        table. All operations are applied to the :class:`InitFile` of the package's
+        current transaction, or to a transaction of their own if none is active.
+    """
+
+    exclude = ["pkg", "writer", "scan"]
     repr_types = [int, bool, str]
+    columns = ["asset_name", "variant", "_name_statement"]
 
     def __init__(self, obj):
         self.obj = obj
@@ -411,66 +1118,12 @@ class Writer:
     def update(self):
         if self.removed:
             return
-        init_file = open(self.get_init_path(), "r")
-        self.read = init_file.readlines()
-        init_file.close()
-        if not self.in_it():
-            self.insert()
-        else:
-            content, roi = self.read_block()
-            fresh = {}
-            for k, v in self.obj.__dict__.items():
-                if not k in self.__class__.exclude:
-                    line = self.property_line(k, v, self.indent)
-                    if k in content:
-                        # Replace existing content line, mark it as used
-                        self.read[content[k][0]] = line
-                        fresh[k] = True
-                    else:
-                        # Add a new content line before the end
-                        self.read[(roi[1] - 2) : (roi[1] - 2)] = [line]
-                        roi = tuple([roi[0], roi[1] + 1])
-            for key, line in sorted(content.items(), key=lambda x: x[1][0], reverse=True):
-                if not key in fresh:
-                    del self.read[line[0]]
-            self.write()
+        with self.obj.pkg.transaction() as init_file:
+            init_file.update(self)
 
     def in_it(self):
-        return self.find_tagline() > -1
-
-    def find_tagline(self, find_end=False):
-        tagline = self.get_tagline()
-        endline = self.get_endline()
-        start = -1
-        for i, l in enumerate(self.read):
-            if l.strip() == tagline:
-                self.indent = len(l) - len(l.lstrip(" "))
-                if not find_end:
-                    return i
-                else:
-                    start = i
-            if start != -1 and l.strip() == endline:
-                return start, i
-        return -1
-
-    def read_block(self):
-        start_i, end_i = self.find_tagline(find_end=True)
-        roi = range(start_i, end_i)
-        values = {}
-        for i in roi:
-            line = self.read[i].strip()
-            if (
-                line.startswith("#")
-                or line.startswith("pkg")
-                or line.endswith("= Mod()")
-                or line.endswith("= pkg")
-            ):
-                continue
-            assignee, evaluee = tuple(line.split("="))
-            evaluee = eval(evaluee)
-            assignee = ".".join(assignee.split(".")[1:]).strip()
-            values[assignee] = (i, evaluee)
-        return values, (start_i, end_i)
+        with self.obj.pkg.transaction() as init_file:
+            return self.get_tagline() in init_file
 
     def get_tagline(self):
         return "#-" + self.obj.get_writername()
@@ -479,19 +1132,21 @@ class Writer:
         return "#-##"
 
     def insert(self):
-        i, indent = self.find_line("return pkg", return_indent=True)
-        self.indent = indent
-        self.read[i:i] = self.footer(indent)
-        self.read[i:i] = self.content(indent)
-        self.read[i:i] = self.header(indent)
-        self.write()
+        with self.obj.pkg.transaction() as init_file:
+            init_file.insert(self)
 
     def remove(self):
-        start_line, end_line = self.find_tagline(find_end=True)
-        del self.read[(start_line - 1) : (end_line + 1)]
-        self.write()
+        with self.obj.pkg.transaction() as init_file:
+            init_file.remove(self.get_tagline())
         self.removed = True
 
+    def rename(self, old_name, new_name):
+        """
+            Rename the block of this writer's object from the old to the new full name.
+        """
+        with self.obj.pkg.transaction() as init_file:
+            init_file.rename("#-mod_" + old_name, "#-mod_" + new_name, old_name, new_name)
+
     def header(self, indent=0):
         return [
             self.line("#-Generated by Astrocyte v{}".format(__version__), indent),
@@ -520,6 +1175,10 @@ class Writer:
     def line(self, msg, indent=0):
         return (" " * indent) + msg + "\n"
 
+    def row(self, indent=0):
+        values = ", ".join(repr(getattr(self.obj, k)) for k in self.__class__.columns)
+        return self.line("({}),  {}".format(values, self.get_tagline()), indent)
+
     def property_line(self, k, v, indent):
         if type(v) in self.__class__.repr_types:
             return self.line(
@@ -527,27 +1186,236 @@ class Writer:
             )
         raise Exception("Unknown property type {} for {}".format(type(v).__name__, k))
 
-    def find_line(self, line, return_indent=False):
-        for i, l in enumerate(self.read):
-            if l.strip() == line:
-                if return_indent:
-                    return i, len(l) - len(l.lstrip(" "))
-                else:
-                    return i
-        raise StructureError("__init__.py structure compromised.")
+    def replace(self, old, new):
+        with self.obj.pkg.transaction() as init_file:
+            init_file.replace(old, new)
 
-    def write(self):
-        init_file = open(self.get_init_path(), "w")
-        init_file.writelines(self.read)
-        init_file.close()
+
+class _Block:
+    def __init__(self, tagline, lines, indent):
+        self.tagline = tagline
+        self.lines = lines
+        self.indent = indent
+        self.removed = False
+
+
+@instrument("writer", exclude=("taglines",))
+class InitFile:
+    """
+        In-memory model of a package ``__init__.py``. The file is parsed once into raw
+        lines and the generated entries, after which any amount of inserts, updates,
+        renames and removals can be applied without touching the disk. :meth:`flush`
+        writes the result in a single atomic write.
+
+        Entries are the rows of the asset table (``#-table`` up to ``#-##``), which the
+        package loads lazily, or in packages created before the table, blocks of
+        statements (``#-mod_...`` up to ``#-##``) that run when the package is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "r") as init_file:
+            lines = init_file.readlines()
+        self._segments = []
+        self._blocks = {}
+        self._inserted = []
+        self._insert_at = None
+        self._insert_indent = 0
+        self.table = False
+        self.dirty = False
+        self._parse(lines)
+
+    def _parse(self, lines):
+        raw = []
+        block = None
+        in_table = False
+        table_at = return_at = None
+        for line in lines:
+            stripped = line.strip()
+            if in_table:
+                if stripped == ")":
+                    # New rows are appended at the end of the table.
+                    self._segments.append(raw)
+                    table_at = len(self._segments)
+                    self._insert_indent = len(line) - len(line.lstrip(" ")) + 2
+                    raw = []
+                    in_table = False
+                elif "  #-" in line:
+                    tagline = "#-" + line.rpartition("  #-")[2].strip()
+                    indent = len(line) - len(line.lstrip(" "))
+                    row = _Block(tagline, [line], indent)
+                    self._segments.append(raw)
+                    self._segments.append(row)
+                    self._blocks[tagline] = row
+                    raw = []
+                    continue
+                raw.append(line)
+                continue
+            if stripped.startswith("#-table"):
+                self.table = in_table = True
+                raw.append(line)
+                continue
+            if block is not None:
+                block.lines.append(line)
+                if stripped == "#-##":
+                    block = None
+                continue
+            if stripped.startswith("#-") and stripped != "#-##":
+                if not stripped.startswith("#-Generated"):
+                    indent = len(line) - len(line.lstrip(" "))
+                    block = _Block(stripped, [line], indent)
+                    # The "Generated by" line preceding the tagline is part of the block.
+                    if raw and raw[-1].strip().startswith("#-Generated"):
+                        block.lines.insert(0, raw.pop())
+                    self._segments.append(raw)
+                    self._segments.append(block)
+                    self._blocks[stripped] = block
+                    raw = []
+                    continue
+            if stripped == "return pkg" and return_at is None:
+                # Without a table, new blocks are inserted before `return pkg`.
+                self._segments.append(raw)
+                return_at = len(self._segments)
+                if not self.table:
+                    self._insert_indent = len(line) - len(line.lstrip(" "))
+                raw = []
+            raw.append(line)
+        self._segments.append(raw)
+        self._insert_at = table_at if self.table else return_at
+        if self._insert_at is not None:
+            self._segments.insert(self._insert_at, self._inserted)
+
+    def __contains__(self, tagline):
+        return tagline in self._blocks
+
+    def taglines(self):
+        return list(self._blocks)
+
+    def insert(self, writer):
+        if self._insert_at is None:
+            raise StructureError("__init__.py structure compromised.")
+        indent = self._insert_indent
+        if self.table:
+            lines = [writer.row(indent)]
+        else:
+            lines = writer.header(indent) + writer.content(indent) + writer.footer(indent)
+        block = _Block(writer.get_tagline(), lines, indent)
+        self._blocks[block.tagline] = block
+        self._inserted.append(block)
+        self.dirty = True
+
+    def update(self, writer):
+        block = self._blocks.get(writer.get_tagline())
+        if block is None:
+            return self.insert(writer)
+        if self.table:
+            block.lines = [writer.row(block.indent)]
+            self.dirty = True
+            return
+        lines = block.lines
+        content = {}
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if (
+                line.startswith("#")
+                or line.startswith("pkg")
+                or line.endswith("= Mod()")
+                or line.endswith("= pkg")
+            ):
+                continue
+            assignee = line.split("=")[0]
+            content[".".join(assignee.split(".")[1:]).strip()] = i
+        fresh = {}
+        for k, v in writer.obj.__dict__.items():
+            if not k in writer.__class__.exclude:
+                line = writer.property_line(k, v, block.indent)
+                if k in content:
+                    # Replace existing content line, mark it as used
+                    lines[content[k]] = line
+                    fresh[k] = True
+                else:
+                    # Add a new content line before the `.pkg = pkg` line.
+                    lines.insert(len(lines) - 3, line)
+        for key, i in sorted(content.items(), key=lambda x: x[1], reverse=True):
+            if not key in fresh:
+                del lines[i]
+        self.dirty = True
+
+    def remove(self, tagline):
+        block = self._blocks.pop(tagline, None)
+        if block is not None:
+            block.removed = True
+            self.dirty = True
+
+    def rename(self, old_tagline, new_tagline, old, new):
+        """
+            Rename a block and replace the old name with the new name in its lines.
+        """
+        block = self._blocks.pop(old_tagline)
+        block.tagline = new_tagline
+        block.lines = [line.replace(old, new) for line in block.lines]
+        self._blocks[new_tagline] = block
+        self.dirty = True
 
     def replace(self, old, new):
-        init_file = open(self.get_init_path(), "r")
-        content = init_file.read()
-        init_file.close()
-        init_file = open(self.get_init_path(), "w")
-        init_file.write(content.replace(old, new))
-        init_file.close()
+        """
+            Replace a string everywhere in the file.
+        """
+        for segment in self._segments:
+            if isinstance(segment, _Block):
+                segment.lines = [line.replace(old, new) for line in segment.lines]
+            elif segment is self._inserted:
+                for block in segment:
+                    block.lines = [line.replace(old, new) for line in block.lines]
+            else:
+                segment[:] = [line.replace(old, new) for line in segment]
+        self._blocks = {b.tagline.replace(old, new): b for b in self._blocks.values()}
+        for tagline, block in self._blocks.items():
+            block.tagline = tagline
+        self.dirty = True
+
+    def lines(self):
+        for segment in self._segments:
+            if isinstance(segment, _Block):
+                blocks = [segment]
+            elif segment is self._inserted:
+                blocks = segment
+            else:
+                yield from segment
+                continue
+            for block in blocks:
+                if not block.removed:
+                    yield from block.lines
+
+    def flush(self):
+        """
+            Atomically write the file if it was modified.
+        """
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as init_file:
+            init_file.writelines(self.lines())
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def _expand_name_part(match, template):
+    # Expand a new asset name or variant, which may refer to the groups of a match.
+    if template is None:
+        return None
+    if match is not None:
+        try:
+            template = match.expand(template)
+        except (re.error, IndexError) as e:
+            raise AstroError("Invalid template '{}': {}".format(template, e)) from None
+    if not re.fullmatch(r"[A-Za-z0-9]+(_[A-Za-z0-9]+)*", template):
+        raise AstroError(
+            "Invalid name '{}': use letters, digits and single underscores.".format(
+                template
+            )
+        )
+    return template
 
 
 def parse_asset_name(name):
@@ -574,17 +1442,75 @@ def find_files(path_pattern):
     return valid_pths
 
 
+def expand_mod_sources(sources):
+    """
+        Expand paths, directories, glob patterns and ``@listfile`` references into
+        the files they refer to, and archives into their mod files.
+
+        :returns: Pairs of the source and a file, or an :class:`.archive.Member`. The
+          file is ``None`` if the source didn't match anything, or the
+          :class:`~.exceptions.AstroError` if the list file or archive couldn't be
+          read. Archive members are read as the pairs are consumed.
+        :rtype: iterator
+    """
+    from . import archive
+
+    for source in sources:
+        if source.startswith("@"):
+            listfile = source[1:]
+            try:
+                with open(listfile, "r") as f:
+                    entries = [
+                        l.strip() for l in f if l.strip() and not l.startswith("#")
+                    ]
+            except OSError as e:
+                # Like an unreadable archive, it doesn't abort the batch.
+                yield source, AstroError("Can't read list file: {}".format(e.strerror))
+                continue
+            root = os.path.dirname(os.path.abspath(listfile))
+            yield from expand_mod_sources(
+                entry
+                if entry.startswith(archive.GIT_PREFIX)
+                else os.path.join(root, entry)
+                for entry in entries
+            )
+            continue
+        if archive.is_archive(source):
+            found = False
+            try:
+                for member in archive.iter_mod_files(source):
+                    found = True
+                    yield source, member
+            except AstroError as e:
+                # One unreadable archive doesn't abort the batch.
+                yield source, e
+                continue
+            if not found:
+                yield source, None
+            continue
+        if os.path.isdir(source):
+            files = sorted(glob.glob(os.path.join(source, "**", "*.mod"), recursive=True))
+        elif os.path.exists(source):
+            files = [source]
+        else:
+            files = sorted(glob.glob(source, recursive=True))
+        if not files:
+            yield source, None
+        for file in files:
+            yield source, file
+
+
 def load_local_pkg():
+    from . import app_directories
+
     local_path = os.path.join(app_directories.user_data_dir, "local")
     if os.path.exists(local_path):
         local = get_package(local_path)
     else:
-        from .cli import create_package
-        from time import sleep
+        from .api import create_package
 
-        args = type("Namespace", (object,), {"folder": local_path})()
         local = create_package(
-            args, {"author": "User", "email": "not@applicable.com", "pkg_name": "local"}
-        )
+            local_path, "User", "not@applicable.com", name="local"
+        ).package
         local.link()
     return local
@@ -0,0 +1,364 @@
+"""
+    Programmatic interface, for scripts and services that run many operations in one
+    interpreter instead of starting ``astro`` for each of them. Every function takes the
+    path of the package it operates on and returns a result object. Nothing is printed,
+    no input is asked for and the working directory of the process is left alone: the
+    messages that the CLI prints are collected in :attr:`Result.messages`.
+
+    The functions can be called from multiple threads and processes. Calls on the same
+    package are run one at a time, see :mod:`.journal`.
+
+    .. code-block:: python
+
+        from astrocyte import api
+
+        api.create_package("my-pkg", author="Me", email="me@example.com")
+        result = api.add_mods("my-pkg", ["mods/", "@extra.txt"], workers=4)
+        if result.failed:
+            ...
+        api.build("my-pkg", backend="native")
+"""
+
+import os, sys, json, contextlib
+from . import Package, get_package, get_glia_version, write_astro_ignore_file
+from . import __version__
+from .exceptions import AstroError
+
+
+class Result:
+    """
+        Outcome of an API call.
+
+        :ivar package: The package that was operated on.
+        :vartype package: :class:`~astrocyte.Package`
+        :ivar messages: The progress messages, as the CLI prints them.
+        :vartype messages: list of str
+    """
+
+    def __init__(self, package, messages):
+        self.package = package
+        self.messages = messages
+
+
+class AddResult(Result):
+    """
+        :ivar imported: Pairs of a mod file and the name of its asset.
+        :ivar failed: Pairs of a source and the reason it wasn't imported.
+    """
+
+    def __init__(self, package, messages, imported, failed):
+        super().__init__(package, messages)
+        self.imported = imported
+        self.failed = failed
+
+    def __bool__(self):
+        return not self.failed
+
+
+class EditResult(Result):
+    """
+        :ivar old_name: Namespaced name of the asset before the edit.
+        :ivar new_name: Namespaced name of the asset after the edit.
+    """
+
+    def __init__(self, package, messages, old_name, new_name):
+        super().__init__(package, messages)
+        self.old_name = old_name
+        self.new_name = new_name
+
+
+class BulkEditResult(Result):
+    """
+        :ivar renames: Pairs of the old and new namespaced name of each renamed asset.
+        :ivar applied: Whether the renames were made, rather than only planned.
+    """
+
+    def __init__(self, package, messages, renames, applied):
+        super().__init__(package, messages)
+        self.renames = renames
+        self.applied = applied
+
+
+class RemoveResult(Result):
+    """
+        :ivar removed: Namespaced names of the removed assets.
+    """
+
+    def __init__(self, package, messages, removed):
+        super().__init__(package, messages)
+        self.removed = removed
+
+
+class CheckReport(Result):
+    """
+        :ivar results: The check of each mod file.
+        :vartype results: list of :class:`.check.CheckResult`
+    """
+
+    def __init__(self, package, messages, results):
+        super().__init__(package, messages)
+        self.results = results
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def __bool__(self):
+        return not self.failed
+
+
+class BuildResult(Result):
+    """
+        :ivar built: Whether a wheel of the current version is available.
+        :ivar cached: Whether the wheel of the last build was reused.
+        :ivar version: Version of the package after the build.
+        :ivar wheel: Path of the wheel, or ``None`` if the build failed.
+    """
+
+    def __init__(self, package, messages, built, cached, version, wheel):
+        super().__init__(package, messages)
+        self.built = built
+        self.cached = cached
+        self.version = version
+        self.wheel = wheel
+
+    def __bool__(self):
+        return self.built
+
+
+class UploadResult(Result):
+    """
+        :ivar uploaded: Paths of the uploaded wheels; wheels of releases that already
+          existed are skipped.
+    """
+
+    def __init__(self, package, messages, uploaded):
+        super().__init__(package, messages)
+        self.uploaded = uploaded
+
+
+class CommitResult(Result):
+    """
+        :ivar committed: Whether there were deferred changes to commit.
+    """
+
+    def __init__(self, package, messages, committed):
+        super().__init__(package, messages)
+        self.committed = committed
+
+
+@contextlib.contextmanager
+def _operate(path):
+    # Load the package, collect its messages and hold its lock, see `.journal`.
+    pkg = get_package(path)
+    pkg.messages = []
+    with pkg.lock():
+        yield pkg
+
+
+def create_package(folder, author, email, name=None, vcs=None):
+    """
+        Create an empty package and commit it.
+
+        :param folder: Folder to create. Its name is the name of the distribution.
+        :param name: Name of the Python package, by default the folder name.
+        :param vcs: Version control backend, see :mod:`.vcs`.
+        :rtype: :class:`Result`
+    """
+    from .templates import create_template
+    from .vcs import get_backend, get_backend_name
+
+    folder = os.path.abspath(folder)
+    folder_name = os.path.basename(folder)
+    try:
+        os.mkdir(folder)
+    except FileExistsError:
+        raise AstroError("Target location already exists.") from None
+    vcs_name = vcs or get_backend_name()
+    backend = get_backend(folder, vcs_name)
+    backend.init()
+    pkg_data = {
+        "pkg_name": folder_name,
+        "name": name or folder_name,
+        "author": author,
+        "email": email,
+        "glia_version": get_glia_version(),
+        "astro_version": __version__,
+    }
+    if vcs_name != "gitpython":
+        pkg_data["vcs"] = vcs_name
+    pkg_folder = os.path.join(folder, pkg_data["name"])
+    astro_folder = os.path.join(folder, ".astro")
+    create_template("setup.py", folder, locals=pkg_data)
+    create_template("README.md", folder, locals=pkg_data)
+    create_template(".gitignore", folder)
+    os.mkdir(pkg_folder)
+    os.mkdir(os.path.join(pkg_folder, "mod"))
+    create_template("__init__.py", pkg_folder, locals=pkg_data)
+    os.mkdir(astro_folder)
+    with open(os.path.join(astro_folder, "pkg"), "w") as f:
+        f.write(json.dumps(pkg_data))
+    write_astro_ignore_file(folder)
+    if sys.platform == "win32":
+        # Hide the .astro folder.
+        import ctypes
+
+        ctypes.windll.kernel32.SetFileAttributesW(astro_folder, 2)
+    files = [
+        "setup.py",
+        "README.md",
+        ".gitignore",
+        os.path.join(pkg_data["name"], "__init__.py"),
+        os.path.join(".astro", "pkg"),
+        os.path.join(".astro", ".gitignore"),
+    ]
+    backend.commit(
+        files, "Initial commit generated by Astrocyte.", author, email,
+    )
+    return Result(Package(folder, pkg_data), ["Package skeleton created."])
+
+
+def add_mods(path, sources, name=None, variant="0", workers=1):
+    """
+        Import mod files into the package, see :meth:`.Package.add_mod_files`. Files
+        that can't be imported are listed in the result and don't raise an error.
+
+        :param sources: Paths of mod files, directories, glob patterns, ``@listfile``
+          references, archives or git repositories, see :mod:`.archive`.
+        :param name: Asset name, only for a single mod file.
+        :param workers: Number of processes to sanitize the files with.
+        :rtype: :class:`AddResult`
+    """
+    from .archive import is_archive
+
+    with _operate(path) as pkg:
+        if name is not None:
+            if (
+                len(sources) != 1
+                or not os.path.isfile(sources[0])
+                or is_archive(sources[0])
+            ):
+                raise AstroError("An asset name can only be given for a single file.")
+            import_name = pkg.get_import_name(sources[0], name=name, variant=variant)
+            pkg.add_mod_file(sources[0], name=name, variant=variant)
+            return AddResult(pkg, pkg.messages, [(sources[0], import_name)], [])
+        report = pkg.add_mod_files(sources, variant=variant, workers=workers)
+        return AddResult(pkg, pkg.messages, report.imported, report.failed)
+
+
+def edit_asset(path, asset, name=None, variant=None):
+    """
+        Rename the asset that uniquely matches ``asset``, or change its variant.
+
+        :rtype: :class:`EditResult`
+    """
+    with _operate(path) as pkg:
+        old_name = pkg.find_mod_candidate(asset)[0]
+        new_name = pkg.edit_asset(asset, name=name, variant=variant)
+        return EditResult(pkg, pkg.messages, old_name, new_name)
+
+
+def edit_assets(path, pattern, name=None, variant=None, regex=False, dry_run=False):
+    """
+        Rename, or change the variant of, every asset that matches ``pattern`` in one
+        commit, see :meth:`.Package.edit_assets`.
+
+        :rtype: :class:`BulkEditResult`
+    """
+    with _operate(path) as pkg:
+        renames = pkg.edit_assets(
+            pattern, name=name, variant=variant, regex=regex, dry_run=dry_run
+        )
+        return BulkEditResult(pkg, pkg.messages, renames, not dry_run)
+
+
+def remove_assets(path, pattern):
+    """
+        Remove every asset whose namespaced name contains ``pattern``, which may
+        contain glob wildcards, in one commit.
+
+        :rtype: :class:`RemoveResult`
+    """
+    with _operate(path) as pkg:
+        candidates = pkg.get_mod_candidates(pattern)
+        if not candidates:
+            raise AstroError("No assets found matching '{}'".format(pattern))
+        with pkg.transaction():
+            for candidate in candidates:
+                pkg.remove_mod_file(candidate)
+        pkg.commit("Removed " + ", ".join(candidates))
+        return RemoveResult(pkg, pkg.messages, candidates)
+
+
+def check(path, jobs=1, compiler=None, use_cache=True):
+    """
+        Compile check the mod files of the package, see :meth:`.Package.check`.
+
+        :rtype: :class:`CheckReport`
+    """
+    from .check import Checker
+
+    with _operate(path) as pkg:
+        checker = Checker(pkg, compiler=compiler, use_cache=use_cache)
+        return CheckReport(pkg, pkg.messages, checker.check(jobs=jobs))
+
+
+def build(path, force=False, backend=None):
+    """
+        Build the package into a wheel, see :meth:`.Package.build`.
+
+        :rtype: :class:`BuildResult`
+    """
+    with _operate(path) as pkg:
+        version = pkg.version
+        pkg.build(force=force, backend=backend)
+        built = pkg.built()
+        wheel = pkg.get_distribution() if built else None
+        cached = built and pkg.version == version
+        return BuildResult(pkg, pkg.messages, built, cached, pkg.version, wheel)
+
+
+def install(path, backend=None):
+    """
+        Install the wheel of the current version, see :meth:`.Package.install`.
+
+        :rtype: :class:`Result`
+    """
+    with _operate(path) as pkg:
+        pkg.install(backend=backend)
+        return Result(pkg, pkg.messages)
+
+
+def uninstall(path, backend=None):
+    """
+        Uninstall the package, see :meth:`.Package.uninstall`.
+
+        :rtype: :class:`Result`
+    """
+    with _operate(path) as pkg:
+        pkg.uninstall(backend=backend)
+        return Result(pkg, pkg.messages)
+
+
+def upload(path, **options):
+    """
+        Upload the wheels of the current version, see :meth:`.Package.upload`.
+
+        :param options: Options of :class:`.upload.Uploader`, such as ``username``,
+          ``password`` and ``repository_url``.
+        :rtype: :class:`UploadResult`
+    """
+    with _operate(path) as pkg:
+        uploaded = pkg.upload(**options)
+        return UploadResult(pkg, pkg.messages, uploaded)
+
+
+def commit(path, message=None):
+    """
+        Make a single commit of the changes deferred with ``ASTRO_NO_COMMIT``.
+
+        :rtype: :class:`CommitResult`
+    """
+    with _operate(path) as pkg:
+        committed = pkg.commit_pending(message)
+        return CommitResult(pkg, pkg.messages, committed)
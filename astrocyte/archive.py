@@ -0,0 +1,156 @@
+"""
+    Mod files inside of archives. Zip files, tarballs and the tree of a git revision are
+    read member by member without extracting them, and the contents of their mod files
+    are passed on one at a time, for :meth:`.Package.add_mod_files` to sanitize in
+    memory and write into the package while the rest of the archive is read.
+
+    Git sources are ``git+<url or path>``, optionally followed by ``#<revision>``. The
+    default revision is ``HEAD``; repositories that aren't local are cloned shallowly,
+    so their revision must be a branch or tag.
+"""
+
+import io, os, subprocess
+from .exceptions import AstroError
+
+GIT_PREFIX = "git+"
+ARCHIVE_EXTENSIONS = (
+    ".zip",
+    ".tar",
+    ".tar.gz",
+    ".tgz",
+    ".tar.bz2",
+    ".tbz2",
+    ".tar.xz",
+    ".txz",
+)
+
+
+class Member:
+    """
+        A mod file read from an archive.
+
+        :ivar source: The archive it was read from.
+        :ivar name: Path of the mod file inside of the archive.
+        :ivar data: Content of the mod file.
+        :vartype data: bytes
+    """
+
+    def __init__(self, source, name, data):
+        self.source = source
+        self.name = name
+        self.data = data
+
+    def __str__(self):
+        return self.source + ":" + self.name
+
+    def readlines(self):
+        # Decoded like `open` decodes the files on disk.
+        return io.TextIOWrapper(io.BytesIO(self.data)).readlines()
+
+
+def is_archive(source):
+    """
+        Return whether ``source`` refers to an archive or git repository.
+    """
+    return source.startswith(GIT_PREFIX) or source.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_mod_files(source):
+    """
+        Read the mod files of an archive one at a time, as they're found in it.
+
+        :returns: iterator of :class:`Member`
+        :raises: :class:`~.exceptions.AstroError` if the archive can't be read, also
+          after some of its members.
+    """
+    import tarfile, zipfile
+
+    try:
+        if source.startswith(GIT_PREFIX):
+            yield from _read_git(source)
+        elif source.lower().endswith(".zip"):
+            yield from _read_zip(source)
+        else:
+            with tarfile.open(source, mode="r|*") as archive:
+                yield from _read_tar(source, archive)
+    except FileNotFoundError:
+        raise AstroError("Archive '{}' not found.".format(source)) from None
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        raise AstroError("Can't read archive '{}': {}".format(source, e)) from None
+
+
+def _is_mod_file(name):
+    return name.endswith(".mod")
+
+
+def _read_zip(source):
+    import zipfile
+
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and _is_mod_file(info.filename):
+                yield Member(source, info.filename, archive.read(info))
+
+
+def _read_tar(source, archive):
+    # The archive is read as a stream, each member has to be read before the next.
+    for info in archive:
+        if info.isfile() and _is_mod_file(info.name):
+            with archive.extractfile(info) as f:
+                data = f.read()
+            yield Member(source, info.name, data)
+
+
+def _read_git(source):
+    import tarfile, tempfile, shutil
+
+    location, _, revision = source[len(GIT_PREFIX) :].partition("#")
+    clone = None
+    try:
+        if not os.path.isdir(location):
+            clone = tempfile.mkdtemp()
+            command = ["git", "clone", "--quiet", "--bare", "--depth", "1"]
+            if revision:
+                command += ["--branch", revision]
+            _run_git(command + [location, clone])
+        # Stderr goes to a file, so that git doesn't block on it while the archive is
+        # read from stdout.
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                process = subprocess.Popen(
+                    ["git", "archive", "--format=tar", revision or "HEAD"],
+                    cwd=clone or location,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                )
+            except FileNotFoundError:
+                raise AstroError("Git sources need `git` to be installed.") from None
+            with process:
+                try:
+                    with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+                        yield from _read_tar(source, archive)
+                    failed = False
+                except tarfile.TarError:
+                    failed = True
+                # Drain the padding after the last member, so that git can exit.
+                process.stdout.read()
+            if process.returncode or failed:
+                stderr.seek(0)
+                error = stderr.read().decode(errors="replace").strip()
+                raise AstroError("`git archive` of '{}' failed: {}".format(source, error))
+    finally:
+        if clone is not None:
+            shutil.rmtree(clone, ignore_errors=True)
+
+
+def _run_git(command):
+    from .process import run_command
+
+    try:
+        result = run_command(command, on_stdout=None)
+    except FileNotFoundError:
+        raise AstroError("Git sources need `git` to be installed.") from None
+    if not result:
+        raise AstroError(
+            "`{}` failed: {}".format(" ".join(command[:2]), result.stderr.strip())
+        )
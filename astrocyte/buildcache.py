@@ -0,0 +1,68 @@
+"""
+    Build cache that fingerprints the sources of a package, so that a build can reuse
+    the last artifact in ``dist/`` when nothing changed since it was built.
+"""
+
+import os, re, json, hashlib
+from .profiling import instrument
+
+_version_line = re.compile(rb"^__version__\s*=.*$", re.MULTILINE)
+
+
+@instrument("build")
+class BuildCache:
+    def __init__(self, pkg):
+        self.pkg = pkg
+        self.path = os.path.join(pkg.path, ".astro", "build")
+
+    def fingerprint(self):
+        """
+            Hash of everything that ends up in the wheel: the mod files, ``__init__.py``
+            without its version line, ``setup.py``, ``README.md`` and ``.astro/pkg``.
+        """
+        pkg = self.pkg
+        digest = hashlib.sha256()
+        for name, entry in sorted(pkg.manifest.assets.items()):
+            digest.update("{} {}\n".format(name, entry["hash"]).encode())
+        with open(pkg.get_source_path("__init__.py"), "rb") as f:
+            # Each build bumps the version, which mustn't invalidate the cache.
+            digest.update(_version_line.sub(b"", f.read()))
+        for path in ("setup.py", "README.md", os.path.join(".astro", "pkg")):
+            digest.update(b"\0" + path.encode() + b"\0")
+            try:
+                with open(os.path.join(pkg.path, path), "rb") as f:
+                    digest.update(f.read())
+            except FileNotFoundError:
+                pass
+        return digest.hexdigest()
+
+    def lookup(self, fingerprint):
+        """
+            Return the path of the artifact built from sources with this fingerprint,
+            or ``None`` if there is no such artifact.
+        """
+        try:
+            with open(self.path, "r") as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        artifact = os.path.join(self.pkg.path, record.get("artifact", ""))
+        if (
+            record.get("fingerprint") != fingerprint
+            or record.get("version") != self.pkg.version
+            or not os.path.isfile(artifact)
+        ):
+            return None
+        return artifact
+
+    def store(self, fingerprint, artifact):
+        self.pkg.ignore_local_files()
+        record = {
+            "fingerprint": fingerprint,
+            "version": self.pkg.version,
+            "artifact": os.path.relpath(artifact, self.pkg.path),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,138 @@
+"""
+    Compile check of the mod files of a package. Every mod file is compiled on its own
+    by an NMODL compiler command, ``nrnivmodl`` by default, in parallel. Results and
+    compiler artifacts are cached in ``.astro/cache/check`` by the content hash of the
+    mod file and the identity of the compiler, so only changed mods are recompiled.
+"""
+
+import os, json, shlex, shutil, hashlib, tempfile
+from .exceptions import AstroError
+from .profiling import instrument
+
+DEFAULT_COMPILER = "nrnivmodl"
+
+
+class CheckResult:
+    """
+        Outcome of the compile check of one mod file.
+
+        :ivar artifacts: Folder with the files the compiler produced.
+    """
+
+    def __init__(self, name, ok, log, cached, artifacts):
+        self.name = name
+        self.ok = ok
+        self.log = log
+        self.cached = cached
+        self.artifacts = artifacts
+
+
+def get_compiler(pkg, compiler=None):
+    """
+        Return the compiler command as a list. Given explicitly, or taken from the
+        ``ASTRO_NMODL_COMPILER`` environment variable, the ``nmodl_compiler`` key of the
+        package data, or ``nrnivmodl``.
+    """
+    compiler = (
+        compiler
+        or os.getenv("ASTRO_NMODL_COMPILER")
+        or pkg.data.get("nmodl_compiler")
+        or DEFAULT_COMPILER
+    )
+    return shlex.split(compiler)
+
+
+def get_compiler_identity(command):
+    """
+        Identify a compiler by its command and the executable it resolves to, so that
+        upgrading the compiler invalidates the cache without running it.
+    """
+    identity = [" ".join(command)]
+    for part in command:
+        path = shutil.which(part) or (part if os.path.isfile(part) else None)
+        if path is not None:
+            stat = os.stat(path)
+            identity.append("{}:{}:{}".format(path, stat.st_mtime_ns, stat.st_size))
+    return "\n".join(identity)
+
+
+@instrument("check", exclude=("get_key",))
+class Checker:
+    def __init__(self, pkg, compiler=None, use_cache=True):
+        self.pkg = pkg
+        self.command = get_compiler(pkg, compiler)
+        if shutil.which(self.command[0]) is None and not os.path.isfile(self.command[0]):
+            raise AstroError(
+                "NMODL compiler '{}' not found. Set it with `--compiler`.".format(
+                    self.command[0]
+                )
+            )
+        self.identity = get_compiler_identity(self.command)
+        self.use_cache = use_cache
+        self.cache_dir = os.path.join(pkg.path, ".astro", "cache", "check")
+
+    def get_key(self, name):
+        digest = hashlib.sha256()
+        digest.update(self.pkg.manifest.get(name)["hash"].encode())
+        digest.update(b"\0" + self.identity.encode())
+        return digest.hexdigest()
+
+    def check(self, names=None, jobs=1):
+        """
+            Compile the given mods, or all mods of the package, ``jobs`` at a time.
+
+            :rtype: list of :class:`CheckResult`
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pkg.ignore_local_files()
+        names = self.pkg.manifest.names() if names is None else names
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            return list(executor.map(self.check_mod, names))
+
+    def check_mod(self, name):
+        key = self.get_key(name)
+        entry = os.path.join(self.cache_dir, key[:2], key)
+        if self.use_cache:
+            try:
+                with open(os.path.join(entry, "result.json"), "r") as f:
+                    result = json.load(f)
+                artifacts = os.path.join(entry, "artifacts")
+                return CheckResult(name, result["ok"], result["log"], True, artifacts)
+            except (FileNotFoundError, ValueError):
+                pass
+        return self._compile(name, entry)
+
+    def _compile(self, name, entry):
+        from .process import run_command
+
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        work = os.path.join(staging, "artifacts")
+        os.mkdir(work)
+        mod_file = name + ".mod"
+        shutil.copyfile(self.pkg.get_mod_path(mod_file), os.path.join(work, mod_file))
+        result = run_command(self.command + [mod_file], cwd=work, on_stdout=None)
+        os.remove(os.path.join(work, mod_file))
+        log = result.stdout + result.stderr
+        with open(os.path.join(staging, "result.json"), "w") as f:
+            json.dump({"ok": bool(result), "log": log}, f)
+        if not self.use_cache:
+            # Replace the entry of an earlier check.
+            stale = staging + ".stale"
+            try:
+                os.rename(entry, stale)
+            except FileNotFoundError:
+                pass
+            else:
+                shutil.rmtree(stale)
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            # Another worker cached the same content first.
+            shutil.rmtree(staging)
+            if not os.path.isdir(entry):
+                raise
+        return CheckResult(
+            name, bool(result), log, False, os.path.join(entry, "artifacts")
+        )
@@ -1,37 +1,18 @@
-import os, sys, argparse, json
+import os, sys, argparse
 from shutil import copy2 as copy_file
 
 try:
-    from .templates import create_template
-    from . import Package, get_package, load_local_pkg, get_glia_version, __version__
-    from .exceptions import AstroError
+    from . import get_package, load_local_pkg
+    from .exceptions import AstroError, BuildError, InterpreterMismatchError
 except ModuleNotFoundError as _:
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-    from astrocyte import (
-        Package,
-        load_local_pkg,
-        get_package,
-        get_glia_version,
-        __version__,
-    )
-    from astrocyte.templates import create_template
-    from astrocyte.exceptions import AstroError
+    from astrocyte import load_local_pkg, get_package
+    from astrocyte.exceptions import AstroError, BuildError, InterpreterMismatchError
 
 _exit_on_fail = True
 
 
 class AliasedSubParsersAction(argparse._SubParsersAction):
-    old_init = staticmethod(argparse._ActionsContainer.__init__)
-
-    @staticmethod
-    def _containerInit(
-        self, description, prefix_chars, argument_default, conflict_handler
-    ):
-        AliasedSubParsersAction.old_init(
-            self, description, prefix_chars, argument_default, conflict_handler
-        )
-        self.register("action", "parsers", AliasedSubParsersAction)
-
     class _AliasedPseudoAction(argparse.Action):
         def __init__(self, name, aliases, help):
             dest = name
@@ -57,19 +38,35 @@ class AliasedSubParsersAction(argparse._SubParsersAction):
         return parser
 
 
-# override argparse to register new subparser action by default
-argparse._ActionsContainer.__init__ = AliasedSubParsersAction._containerInit
+def _add_subparsers(parser):
+    return parser.add_subparsers(action=AliasedSubParsersAction)
 
 
 def astrocyte_cli():
     parser = argparse.ArgumentParser()
-    subparsers = parser.add_subparsers()
+    parser.add_argument(
+        "--no-commit",
+        action="store_true",
+        help="Don't commit changes; they're committed together by `astro commit`.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a Chrome trace of the command to the path in `ASTRO_PROFILE`,"
+        + " or astro-trace.json, and print the slowest operations.",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run the command in this process, even if `astro serve` is running.",
+    )
+    subparsers = _add_subparsers(parser)
 
     # Create package
     create_parser = subparsers.add_parser(
         "create", aliases=("c"), description="Create packages or components."
     )
-    create_subparsers = create_parser.add_subparsers()
+    create_subparsers = _add_subparsers(create_parser)
     create_package_parser = create_subparsers.add_parser(
         "package", aliases=("pkg", "p"), description="Create an empty package."
     )
@@ -82,6 +79,12 @@ def astrocyte_cli():
     create_package_parser.add_argument(
         "--author", action="store", help="Author of the package."
     )
+    create_package_parser.add_argument(
+        "--vcs",
+        action="store",
+        choices=("gitpython", "direct", "none"),
+        help="Version control backend of the package (default: gitpython).",
+    )
     create_package_parser.add_argument(
         "--email", action="store", help="Email of the author."
     )
@@ -91,11 +94,17 @@ def astrocyte_cli():
     add_parser = subparsers.add_parser(
         "add", aliases=("a"), description="Create packages or components."
     )
-    add_subparsers = add_parser.add_subparsers()
+    add_subparsers = _add_subparsers(add_parser)
     add_mod_parser = add_subparsers.add_parser(
         "mod", aliases=("m"), description="Add a mod file to your package."
     )
-    add_mod_parser.add_argument("file", action="store", help="Path of the mod file.")
+    add_mod_parser.add_argument(
+        "files",
+        action="store",
+        nargs="+",
+        help="Paths of mod files, directories, glob patterns, @listfiles, zip or tar"
+        " archives, or git+<repository>[#<revision>].",
+    )
     add_mod_parser.add_argument(
         "-n", "--name", action="store", help="Asset name of the mod file."
     )
@@ -105,6 +114,14 @@ def astrocyte_cli():
     add_mod_parser.add_argument(
         "-l", "--local", action="store_true", help="Add the mod file for local use."
     )
+    add_mod_parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of worker processes to sanitize mod files with.",
+    )
     add_mod_parser.set_defaults(func=add_mod_file)
 
     # Edit asset
@@ -112,10 +129,33 @@ def astrocyte_cli():
         "edit", aliases=("a"), description="Edit packages or components."
     )
     edit_parser.add_argument(
-        "asset", action="store", help="Unique part of the asset name."
+        "asset",
+        action="store",
+        help="Unique part of the asset name, or a pattern with --all or --regex.",
+    )
+    edit_parser.add_argument(
+        "-n",
+        "--name",
+        action="store",
+        help="New asset name. With --regex it can refer to groups, such as \\1.",
     )
-    edit_parser.add_argument("-n", "--name", action="store", help="New asset name.")
     edit_parser.add_argument("-v", "--variant", action="store", help="New variant name.")
+    edit_parser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        dest="all_matches",
+        help="Edit every asset whose name contains the glob pattern.",
+    )
+    edit_parser.add_argument(
+        "-r",
+        "--regex",
+        action="store_true",
+        help="Edit every asset whose name matches the regular expression.",
+    )
+    edit_parser.add_argument(
+        "--dry-run", action="store_true", help="Show the renames without making them."
+    )
     edit_parser.add_argument(
         "-l", "--local", action="store_true", help="Edit a local asset."
     )
@@ -125,7 +165,7 @@ def astrocyte_cli():
     remove_parser = subparsers.add_parser(
         "remove", aliases=["rm"], description="Remove components from the package."
     )
-    remove_subparsers = remove_parser.add_subparsers()
+    remove_subparsers = _add_subparsers(remove_parser)
     remove_mod_parser = remove_subparsers.add_parser(
         "mod", aliases=("m"), description="Remove a mod file to your package."
     )
@@ -153,36 +193,232 @@ def astrocyte_cli():
         action="store_true",
         help="Install the wheel after a succesfull build.",
     )
+    wheel_parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Build even if the sources didn't change since the last build.",
+    )
+    wheel_parser.add_argument(
+        "-b",
+        "--backend",
+        action="store",
+        choices=("setuptools", "native"),
+        help="Build with setuptools or write the wheel natively.",
+    )
+    wheel_parser.add_argument(
+        "--check", action="store_true", help="Compile check the mod files first."
+    )
+    _add_check_arguments(wheel_parser)
+    _add_upload_arguments(wheel_parser)
+    _add_workspace_arguments(wheel_parser)
     wheel_parser.set_defaults(func=build_package)
 
+    # Check mod files
+    check_parser = subparsers.add_parser(
+        "check", description="Check that the mod files of the package compile."
+    )
+    _add_check_arguments(check_parser)
+    check_parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of mod files to compile in parallel.",
+    )
+    check_parser.add_argument(
+        "--no-cache", action="store_true", help="Recompile cached mod files."
+    )
+    check_parser.set_defaults(func=check_package)
+
     # Upload wheel
     upload_parser = subparsers.add_parser(
         "upload", description="Upload current wheel to PyPI."
     )
+    _add_upload_arguments(upload_parser)
+    _add_workspace_arguments(upload_parser)
     upload_parser.set_defaults(func=upload_package)
 
     # Install wheel
     install_parser = subparsers.add_parser(
         "install", description="Install current wheel."
     )
+    _add_install_arguments(install_parser)
+    _add_workspace_arguments(install_parser)
     install_parser.set_defaults(func=install_package)
 
     # Uninstall wheel
     uninstall_parser = subparsers.add_parser(
         "uninstall", description="Uninstall current wheel."
     )
+    _add_install_arguments(uninstall_parser)
     uninstall_parser.set_defaults(func=uninstall_package)
 
+    # Watch mod directory
+    watch_parser = subparsers.add_parser(
+        "watch",
+        description="Watch the mod directory and register, rename or unregister the"
+        + " mod files that are dropped in, renamed or removed.",
+    )
+    watch_parser.add_argument(
+        "--once", action="store_true", help="Sync once instead of watching."
+    )
+    watch_parser.add_argument(
+        "--poll", action="store_true", help="Poll for changes instead of using inotify."
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        action="store",
+        type=float,
+        default=0.3,
+        help="Seconds without changes before a burst of changes is synced.",
+    )
+    watch_after = watch_parser.add_mutually_exclusive_group()
+    watch_after.add_argument(
+        "--link", action="store_true", help="Link the package after each sync."
+    )
+    watch_after.add_argument(
+        "--build", action="store_true", help="Build the package after each sync."
+    )
+    watch_parser.set_defaults(func=watch_package)
+
+    # Commit deferred changes
+    commit_parser = subparsers.add_parser(
+        "commit", description="Commit the changes deferred with `--no-commit`."
+    )
+    commit_parser.add_argument("-m", "--message", action="store", help="Commit message.")
+    commit_parser.set_defaults(func=commit_package)
+
+    # Serve packages
+    serve_parser = subparsers.add_parser(
+        "serve",
+        description="Keep packages loaded and run the commands of other `astro`"
+        + " processes on them, received over a Unix socket.",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        action="store",
+        help="Path of the socket (default: `ASTRO_SOCKET`, astro-<uid>.sock in"
+        + " XDG_RUNTIME_DIR or /tmp/astro-<uid>/astro.sock).",
+    )
+    serve_parser.set_defaults(func=serve_packages)
+
     cl_args = parser.parse_args()
     if hasattr(cl_args, "func"):
+        # Set in the environment so that workspace workers defer their commits too.
+        no_commit = os.environ.get("ASTRO_NO_COMMIT")
+        if cl_args.no_commit:
+            os.environ["ASTRO_NO_COMMIT"] = "1"
+        from . import profiling
+
+        if cl_args.profile or os.getenv("ASTRO_PROFILE"):
+            profiling.enable()
         try:
-            cl_args.func(cl_args)
+            with profiling.span("astro " + " ".join(sys.argv[1:]), "cli"):
+                if not _forward(cl_args):
+                    cl_args.func(cl_args)
         except AstroError as e:
             print("ERROR", str(e))
             if _exit_on_fail:
                 exit(1)
             else:
                 raise
+        finally:
+            if no_commit is None:
+                os.environ.pop("ASTRO_NO_COMMIT", None)
+            summary = profiling.finish()
+            if summary is not None:
+                print(summary, file=sys.stderr, end="")
+
+
+# Commands that `astro serve` runs for the CLI, with the options it takes.
+_served = {
+    "add_mod_file": ("add", ("name", "variant", "jobs")),
+    "edit_mod_file": (
+        "edit",
+        ("asset", "name", "variant", "all_matches", "regex", "dry_run"),
+    ),
+    "remove_mod_file": ("rm", ("name",)),
+    "build_package": ("build", ("force", "backend", "check", "compiler", "install")),
+    "install_package": ("install", ("backend",)),
+    "uninstall_package": ("uninstall", ("backend",)),
+    "commit_package": ("commit", ("message",)),
+}
+
+
+def _forward(args):
+    """
+        Run the command in the package daemon, if one is running.
+
+        :returns: Whether the daemon ran the command.
+    """
+    served = _served.get(args.func.__name__)
+    if served is None or args.no_daemon or args.profile or os.getenv("ASTRO_NO_DAEMON"):
+        return False
+    if any(getattr(args, flag, False) for flag in ("local", "all", "upload")):
+        return False
+    from .serve import connect, get_interpreter
+
+    client = connect()
+    if client is None:
+        return False
+    method, options = served
+    params = {option: getattr(args, option) for option in options}
+    params["path"] = os.getcwd()
+    # The daemon builds and installs with its own interpreter, so it only runs the
+    # commands of processes of the same one.
+    params["interpreter"] = get_interpreter()
+    if method == "add":
+        # Relative to this process, not to the daemon.
+        params["files"] = [_absolute_source(source) for source in args.files]
+    if method not in ("install", "uninstall", "commit"):
+        params["no_commit"] = bool(os.getenv("ASTRO_NO_COMMIT"))
+    with client:
+        if method == "rm" and not args.force:
+            request = {"path": params["path"], "name": args.name}
+            request["interpreter"] = params["interpreter"]
+            try:
+                candidates = client.call("candidates", request)["candidates"]
+            except InterpreterMismatchError:
+                return False
+            if not _confirm_removal(args.name, candidates):
+                return True
+            params["confirmed"] = candidates
+        try:
+            client.call(method, params, output=sys.stdout)
+        except InterpreterMismatchError:
+            return False
+    return True
+
+
+def _absolute_source(source):
+    from .archive import GIT_PREFIX
+
+    if source.startswith("@"):
+        return "@" + os.path.abspath(source[1:])
+    if source.startswith(GIT_PREFIX):
+        location, sep, revision = source[len(GIT_PREFIX) :].partition("#")
+        if os.path.exists(location):
+            return GIT_PREFIX + os.path.abspath(location) + sep + revision
+        return source
+    if os.path.exists(source):
+        return os.path.abspath(source)
+    # Glob patterns
+    return os.path.join(os.getcwd(), source)
+
+
+def serve_packages(args):
+    from .serve import Server
+
+    server = Server(args.socket)
+    print("Serving packages on", server.path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving.")
+    finally:
+        server.server_close()
 
 
 def create_package(args, presets=None):
@@ -201,125 +437,254 @@ def create_package(args, presets=None):
         presets["pkg_name"] = None
     # Get paths. `folder` is the absolute path and `folder_name` doubles as the package name
     folder = os.path.abspath(args.folder)
-    folder_name = args.folder.split(os.sep)[-1]
-    # Create root folder
-    try:
-        os.mkdir(folder)
-    except FileExistsError as _:
-        raise AstroError("Target location already exists.") from None
-    # Initialize git repo.
-    from git import Repo, Actor
-
-    repo = Repo.init(folder)
-    # Ask package information
-    pkg_data = {
-        "pkg_name": folder_name,
-        # Package naming priority: preset > user input > folder name.
-        "name": presets["pkg_name"]
+    folder_name = os.path.basename(folder)
+    if os.path.exists(folder):
+        raise AstroError("Target location already exists.")
+    # Ask package information. Package naming priority: preset > user input > folder name.
+    name = (
+        presets["pkg_name"]
         or input("Package name [{}]: ".format(folder_name))
-        or folder_name,
-    }
-    pkg_data["author"] = input_required("author", presets)
-    pkg_data["email"] = input_required("email", presets)
-    # Fill in the rest of the package information.
-    pkg_data["glia_version"] = get_glia_version()
-    pkg_data["astro_version"] = __version__
-    pkg_folder = os.path.join(folder, pkg_data["name"])
-    mod_folder = os.path.join(pkg_folder, "mod")
-    astro_folder = os.path.join(folder, ".astro")
-
-    # Create package files
-    create_template("setup.py", folder, locals=pkg_data)  # setup.py
-    create_template("README.md", folder, locals=pkg_data)  # README
-    create_template(".gitignore", folder)  # .gitignore
-    os.mkdir(pkg_folder)  # package folder
-    os.mkdir(mod_folder)  # mod folder
-    create_template("__init__.py", pkg_folder, locals=pkg_data)  # __init__.py
-    os.mkdir(astro_folder)  # astro folder
-    make(os.path.join(astro_folder, "pkg"), json.dumps(pkg_data))  # pkg json
-
-    # Hide .astro folder on Windows
-    if sys.platform == "win32":
-        import ctypes
-
-        ctypes.windll.kernel32.SetFileAttributesW(astro_folder, 2)
-
-    # Make initial commit
-    index = repo.index
-    index.add(repo.untracked_files)
-    author = Actor(pkg_data["author"], pkg_data["email"])
-    index.commit(
-        "Initial commit generated by Astrocyte.", author=author, committer=author
-    )
-    # Finish
-    print("Package skeleton created.")
-    return Package(folder, pkg_data)
+        or folder_name
+    )
+    author = input_required("author", presets)
+    email = input_required("email", presets)
+    from .api import create_package as create
+
+    result = create(folder, author, email, name=name, vcs=getattr(args, "vcs", None))
+    for message in result.messages:
+        print(message)
+    return result.package
 
 
 def _get_pkg(args):
-    if args.local:
+    if getattr(args, "local", False):
         return load_local_pkg()
-    else:
-        return get_package()
+    # The package is given by `astro serve`, which keeps it loaded.
+    return getattr(args, "pkg", None) or get_package()
 
 
 def add_mod_file(args):
+    from .archive import is_archive
+
     pkg = _get_pkg(args)
-    pkg.add_mod_file(args.file, name=args.name, variant=args.variant)
-    print("Added mod file.")
+    if (
+        len(args.files) == 1
+        and os.path.isfile(args.files[0])
+        and not is_archive(args.files[0])
+    ):
+        pkg.add_mod_file(args.files[0], name=args.name, variant=args.variant)
+        print("Added mod file.")
+        return
+    if args.name is not None:
+        raise AstroError("An asset name can only be given when adding a single file.")
+    report = pkg.add_mod_files(args.files, variant=args.variant, workers=args.jobs)
+    for source, reason in report.failed:
+        print("ERROR", source + ":", reason)
+    print("Added {} mod files.".format(len(report.imported)))
+    if report.failed:
+        raise AstroError("{} mod files could not be added.".format(len(report.failed)))
 
 
 def remove_mod_file(args):
     pkg = _get_pkg(args)
     candidates = pkg.get_mod_candidates(args.name)
+    if not args.force and not _confirm_removal(args.name, candidates):
+        return
     if not candidates:
         raise AstroError("No assets found matching '{}'".format(args.name))
+    with pkg.lock():
+        with pkg.transaction():
+            for candidate in candidates:
+                pkg.remove_mod_file(candidate)
+        pkg.commit("Removed " + ", ".join(candidates))
+
+
+def _confirm_removal(name, candidates):
+    if not candidates:
+        raise AstroError("No assets found matching '{}'".format(name))
     message = (
         str(len(candidates))
         + " mod files found:\n"
         + "\n".join(candidates)
         + "\nAre you sure you want to remove the above mod files [y/n]? "
     )
-    if not args.force and input(message) != "y":
-        return
-    for candidate in candidates:
-        pkg.remove_mod_file(candidate)
-    pkg.commit("Removed " + ", ".join(candidates))
+    return input(message) == "y"
 
 
 def edit_mod_file(args):
     pkg = _get_pkg(args)
-    pkg.edit_asset(args.asset, name=args.name, variant=args.variant)
+    with pkg.lock():
+        if not args.all_matches and not args.regex:
+            pkg.find_mod_candidate(args.asset)
+        renames = pkg.edit_assets(
+            args.asset,
+            name=args.name,
+            variant=args.variant,
+            regex=args.regex,
+            dry_run=args.dry_run,
+        )
+    for old, new in renames:
+        print(old, "->", new)
+    if args.dry_run:
+        print("Dry run, {} assets would be renamed.".format(len(renames)))
 
 
 def build_package(args):
-    pkg = get_package()
-    pkg.build()
+    if args.all:
+        return run_workspace(
+            "build",
+            args,
+            force=args.force,
+            backend=args.backend,
+            check=args.check,
+            compiler=args.compiler,
+            install=args.install,
+            upload=args.upload,
+            upload_options=_get_upload_options(args),
+        )
+    pkg = _get_pkg(args)
+    if args.check and pkg.check(jobs=os.cpu_count() or 1, compiler=args.compiler):
+        raise BuildError("Mod files failed to compile, build aborted.")
+    pkg.build(force=args.force, backend=args.backend)
     if pkg.built() and args.install:
         pkg.install()
     if pkg.built() and args.upload:
-        pkg.upload()
+        pkg.upload(**_get_upload_options(args))
+
+
+def check_package(args):
+    pkg = get_package()
+    failed = pkg.check(
+        jobs=args.jobs, compiler=args.compiler, use_cache=not args.no_cache
+    )
+    if failed:
+        raise AstroError(
+            "{} mod files failed to compile: {}".format(
+                len(failed), ", ".join(result.name for result in failed)
+            )
+        )
+
+
+def _add_check_arguments(parser):
+    parser.add_argument(
+        "--compiler",
+        action="store",
+        help="NMODL compiler command used to check mod files (default: nrnivmodl).",
+    )
 
 
 def upload_package(args):
+    if args.all:
+        return run_workspace("upload", args, upload_options=_get_upload_options(args))
     pkg = get_package()
-    pkg.upload()
+    pkg.upload(**_get_upload_options(args))
+
+
+def _add_upload_arguments(parser):
+    parser.add_argument("-u", "--user", action="store", help="Username to upload with.")
+    parser.add_argument(
+        "-p", "--password", action="store", help="Password or API token to upload with."
+    )
+    parser.add_argument(
+        "--repository-url",
+        action="store",
+        help="Upload URL of the package index (default: PyPI).",
+    )
+    parser.add_argument(
+        "--no-skip-existing",
+        action="store_true",
+        help="Fail instead of skipping versions that already exist on the index.",
+    )
+
+
+def _get_upload_options(args):
+    return {
+        "username": args.user,
+        "password": args.password,
+        "repository_url": args.repository_url,
+        "skip_existing": not args.no_skip_existing,
+    }
 
 
 def install_package(args):
-    pkg = get_package()
-    pkg.install()
+    if args.all:
+        return run_workspace("install", args, backend=args.backend)
+    pkg = _get_pkg(args)
+    pkg.install(backend=args.backend)
 
 
-def uninstall_package(args):
+def _add_install_arguments(parser):
+    parser.add_argument(
+        "-b",
+        "--backend",
+        action="store",
+        choices=("native", "pip"),
+        help="Unpack the wheel in-process or run pip (default: native).",
+    )
+
+
+def _add_workspace_arguments(parser):
+    parser.add_argument(
+        "--all", action="store_true", help="Run for every package of the workspace."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of packages to process in parallel with --all.",
+    )
+
+
+def run_workspace(action, args, **options):
+    from .workspace import find_workspace
+
+    workspace = find_workspace()
+    results = workspace.run(action, jobs=args.jobs, **options)
+    if not results:
+        raise AstroError("No packages found in workspace " + workspace.root)
+    for result in results:
+        status = "OK" if result.ok else "FAILED"
+        if result.log:
+            print("{:<6} {} (log: {})".format(status, result.path, result.log))
+        else:
+            print("{:<6} {}".format(status, result.path))
+        if result.error:
+            print("       " + result.error)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        raise AstroError(
+            "{} of {} packages failed to {}.".format(len(failed), len(results), action)
+        )
+
+
+def watch_package(args):
+    from .watch import Watcher
+
     pkg = get_package()
-    pkg.uninstall()
+    if args.link:
+        after = pkg.link
+    elif args.build:
+        after = pkg.build
+    else:
+        after = None
+    watcher = Watcher(pkg, debounce=args.debounce, polling=args.poll)
+    try:
+        watcher.run(once=args.once, after=after)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 
-def make(target, content):
-    f = open(target, "w")
-    f.write(content)
-    f.close()
+def commit_package(args):
+    pkg = _get_pkg(args)
+    if not pkg.commit_pending(args.message):
+        print("Nothing to commit.")
+
+
+def uninstall_package(args):
+    pkg = _get_pkg(args)
+    pkg.uninstall(backend=args.backend)
 
 
 def input_required(key, presets={}):
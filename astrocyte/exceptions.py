@@ -10,6 +10,10 @@ class BuildError(AstroError):
     pass
 
 
+class CommandTimeoutError(AstroError):
+    pass
+
+
 class UploadError(AstroError):
     pass
 
@@ -26,10 +30,28 @@ class GliaApiError(UploadError):
     pass
 
 
+class AuthenticationError(UploadError):
+    pass
+
+
+class RepositoryError(UploadError):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
 class MultipleMatchesError(AstroError):
     pass
 
 
+class NameCollisionError(AstroError):
+    pass
+
+
+class InterpreterMismatchError(AstroError):
+    pass
+
+
 def multiple_candidates_error(mod_part, candidates):
     return MultipleMatchesError(
         "Multiple matches found for '{}':".format(mod_part) + "\n" + "\n".join(candidates)
@@ -0,0 +1,261 @@
+"""
+    In-process installer for the pure Python wheels of Glia packages. Wheels are unpacked
+    into site-packages and get a ``RECORD`` and ``INSTALLER`` file like pip writes them,
+    so that pip and this installer can uninstall each other's installs. Wheels that
+    need more than unpacking, such as missing requirements or console scripts, are left
+    to pip, see :func:`requires_pip`.
+"""
+
+import os, re, csv, base64, hashlib, zipfile
+from .exceptions import BuildError
+from .profiling import profiled
+
+INSTALLER = "astrocyte"
+_requirement_name = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def canonicalize(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_target():
+    """
+        Return the purelib folder of the running interpreter.
+    """
+    import sysconfig
+
+    return sysconfig.get_paths()["purelib"]
+
+
+class Wheel:
+    """
+        Read access to the parts of a wheel the installer needs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.zip = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile):
+            raise BuildError("'{}' is not a valid wheel.".format(path))
+        dist_infos = {n.split("/")[0] for n in self.zip.namelist() if ".dist-info/" in n}
+        if len(dist_infos) != 1:
+            raise BuildError("'{}' doesn't have one .dist-info folder.".format(path))
+        self.dist_info = dist_infos.pop()
+        self.name = self.dist_info.split("-")[0]
+
+    def read_text(self, name):
+        try:
+            return self.zip.read(self.dist_info + "/" + name).decode("utf-8")
+        except KeyError:
+            return ""
+
+    def get_metadata(self, name, key):
+        prefix = key + ":"
+        return [
+            line[len(prefix) :].strip()
+            for line in self.read_text(name).splitlines()
+            if line.startswith(prefix)
+        ]
+
+    def get_record(self):
+        return {
+            row[0]: row[1]
+            for row in csv.reader(self.read_text("RECORD").splitlines())
+            if row
+        }
+
+    def close(self):
+        self.zip.close()
+
+
+def get_installed_names(paths=None):
+    """
+        Return the canonical names of the distributions installed on ``paths``, by
+        default ``sys.path``.
+    """
+    import sys
+
+    names = set()
+    for path in paths if paths is not None else sys.path:
+        try:
+            entries = os.listdir(path or ".")
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.endswith(".dist-info") or entry.endswith(".egg-info"):
+                names.add(canonicalize(entry.split("-")[0]))
+    return names
+
+
+def requires_pip(wheel, installed=None):
+    """
+        Return why a wheel can't be installed in-process, or ``None`` if it can.
+    """
+    if "true" not in wheel.get_metadata("WHEEL", "Root-Is-Purelib"):
+        return "it is not a pure Python wheel"
+    data = wheel.dist_info[: -len(".dist-info")] + ".data/"
+    for name in wheel.zip.namelist():
+        if name.startswith(data) and name.split("/")[1] not in ("purelib", "platlib"):
+            return "it installs files outside of site-packages"
+    entry_points = wheel.read_text("entry_points.txt")
+    if "[console_scripts]" in entry_points or "[gui_scripts]" in entry_points:
+        return "it has scripts"
+    installed = get_installed_names() if installed is None else installed
+    for requirement in wheel.get_metadata("METADATA", "Requires-Dist"):
+        if "extra ==" in requirement:
+            continue
+        match = _requirement_name.match(requirement)
+        if match and canonicalize(match.group(1)) not in installed:
+            return "it requires {}, which is not installed".format(match.group(1))
+    return None
+
+
+def _record_hash(data):
+    digest = hashlib.sha256(data).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def install_wheel(path, target=None):
+    """
+        Unpack a wheel into ``target``, replacing the installed version of the
+        distribution.
+
+        :returns: Path of the installed ``.dist-info`` folder.
+    """
+    return install_wheels([path], target)[0]
+
+
+@profiled(category="install")
+def install_wheels(paths, target=None):
+    """
+        Unpack several wheels into ``target``, by default the purelib folder of the
+        running interpreter. Every file is checked against the ``RECORD`` of its wheel.
+
+        :returns: Paths of the installed ``.dist-info`` folders.
+        :rtype: list
+    """
+    import importlib
+
+    target = target or get_target()
+    real_target = os.path.realpath(target)
+    installed = []
+    for path in paths:
+        wheel = Wheel(path)
+        try:
+            data = wheel.dist_info[: -len(".dist-info")] + ".data/"
+            record = wheel.get_record()
+            # Check every file before anything is changed.
+            files = []
+            for name in wheel.zip.namelist():
+                if name.endswith("/") or name == wheel.dist_info + "/RECORD":
+                    continue
+                content = wheel.zip.read(name)
+                if record.get(name) != _record_hash(content):
+                    raise BuildError("Hash mismatch of '{}' in {}".format(name, path))
+                # Unpack purelib and platlib data into the target itself.
+                rel = name.split("/", 2)[2] if name.startswith(data) else name
+                dest = os.path.realpath(os.path.join(target, *rel.split("/")))
+                if not dest.startswith(real_target + os.sep):
+                    raise BuildError("'{}' in {} leaves the target.".format(name, path))
+                files.append((rel, dest, content))
+            uninstall_distribution(wheel.name, [target])
+            rows = []
+            for rel, dest, content in files:
+                _write(dest, content)
+                rows.append((rel, _record_hash(content), len(content)))
+            dist_info = os.path.join(target, wheel.dist_info)
+            installer = (INSTALLER + "\n").encode()
+            _write(os.path.join(dist_info, "INSTALLER"), installer)
+            rel = wheel.dist_info + "/INSTALLER"
+            rows.append((rel, _record_hash(installer), len(installer)))
+            rows.append((wheel.dist_info + "/RECORD", "", ""))
+            lines = ["{},{},{}\n".format(*row) for row in rows]
+            _write(os.path.join(dist_info, "RECORD"), "".join(lines).encode())
+            installed.append(dist_info)
+        finally:
+            wheel.close()
+    importlib.invalidate_caches()
+    return installed
+
+
+def find_distribution(name, paths=None):
+    """
+        Return the ``.dist-info`` folder of a distribution on ``paths``, by default
+        ``sys.path``, or ``None``.
+    """
+    import sys
+
+    canonical = canonicalize(name)
+    for path in paths if paths is not None else sys.path:
+        try:
+            entries = os.listdir(path or ".")
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.endswith(".dist-info"):
+                continue
+            if canonicalize(entry.split("-")[0]) == canonical:
+                return os.path.join(path, entry)
+    return None
+
+
+@profiled(category="install")
+def uninstall_distribution(name, paths=None):
+    """
+        Remove the files of a distribution listed in its ``RECORD``.
+
+        :returns: Whether the distribution was installed.
+    """
+    dist_info = find_distribution(name, paths)
+    if dist_info is None:
+        return False
+    root = os.path.dirname(dist_info)
+    try:
+        with open(os.path.join(dist_info, "RECORD"), "r") as f:
+            files = [row[0] for row in csv.reader(f) if row]
+    except FileNotFoundError:
+        raise BuildError("Can't uninstall {}: it has no RECORD.".format(name))
+    folders = {dist_info}
+    for rel in files:
+        path = os.path.normpath(os.path.join(root, rel))
+        folders.add(os.path.dirname(path))
+        if rel.endswith(".py"):
+            _remove_bytecode(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    # Remove the folders left empty, deepest first.
+    for folder in sorted(folders, key=len, reverse=True):
+        while folder.startswith(root + os.sep):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+    return True
+
+
+def _remove_bytecode(path):
+    folder = os.path.join(os.path.dirname(path), "__pycache__")
+    stem = os.path.basename(path)[:-3] + "."
+    try:
+        entries = os.listdir(folder)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.startswith(stem) and entry.endswith(".pyc"):
+            os.remove(os.path.join(folder, entry))
+    try:
+        os.rmdir(folder)
+    except OSError:
+        pass
@@ -0,0 +1,211 @@
+"""
+    Safe concurrent and interrupted package mutations. Operations that change a package
+    hold an exclusive lock on ``.astro/lock``, so that processes and threads working on
+    the same package take turns.
+
+    Before an operation changes a file, ``.astro/journal`` records how to restore it: a
+    hard link to the old file in ``.astro/journal.d``, or that it didn't exist. Once the
+    files are final and are about to be committed, the journal records the commit
+    instead. The journal is cleared when the operation completes.
+
+    The next operation that takes the lock after an interrupted process recovers the
+    package from the journal: incomplete changes are rolled back and an incomplete
+    commit is made. Operations that fail with an error are rolled back right away. The
+    journal isn't synced to disk, it doesn't protect against power loss.
+"""
+
+import os, json, shutil, threading
+
+
+class PackageLock:
+    """
+        Reentrant lock of a package, held by one thread of one process at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, on_wait=None):
+        """
+            Acquire the lock, blocking until it's available.
+
+            :param on_wait: Called if the lock is held by another process.
+            :returns: Whether this call took the lock, rather than reentering it.
+        """
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth > 1:
+            return False
+        try:
+            self._file = open(self.path, "a")
+            if not _lock_file(self._file, blocking=False):
+                if on_wait is not None:
+                    on_wait()
+                _lock_file(self._file, blocking=True)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._depth -= 1
+            self._lock.release()
+            raise
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._file)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class Journal:
+    """
+        Undo journal of the operation that holds the package lock.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, ".astro", "journal")
+        self.backup_dir = self.path + ".d"
+        self._entries = None
+        self._written = False
+
+    def read(self):
+        """
+            Return the journal left by an interrupted operation, or ``None``.
+        """
+        try:
+            with open(self.path, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        self._written = True
+        try:
+            return json.loads(content)
+        except ValueError:
+            # Cut short while being written, before any file was changed.
+            return {"restore": {}}
+
+    def protect(self, paths):
+        """
+            Record how to restore ``paths`` before they're changed. Paths that are
+            already protected keep their first recorded state.
+        """
+        if self._entries is None:
+            shutil.rmtree(self.backup_dir, ignore_errors=True)
+            os.makedirs(self.backup_dir)
+            self._entries = {}
+        added = False
+        for path in paths:
+            relpath = os.path.relpath(path, self.root)
+            if relpath in self._entries:
+                continue
+            backup = None
+            if os.path.lexists(path):
+                backup = str(len(self._entries))
+                try:
+                    # Files are replaced rather than written in place, so a hard link
+                    # keeps the old content.
+                    os.link(path, os.path.join(self.backup_dir, backup))
+                except OSError:
+                    shutil.copy2(path, os.path.join(self.backup_dir, backup))
+            self._entries[relpath] = backup
+            added = True
+        if added:
+            self._write({"restore": self._entries})
+
+    def commit(self, paths, message):
+        """
+            Record that the files are final and that ``paths`` are being committed.
+        """
+        self._write({"commit": {"paths": sorted(paths), "message": message}})
+        self._entries = None
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+
+    def rollback(self, entries=None):
+        """
+            Restore the protected files.
+
+            :returns: Whether anything was restored.
+        """
+        entries = self._entries if entries is None else entries
+        for relpath, backup in (entries or {}).items():
+            path = os.path.join(self.root, relpath)
+            if backup is not None:
+                os.replace(os.path.join(self.backup_dir, backup), path)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.discard()
+        return bool(entries)
+
+    def discard(self):
+        """
+            Clear the journal, keeping the files as they are.
+        """
+        self._entries = None
+        if not self._written:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+        self._written = False
+
+    def _write(self, state):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(state))
+        os.replace(tmp_path, self.path)
+        self._written = True
+
+
+if os.name == "nt":
+
+    def _lock_file(f, blocking):
+        import msvcrt
+
+        # Lock the first byte; `LK_LOCK` gives up after 10 seconds, so keep trying.
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                import time
+
+                time.sleep(0.05)
+
+    def _unlock_file(f):
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+else:
+
+    def _lock_file(f, blocking):
+        import fcntl
+
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _unlock_file(f):
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,201 @@
+"""
+    Persistent index of the assets of a package, stored as compact JSON in
+    ``.astro/manifest``. Entries are keyed by asset name and refreshed incrementally:
+    only mod files whose mtime or size changed since the last refresh are read again.
+
+    The interfaces of the mod files, see :meth:`.nmodl.ModScan.interface`, are taken
+    from the same scans and appended by content hash to ``.astro/cache/interfaces``,
+    which only builds read.
+"""
+
+import os, json, hashlib, fnmatch
+from . import nmodl
+from .profiling import instrument
+
+_format_version = 1
+
+
+@instrument("manifest", exclude=("names", "find", "get"))
+class Manifest:
+    def __init__(self, pkg):
+        self.pkg = pkg
+        self.path = os.path.join(pkg.path, ".astro", "manifest")
+        self.interface_path = os.path.join(pkg.path, ".astro", "cache", "interfaces")
+        self._assets = None
+        self._fresh = False
+        self._new_interfaces = {}
+        self.dirty = False
+
+    @property
+    def assets(self):
+        """
+            Mapping of asset names to their manifest entries. Refreshed from disk the
+            first time it's accessed.
+        """
+        if self._assets is None:
+            self.load()
+        if not self._fresh:
+            self.refresh()
+        return self._assets
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        if data.get("version") != _format_version:
+            data = {"assets": {}}
+        self._assets = data["assets"]
+
+    def refresh(self):
+        """
+            Bring the manifest up to date with the ``mod`` directory. Files are only read
+            if their mtime or size changed.
+
+            :returns: The names of the assets that are new or whose content changed,
+              and the entries of the assets whose files are gone.
+            :rtype: tuple
+        """
+        if self._assets is None:
+            self.load()
+        seen = set()
+        changed = []
+        try:
+            entries = list(os.scandir(self.pkg.get_mod_path()))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext != ".mod" or not entry.is_file():
+                continue
+            seen.add(name)
+            stat = entry.stat()
+            known = self._assets.get(name)
+            if (
+                known is None
+                or known["mtime"] != stat.st_mtime_ns
+                or known["size"] != stat.st_size
+            ):
+                with open(entry.path, "rb") as f:
+                    content = f.read()
+                scan = nmodl.scan(content.decode("utf-8", "replace"))
+                digest = hashlib.sha256(content).hexdigest()
+                self._set(name, stat, digest, scan)
+                if known is None or known["hash"] != digest:
+                    changed.append(name)
+        removed = {}
+        for name in set(self._assets) - seen:
+            removed[name] = self._assets.pop(name)
+            self.dirty = True
+        self._fresh = True
+        self.save()
+        return changed, removed
+
+    def expire(self):
+        """
+            Refresh the manifest from disk the next time it's accessed, to pick up
+            changes made by other processes.
+        """
+        self._fresh = False
+
+    def record(self, name, scan):
+        """
+            Record an asset whose file was just written from the lines of ``scan``,
+            without reading it back.
+        """
+        if self._assets is None:
+            self.load()
+        content = "".join(scan.lines).encode("utf-8")
+        stat = os.stat(self.pkg.get_mod_path(name + ".mod"))
+        self._set(name, stat, hashlib.sha256(content).hexdigest(), scan)
+
+    def forget(self, name):
+        if self._assets is None:
+            self.load()
+        if self._assets.pop(name, None) is not None:
+            self.dirty = True
+
+    def _set(self, name, stat, digest, scan):
+        splits = name.split("__")
+        self._assets[name] = {
+            "hash": digest,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "kind": scan.kind,
+            "asset": "__".join(splits[2:-1]),
+            "variant": splits[-1],
+        }
+        self._new_interfaces[digest] = scan.interface()
+        self.dirty = True
+
+    def names(self):
+        return sorted(self.assets)
+
+    def find(self, pattern):
+        """
+            Return the sorted names of the assets that match a glob pattern.
+        """
+        return sorted(fnmatch.filter(self.assets, pattern))
+
+    def get(self, name):
+        return self.assets.get(name)
+
+    def interfaces(self):
+        """
+            Return the interface of every asset, by asset name. Interfaces missing from
+            the cache are scanned, and entries of old content are dropped from it.
+        """
+        cache = {}
+        try:
+            with open(self.interface_path, "r") as f:
+                for line in f:
+                    digest, interface = json.loads(line)
+                    cache[digest] = interface
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            # Skip an entry cut short by an interrupted write, and rewrite the cache.
+            cache[None] = None
+        cache.update(self._new_interfaces)
+        interfaces = {}
+        fresh = {}
+        for name, entry in sorted(self.assets.items()):
+            interface = cache.get(entry["hash"])
+            if interface is None:
+                path = self.pkg.get_mod_path(name + ".mod")
+                interface = nmodl.scan_file(path).interface()
+            interfaces[name] = fresh[entry["hash"]] = interface
+        if fresh.keys() != cache.keys():
+            self._write_interfaces(fresh, "w")
+        self._new_interfaces = {}
+        return interfaces
+
+    def _write_interfaces(self, interfaces, mode):
+        self.pkg.ignore_local_files()
+        os.makedirs(os.path.dirname(self.interface_path), exist_ok=True)
+        lines = [json.dumps([digest, i]) + "\n" for digest, i in interfaces.items()]
+        if mode == "a":
+            with open(self.interface_path, "a") as f:
+                f.writelines(lines)
+        else:
+            tmp_path = self.interface_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.interface_path)
+
+    def save(self):
+        if not self.dirty:
+            return
+        # The manifest holds local mtimes and shouldn't be committed.
+        self.pkg.ignore_local_files()
+        data = {"version": _format_version, "assets": self._assets}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            # `dumps` uses the C encoder, `dump` encodes in Python chunk by chunk.
+            f.write(json.dumps(data, separators=(",", ":"), sort_keys=True))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        if self._new_interfaces:
+            self._write_interfaces(self._new_interfaces, "a")
+            self._new_interfaces = {}
@@ -0,0 +1,268 @@
+"""
+    Single pass scanner for NMODL files. It finds the NEURON block, the name statement
+    of the mechanism, its interface and the COMMENT and VERBATIM regions in one read of
+    the source, so that callers don't have to loop over the lines of a mod file
+    repeatedly.
+"""
+
+import re
+
+NAME_STATEMENTS = ("SUFFIX", "POINT_PROCESS", "ARTIFICIAL_CELL")
+# Statements of the NEURON block that end the variable list of the statement before.
+NEURON_STATEMENTS = NAME_STATEMENTS + (
+    "RANGE",
+    "GLOBAL",
+    "USEION",
+    "NONSPECIFIC_CURRENT",
+    "ELECTRODE_CURRENT",
+    "POINTER",
+    "BBCOREPOINTER",
+    "EXTERNAL",
+    "THREADSAFE",
+    "REPRESENTS",
+)
+
+_token = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[{}]")
+_comment = re.compile(r"[:?]")
+_number = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_valence = re.compile(r"\s*(" + _number + ")")
+_parameter = re.compile(
+    r"([A-Za-z_][A-Za-z0-9_]*)\s*(?:=\s*("
+    + _number
+    + r"))?\s*(?:\(([^)]*)\))?\s*(?:<\s*("
+    + _number
+    + r")\s*,\s*("
+    + _number
+    + r")\s*>)?"
+)
+
+
+class NameStatement:
+    """
+        A ``SUFFIX``, ``POINT_PROCESS`` or ``ARTIFICIAL_CELL`` statement. ``start`` and
+        ``end`` are the column span of the statement on its line.
+    """
+
+    def __init__(self, kind, name, line, start, end):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.start = start
+        self.end = end
+
+
+class ModScan:
+    """
+        Result of scanning an NMODL source.
+
+        :ivar lines: The lines of the source.
+        :ivar neuron_block: Line and column of the opening brace of the first NEURON
+          block, or ``None`` if the source has no NEURON block.
+        :ivar name_statements: The name statements found in NEURON blocks.
+        :ivar regions: ``(keyword, first_line, last_line)`` tuples of the COMMENT and
+          VERBATIM regions.
+        :ivar ranges: The RANGE variables.
+        :ivar globals: The GLOBAL variables.
+        :ivar ions: The read and written variables and the valence of each USEION ion.
+        :ivar nonspecific_currents: The NONSPECIFIC_CURRENT variables.
+        :ivar parameters: The value, units and limits of each PARAMETER, ``None`` where
+          not given.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.neuron_block = None
+        self.name_statements = []
+        self.regions = []
+        self.ranges = []
+        self.globals = []
+        self.ions = {}
+        self.nonspecific_currents = []
+        self.parameters = {}
+
+    @property
+    def kind(self):
+        """
+            The kind of name statement the mechanism requires.
+        """
+        kinds = [statement.kind for statement in self.name_statements]
+        if "POINT_PROCESS" in kinds:
+            return "POINT_PROCESS"
+        elif "ARTIFICIAL_CELL" in kinds:
+            return "ARTIFICIAL_CELL"
+        return "SUFFIX"
+
+    def interface(self):
+        """
+            The interface of the mechanism, as JSON serializable data.
+        """
+        return {
+            "kind": self.kind,
+            "range": self.ranges,
+            "global": self.globals,
+            "ions": self.ions,
+            "nonspecific_current": self.nonspecific_currents,
+            "parameters": self.parameters,
+        }
+
+    def in_region(self, line):
+        return any(start <= line <= end for _, start, end in self.regions)
+
+    def rename(self, name, kind=None):
+        """
+            Return the lines of the source with the name statements replaced by a single
+            name statement for the given name, as first statement of the NEURON block.
+        """
+        kind = kind or self.kind
+        lines = list(self.lines)
+        # Remove the old statements, right to left so that the columns stay valid.
+        removed = set()
+        for statement in sorted(
+            self.name_statements, key=lambda s: (s.line, s.start), reverse=True
+        ):
+            line = lines[statement.line]
+            line = line[: statement.start] + line[statement.end :]
+            if not line.strip():
+                removed.add(statement.line)
+            lines[statement.line] = line
+        insert = kind + " " + name + "\n"
+        if self.neuron_block is not None:
+            i, col = self.neuron_block
+            head, tail = lines[i][: col + 1], lines[i][col + 1 :]
+            if tail.strip():
+                lines[i] = head + "\n" + insert + tail.lstrip()
+            else:
+                lines[i] = head + tail + insert
+        kept = (line for i, line in enumerate(lines) if i not in removed)
+        return "".join(kept).splitlines(True)
+
+
+def scan(source):
+    """
+        Scan an NMODL source.
+
+        :param source: Text or lines of the mod file.
+        :rtype: :class:`ModScan`
+    """
+    if isinstance(source, str):
+        source = source.splitlines(True)
+    result = ModScan(source)
+    region = None
+    depth = 0
+    # Depth of the NEURON block we're in, or None outside of NEURON blocks.
+    neuron_depth = None
+    expect_brace = False
+    statement = None
+    # Variable list that the identifiers of the current NEURON statement belong to.
+    variables = None
+    ion = None
+    naming_ion = False
+    # Depth of the PARAMETER block we're in.
+    parameter_depth = None
+    expect_parameters = False
+    for i, line in enumerate(source):
+        stripped = line.strip()
+        if region is not None:
+            if stripped.upper().startswith("END" + region[0]):
+                result.regions.append((region[0], region[1], i))
+                region = None
+            continue
+        # Strip trailing comments
+        code = _comment.split(line, maxsplit=1)[0]
+        # Column where the code of the PARAMETER block starts on this line.
+        parameter_col = 0 if parameter_depth is not None else None
+        end_col = len(code)
+        for match in _token.finditer(code):
+            token = match.group(0)
+            upper = token.upper()
+            if upper in ("COMMENT", "VERBATIM"):
+                region = (upper, i)
+                end_col = match.start()
+                break
+            if upper == "TITLE" and depth == 0:
+                # The rest of the line is free text.
+                break
+            if statement is not None:
+                kind, line_no, start = statement
+                if line_no == i and token not in "{}":
+                    result.name_statements.append(
+                        NameStatement(kind, token, i, start, match.end())
+                    )
+                    statement = None
+                    continue
+                statement = None
+            if token == "{":
+                if expect_brace:
+                    neuron_depth = depth
+                    if result.neuron_block is None:
+                        result.neuron_block = (i, match.start())
+                    expect_brace = False
+                elif expect_parameters:
+                    parameter_depth = depth
+                    parameter_col = match.end()
+                    expect_parameters = False
+                depth += 1
+            elif token == "}":
+                depth = max(depth - 1, 0)
+                if neuron_depth is not None and depth == neuron_depth:
+                    neuron_depth = None
+                    variables = ion = None
+                elif parameter_depth is not None and depth == parameter_depth:
+                    _scan_parameters(result, code[parameter_col : match.start()])
+                    parameter_depth = parameter_col = None
+            elif upper == "NEURON" and depth == 0:
+                expect_brace = True
+            elif upper == "PARAMETER" and depth == 0:
+                expect_parameters = True
+            elif neuron_depth is not None:
+                if upper in NEURON_STATEMENTS:
+                    variables = ion = None
+                    naming_ion = False
+                if upper in NAME_STATEMENTS:
+                    statement = (upper, i, match.start())
+                elif upper == "RANGE":
+                    variables = result.ranges
+                elif upper == "GLOBAL":
+                    variables = result.globals
+                elif upper == "NONSPECIFIC_CURRENT":
+                    variables = result.nonspecific_currents
+                elif upper == "USEION":
+                    naming_ion = True
+                elif naming_ion:
+                    ion = {"read": [], "write": [], "valence": None}
+                    ion = result.ions.setdefault(token, ion)
+                    naming_ion = False
+                elif ion is not None and upper in ("READ", "WRITE"):
+                    variables = ion[token.lower()]
+                elif ion is not None and upper == "VALENCE":
+                    valence = _valence.match(code, match.end())
+                    if valence is not None:
+                        ion["valence"] = float(valence.group(1))
+                elif variables is not None and token not in variables:
+                    variables.append(token)
+        if parameter_col is not None:
+            _scan_parameters(result, code[parameter_col:end_col])
+        statement = None
+    if region is not None:
+        result.regions.append((region[0], region[1], len(source) - 1))
+    return result
+
+
+def _scan_parameters(result, code):
+    for match in _parameter.finditer(code):
+        name, value, units, low, high = match.groups()
+        result.parameters[name] = {
+            "value": None if value is None else float(value),
+            "units": None if units is None else units.strip(),
+            "limits": None if low is None else [float(low), float(high)],
+        }
+
+
+def scan_file(path):
+    """
+        Read and scan an NMODL file.
+
+        :rtype: :class:`ModScan`
+    """
+    with open(path, "r") as f:
+        return scan(f.readlines())
@@ -0,0 +1,139 @@
+"""
+    Streaming subprocess runner. Both pipes of the child are drained concurrently in
+    large chunks, complete lines are passed to tee callbacks and the tail of the output
+    is captured in memory, up to a limit.
+"""
+
+import os, sys, codecs, threading, subprocess, contextvars
+from .exceptions import CommandTimeoutError
+
+#: Bytes read from a pipe at once.
+CHUNK_SIZE = 64 * 1024
+#: Characters at the end of the output that are captured.
+CAPTURE_LIMIT = 1024 * 1024
+#: Put in front of captured output that lost its beginning.
+TRUNCATION_MARKER = "[... {} characters truncated ...]\n"
+
+
+class CommandResult:
+    """
+        Outcome of a command run by :func:`run_command`.
+    """
+
+    def __init__(self, args, returncode, stdout, stderr):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __bool__(self):
+        return self.returncode == 0
+
+
+def echo_stdout(line):
+    sys.stdout.write(line)
+    sys.stdout.flush()
+
+
+def echo_stderr(line):
+    sys.stderr.write(line)
+    sys.stderr.flush()
+
+
+class _Stream:
+    def __init__(self, pipe, tee, capture_limit):
+        self.pipe = pipe
+        self.tee = tee
+        self.capture_limit = capture_limit
+        self.chunks = []
+        self.size = 0
+        self.truncated = 0
+        # Run in the context of the caller, so that the tee writes where its output
+        # goes, see `.serve`.
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(target=context.run, args=(self._drain,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _drain(self):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        fd = self.pipe.fileno()
+        partial = ""
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            text = decoder.decode(chunk, final=not chunk)
+            self._capture(text)
+            if self.tee is not None:
+                lines = (partial + text).split("\n")
+                partial = lines.pop()
+                for line in lines:
+                    self.tee(line + "\n")
+            if not chunk:
+                break
+        if self.tee is not None and partial:
+            self.tee(partial)
+        self.pipe.close()
+
+    def _capture(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        # Trimmed once it's twice the limit, so that each character is copied at most
+        # a few times.
+        if self.size > 2 * self.capture_limit:
+            excess = self.size - self.capture_limit
+            tail = "".join(self.chunks)[excess:]
+            self.truncated += excess
+            self.chunks, self.size = [tail], len(tail)
+
+    def read(self):
+        self.thread.join()
+        content = "".join(self.chunks)
+        excess = max(0, len(content) - self.capture_limit)
+        if self.truncated or excess:
+            content = TRUNCATION_MARKER.format(self.truncated + excess) + content[excess:]
+        return content
+
+
+def run_command(
+    cmnd,
+    cwd=None,
+    env=None,
+    timeout=None,
+    on_stdout=echo_stdout,
+    on_stderr=None,
+    capture_limit=CAPTURE_LIMIT,
+):
+    """
+        Run a command, streaming its output.
+
+        :param cmnd: Command and arguments.
+        :param cwd: Working directory of the command. The working directory of this
+          process is never changed.
+        :param timeout: Seconds after which the command is killed and
+          :class:`~.exceptions.CommandTimeoutError` is raised.
+        :param on_stdout: Called with each line the command writes to stdout. Echoes
+          to ``sys.stdout`` by default, ``None`` to disable.
+        :param on_stderr: Called with each line the command writes to stderr.
+        :param capture_limit: Characters at the end of each stream that are captured in
+          the result. Output before them is replaced by :data:`TRUNCATION_MARKER`.
+        :rtype: :class:`CommandResult`
+    """
+    from .profiling import span
+
+    label = os.path.basename(str(cmnd[0]))
+    with span(label, "process", argv=[str(arg) for arg in cmnd]):
+        process = subprocess.Popen(
+            cmnd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        out = _Stream(process.stdout, on_stdout, capture_limit)
+        err = _Stream(process.stderr, on_stderr, capture_limit)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            out.read(), err.read()
+            raise CommandTimeoutError(
+                "`{}` did not finish within {} seconds.".format(" ".join(cmnd), timeout)
+            ) from None
+        return CommandResult(cmnd, process.returncode, out.read(), err.read())
@@ -0,0 +1,229 @@
+"""
+    Timing instrumentation. Operations of packages, mods, writers and backends are timed
+    as spans and every started process is counted, once profiling is enabled with
+    ``astro --profile`` or the ``ASTRO_PROFILE`` environment variable. The spans are
+    written as a Chrome trace, to open in ``chrome://tracing`` or Perfetto, along with a
+    text summary of the slowest spans and the started processes. Processes are counted
+    with an audit hook from Python 3.8; before that, only the commands run with
+    :func:`.process.run_command` are counted.
+
+    Instrumentation costs a single check per call while profiling is disabled.
+"""
+
+import os, sys, time, json, types, threading, functools, contextlib
+
+DEFAULT_TRACE = "astro-trace.json"
+# `inspect.CO_GENERATOR`, without importing `inspect` at startup.
+_CO_GENERATOR = 0x20
+
+_profiler = None
+_hooked = False
+
+
+class Profiler:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.events = []
+        self.processes = {}
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def spawned(self, executable):
+        name = os.path.basename(executable)
+        event = {
+            "name": "spawn " + name,
+            "cat": "spawn",
+            "ph": "i",
+            "s": "t",
+            "ts": (time.perf_counter() - self.origin) * 1e6,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        with self._lock:
+            self.processes[name] = self.processes.get(name, 0) + 1
+            self.events.append(event)
+
+    def summary(self, top=15):
+        """
+            Return a text summary of the spans with the most total time, the slowest
+            single spans and the started processes.
+        """
+        totals = {}
+        spans = [e for e in self.events if e["ph"] == "X"]
+        for event in spans:
+            count, total, longest = totals.get(event["name"], (0, 0, 0))
+            totals[event["name"]] = (
+                count + 1,
+                total + event["dur"],
+                max(longest, event["dur"]),
+            )
+        lines = ["Spans by total time:"]
+        lines.append(
+            "{:>10} {:>10} {:>7}  {}".format("total ms", "max ms", "calls", "span")
+        )
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (count, total, longest) in ranked[:top]:
+            lines.append(
+                "{:>10.1f} {:>10.1f} {:>7}  {}".format(
+                    total / 1e3, longest / 1e3, count, name
+                )
+            )
+        lines.append("")
+        lines.append("Slowest spans:")
+        for event in sorted(spans, key=lambda e: e["dur"], reverse=True)[:top]:
+            lines.append("{:>10.1f}  {}".format(event["dur"] / 1e3, event["name"]))
+        lines.append("")
+        processes = self.processes
+        if not hasattr(sys, "addaudithook"):
+            # Without audit hooks only the commands of `run_command` are counted, from
+            # their spans.
+            processes = {}
+            for event in spans:
+                if event["cat"] == "process":
+                    processes[event["name"]] = processes.get(event["name"], 0) + 1
+        lines.append("Processes started: {}".format(sum(processes.values())))
+        for name, n in sorted(processes.items(), key=lambda item: -item[1]):
+            lines.append("{:>10}  {}".format(n, name))
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+            Write the Chrome trace and, next to it, the text summary.
+
+            :returns: The text summary.
+        """
+        trace = {"traceEvents": self.events, "displayTimeUnit": "ms"}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(trace, f)
+        os.replace(tmp_path, self.path)
+        summary = self.summary()
+        with open(os.path.splitext(self.path)[0] + ".txt", "w") as f:
+            f.write(summary)
+        return summary
+
+
+def enable(path=None):
+    """
+        Start profiling into the trace file at ``path``. Defaults to the path in
+        ``ASTRO_PROFILE``, unless it is ``1``, or ``astro-trace.json``.
+
+        :rtype: :class:`Profiler`
+    """
+    global _profiler, _hooked
+
+    env = os.getenv("ASTRO_PROFILE")
+    path = path or (env if env and env != "1" else DEFAULT_TRACE)
+    _profiler = Profiler(path)
+    if not _hooked and hasattr(sys, "addaudithook"):
+        # Audit hooks can't be removed, so the hook checks whether profiling is on.
+        sys.addaudithook(_audit)
+        _hooked = True
+    return _profiler
+
+
+def finish():
+    """
+        Stop profiling and write the trace.
+
+        :returns: The text summary, or ``None`` if profiling wasn't enabled.
+    """
+    global _profiler
+
+    if _profiler is None:
+        return None
+    profiler, _profiler = _profiler, None
+    return profiler.write()
+
+
+def enabled():
+    return _profiler is not None
+
+
+def _audit(event, args):
+    if event == "subprocess.Popen" and _profiler is not None:
+        executable, argv = args[0], args[1]
+        if not executable:
+            argv = [argv] if isinstance(argv, (str, bytes)) else list(argv)
+            executable = argv[0] if argv else "?"
+        _profiler.spawned(os.fsdecode(executable))
+
+
+@contextlib.contextmanager
+def span(name, category="astro", **args):
+    """
+        Time the code inside of the context as a span.
+    """
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler = _profiler
+        if profiler is not None:
+            profiler.add(name, category, start, time.perf_counter(), args)
+
+
+def profiled(name=None, category="astro"):
+    """
+        Decorator that times each call of a function as a span.
+    """
+
+    def decorator(f):
+        label = name or f.__qualname__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return f(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profiler = _profiler
+                if profiler is not None:
+                    profiler.add(label, category, start, time.perf_counter())
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(category="astro", exclude=()):
+    """
+        Class decorator that times the calls of the public methods and the constructor
+        of a class. Generator functions are left alone, as only their creation would be
+        timed.
+    """
+
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if not isinstance(attr, types.FunctionType) or name in exclude:
+                continue
+            if name.startswith("_") and name != "__init__":
+                continue
+            if attr.__code__.co_flags & _CO_GENERATOR or hasattr(attr, "__wrapped__"):
+                continue
+            label = "{}.{}".format(cls.__name__, name)
+            setattr(cls, name, profiled(label, category)(attr))
+        return cls
+
+    return decorator
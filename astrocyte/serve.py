@@ -0,0 +1,502 @@
+"""
+    Package daemon. ``astro serve`` keeps packages loaded between commands: their
+    manifest, parsed ``__init__.py`` and version control backend stay in memory, so that
+    commands skip the startup, imports and manifest loading of a fresh ``astro`` process.
+
+    Commands are JSON-RPC 2.0 requests, one per line, sent over a Unix domain socket.
+    Every request names the package it's for by its ``path``. Requests for the same
+    package run one at a time, also with ``astro`` processes that bypass the daemon;
+    requests for different packages run concurrently. The output that a command prints
+    is returned in the ``output`` of its result, or of the ``data`` of its error.
+
+    The ``astro`` CLI forwards ``add mod``, ``edit``, ``rm mod``, ``build``,
+    ``install``, ``uninstall`` and ``commit`` to the daemon while it's running, unless
+    they're given ``--no-daemon`` or ``ASTRO_NO_DAEMON`` is set. Requests can name the
+    ``interpreter`` they're for, as the ``[executable, prefix]`` of its ``sys``. The
+    daemon refuses them if it runs another one, because it builds and installs with
+    its own interpreter; the CLI then runs the command itself.
+
+    The socket is at ``ASTRO_SOCKET``, or else ``astro-<uid>.sock`` in
+    ``XDG_RUNTIME_DIR``, or ``astro.sock`` in the private ``/tmp/astro-<uid>`` folder.
+    Only sockets of the current user are connected to or replaced, and only its own
+    processes can connect to them.
+"""
+
+import os, sys, stat, json, argparse, threading, traceback, contextvars, socketserver
+from . import exceptions, get_package
+from .exceptions import AstroError
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Error code of the errors that Astrocyte raises, such as a mod file that isn't found.
+ASTRO_ERROR = 1
+# Error code of requests for another interpreter than the daemon's.
+INTERPRETER_MISMATCH = 2
+
+
+def get_socket_path():
+    """
+        Return the path of the daemon socket, or ``None`` on platforms without Unix
+        domain sockets.
+    """
+    path = os.getenv("ASTRO_SOCKET")
+    if path:
+        return path
+    if os.name != "posix":
+        return None
+    folder = os.getenv("XDG_RUNTIME_DIR")
+    if folder:
+        return os.path.join(folder, "astro-{}.sock".format(os.getuid()))
+    # `/tmp` is shared, so the socket goes in a folder that only we can enter.
+    return os.path.join(_get_private_folder(), "astro.sock")
+
+
+def _get_private_folder():
+    return os.path.join("/tmp", "astro-{}".format(os.getuid()))
+
+
+def _check_private_folder(folder, create=False):
+    if create:
+        try:
+            os.mkdir(folder, 0o700)
+        except FileExistsError:
+            pass
+    try:
+        info = os.lstat(folder)
+    except FileNotFoundError:
+        return False
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or stat.S_IMODE(info.st_mode) & 0o077
+    ):
+        raise AstroError(
+            "Refusing to use '{}', it isn't a private folder of the current user.".format(
+                folder
+            )
+        )
+    return True
+
+
+def _check_socket(path):
+    """
+        Check that ``path`` is a socket of the current user, so that commands aren't
+        sent to the daemon of someone else, and that only stale sockets are replaced.
+
+        :returns: Whether the socket exists.
+        :raises: :class:`~.exceptions.AstroError` if something else is at ``path``.
+    """
+    if os.path.dirname(path) == _get_private_folder():
+        if not _check_private_folder(os.path.dirname(path)):
+            return False
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise AstroError(
+            "Refusing to use '{}', it isn't a socket of the current user.".format(path)
+        )
+    return True
+
+
+def get_interpreter():
+    """
+        Return the interpreter that requests from this process are for.
+    """
+    return [sys.executable, sys.prefix]
+
+
+def connect(path=None):
+    """
+        Connect to the daemon.
+
+        :returns: A client, or ``None`` if no daemon is listening.
+        :rtype: :class:`Client`
+        :raises: :class:`~.exceptions.AstroError` if the path isn't a socket of the
+          current user.
+    """
+    path = path or get_socket_path()
+    if path is None or not _check_socket(path):
+        return None
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Left behind by a daemon that was killed.
+        sock.close()
+        return None
+    return Client(sock)
+
+
+class Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile("rwb")
+        self._id = 0
+
+    def call(self, method, params=None, output=None):
+        """
+            Send a request and wait for its response.
+
+            :param output: Stream to write the output of the command to, also when it
+              fails.
+            :returns: The result of the request.
+            :raises: The :class:`~.exceptions.AstroError` that the command raised.
+        """
+        self._id += 1
+        request = {"jsonrpc": "2.0", "id": self._id, "method": method}
+        if params is not None:
+            request["params"] = params
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise AstroError("The astro daemon closed the connection.")
+        response = json.loads(line)
+        error = response.get("error")
+        if error is None:
+            result = response["result"]
+            if output is not None and isinstance(result, dict):
+                output.write(result.get("output", ""))
+            return result
+        data = error.get("data") or {}
+        if output is not None:
+            output.write(data.get("output", ""))
+        error_type = getattr(exceptions, data.get("type", ""), None)
+        if not isinstance(error_type, type) or not issubclass(error_type, AstroError):
+            error_type = AstroError
+        raise error_type(error["message"])
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Output of the request that is being handled. A context variable rather than a
+# thread local, so that the threads that relay the output of external commands, which
+# run in a copy of the context that starts them, write into it as well.
+_request_output = contextvars.ContextVar("request_output", default=None)
+
+
+class _Output:
+    """
+        Stand-in for ``sys.stdout`` and ``sys.stderr`` that collects what the commands
+        print in the output of the request that is being handled.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def capture(self):
+        buffer = []
+        _request_output.set(buffer)
+        return buffer
+
+    def release(self):
+        _request_output.set(None)
+
+    def write(self, text):
+        buffer = _request_output.get()
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _Entry:
+    """
+        A package kept loaded by the daemon, and the lock that its commands hold.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pkg = None
+        self._key = None
+
+    def load(self):
+        """
+            Return the loaded package, reloaded if its package data changed. Its
+            version and manifest are checked against the disk, for changes made
+            without the daemon.
+        """
+        try:
+            stat = os.stat(os.path.join(self.path, ".astro", "pkg"))
+        except FileNotFoundError:
+            self.pkg = None
+            raise AstroError("{} is not a glia package.".format(self.path)) from None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self.pkg is None or key != self._key:
+            self.pkg = get_package(self.path)
+            self._key = key
+        else:
+            self.pkg.set_path(self.path)
+            self.pkg.manifest.expire()
+        return self.pkg
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Daemon that runs the commands of the ``astro`` CLI on the packages it keeps
+        loaded.
+
+        :param path: Path of the socket to listen on, see :func:`get_socket_path`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=None):
+        path = path or get_socket_path()
+        if path is None:
+            raise AstroError("`astro serve` needs Unix domain sockets.")
+        client = connect(path)
+        if client is not None:
+            client.close()
+            raise AstroError("An astro daemon is already listening on " + path)
+        if os.path.dirname(path) == _get_private_folder():
+            _check_private_folder(os.path.dirname(path), create=True)
+        if _check_socket(path):
+            # Left behind by a daemon that was killed.
+            os.remove(path)
+        self.path = os.path.abspath(path)
+        self.packages = {}
+        self.interpreter = get_interpreter()
+        self._lock = threading.Lock()
+        self._output = None
+        super().__init__(self.path, _Handler)
+
+    def server_bind(self):
+        # Created without permissions for others, instead of changing them after it's
+        # already accepting connections.
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self, poll_interval=0.5):
+        # Commands print, so stdout and stderr are swapped for capturing streams while
+        # serving.
+        stdout, stderr = sys.stdout, sys.stderr
+        self._output = sys.stdout = _Output(stdout)
+        sys.stderr = _Output(stderr)
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            self._output = None
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def checkout(self, path):
+        """
+            Return the entry of the package at ``path``.
+        """
+        path = os.path.realpath(path)
+        with self._lock:
+            entry = self.packages.get(path)
+            if entry is None:
+                entry = self.packages[path] = _Entry(path)
+        return entry
+
+    def handle_request_line(self, line):
+        """
+            Handle a single JSON-RPC request.
+
+            :returns: The response, or ``None`` for notifications.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return _error(None, PARSE_ERROR, "Parse error: " + str(e))
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, INVALID_REQUEST, "Invalid request.")
+        id = request.get("id")
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            return _error(id, INVALID_PARAMS, "Params must be an object.")
+        interpreter = params.pop("interpreter", None)
+        if interpreter is not None and interpreter != self.interpreter:
+            message = "The astro daemon runs in {}, not in {}.".format(
+                self.interpreter[1], interpreter[1]
+            )
+            data = {"type": "InterpreterMismatchError"}
+            response = _error(id, INTERPRETER_MISMATCH, message, data)
+            return None if "id" not in request else response
+        method = getattr(self, "rpc_" + request["method"], None)
+        if method is None:
+            response = _error(id, METHOD_NOT_FOUND, "Unknown method.")
+        else:
+            response = self._call(id, method, params)
+        return None if "id" not in request else response
+
+    def _call(self, id, method, params):
+        buffer = self._output.capture() if self._output is not None else []
+        try:
+            result = method(**params)
+        except AstroError as e:
+            data = {"type": type(e).__name__, "output": "".join(buffer)}
+            return _error(id, ASTRO_ERROR, str(e), data)
+        except Exception as e:
+            if isinstance(e, TypeError) and e.__traceback__.tb_next is None:
+                # Raised by the call itself, not by the code that runs in it.
+                return _error(id, INVALID_PARAMS, str(e))
+            # For the log of the daemon, not for the client.
+            traceback.print_exc(file=getattr(sys.stderr, "stream", sys.stderr))
+            data = {"type": type(e).__name__, "output": "".join(buffer)}
+            return _error(id, INTERNAL_ERROR, str(e), data)
+        finally:
+            if self._output is not None:
+                self._output.release()
+        if result is None:
+            result = {}
+        result["output"] = "".join(buffer)
+        return {"jsonrpc": "2.0", "id": id, "result": result}
+
+    def run(self, path, handler, no_commit=False, **options):
+        """
+            Run the CLI ``handler`` on the package at ``path``, while holding its lock.
+        """
+        entry = self.checkout(path)
+        with entry.lock:
+            pkg = entry.load()
+            pkg.defer_commits = no_commit
+            handler(argparse.Namespace(pkg=pkg, local=False, **options))
+
+    def rpc_ping(self):
+        return {"pid": os.getpid(), "packages": sorted(self.packages)}
+
+    def rpc_shutdown(self):
+        # `shutdown` waits for `serve_forever` to return, which waits for this request.
+        threading.Thread(target=self.shutdown).start()
+
+    def rpc_add(self, path, files, name=None, variant="0", jobs=1, no_commit=False):
+        from .cli import add_mod_file
+
+        options = {"files": files, "name": name, "variant": variant, "jobs": jobs}
+        self.run(path, add_mod_file, no_commit, **options)
+
+    def rpc_edit(
+        self,
+        path,
+        asset,
+        name=None,
+        variant=None,
+        all_matches=False,
+        regex=False,
+        dry_run=False,
+        no_commit=False,
+    ):
+        from .cli import edit_mod_file
+
+        options = {
+            "asset": asset,
+            "name": name,
+            "variant": variant,
+            "all_matches": all_matches,
+            "regex": regex,
+            "dry_run": dry_run,
+        }
+        self.run(path, edit_mod_file, no_commit, **options)
+
+    def rpc_candidates(self, path, name):
+        entry = self.checkout(path)
+        with entry.lock:
+            return {"candidates": entry.load().get_mod_candidates(name)}
+
+    def rpc_rm(self, path, name, confirmed=None, no_commit=False):
+        """
+            Remove the assets matching ``name``. When ``confirmed`` is given, nothing is
+            removed unless those are exactly the assets that match.
+        """
+        from .cli import remove_mod_file
+
+        entry = self.checkout(path)
+        with entry.lock:
+            pkg = entry.load()
+            with pkg.lock():
+                candidates = pkg.get_mod_candidates(name)
+                if confirmed is not None and candidates != confirmed:
+                    raise AstroError("The assets matching '{}' changed.".format(name))
+                pkg.defer_commits = no_commit
+                args = argparse.Namespace(pkg=pkg, local=False, name=name, force=True)
+                remove_mod_file(args)
+
+    def rpc_build(
+        self,
+        path,
+        force=False,
+        backend=None,
+        check=False,
+        compiler=None,
+        install=False,
+        no_commit=False,
+    ):
+        from .cli import build_package
+
+        options = {
+            "force": force,
+            "backend": backend,
+            "check": check,
+            "compiler": compiler,
+            "install": install,
+            "upload": False,
+            "all": False,
+        }
+        self.run(path, build_package, no_commit, **options)
+
+    def rpc_install(self, path, backend=None):
+        from .cli import install_package
+
+        self.run(path, install_package, backend=backend, all=False)
+
+    def rpc_uninstall(self, path, backend=None):
+        from .cli import uninstall_package
+
+        self.run(path, uninstall_package, backend=backend)
+
+    def rpc_commit(self, path, message=None):
+        from .cli import commit_package
+
+        self.run(path, commit_package, message=message)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.handle_request_line(line)
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+
+
+def _error(id, code, message, data=None):
+    error = {"code": code, "message": message}
+    if data is not None:
+        error["data"] = data
+    return {"jsonrpc": "2.0", "id": id, "error": error}
@@ -0,0 +1,233 @@
+"""
+    Uploader speaking the legacy PyPI upload protocol over a pooled
+    :class:`requests.Session`, so that uploading many files or packages reuses the same
+    connections. Credentials and the repository are taken from the arguments, from the
+    ``TWINE_USERNAME``, ``TWINE_PASSWORD`` and ``TWINE_REPOSITORY_URL`` environment
+    variables, or from the ``[pypi]`` section of ``~/.pypirc``.
+"""
+
+import os, time, hashlib, zipfile
+from .exceptions import (
+    UploadError,
+    InvalidDistributionError,
+    InvalidMetaError,
+    AuthenticationError,
+    RepositoryError,
+)
+from .profiling import instrument
+
+DEFAULT_REPOSITORY = "https://upload.pypi.org/legacy/"
+#: JSON API of the indexes behind known upload URLs, used to skip existing releases.
+KNOWN_INDEXES = {
+    "https://upload.pypi.org/legacy/": "https://pypi.org/pypi",
+    "https://test.pypi.org/legacy/": "https://test.pypi.org/pypi",
+}
+#: Responses worth retrying: rate limits and server errors.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+#: Seconds to wait for a connection, and for the response to a request.
+DEFAULT_TIMEOUT = (10, 60)
+
+_uploaders = {}
+
+
+def read_pypirc(path=None):
+    """
+        Return the ``[pypi]`` settings of a ``.pypirc`` file.
+    """
+    import configparser
+
+    path = path or os.path.join(os.path.expanduser("~"), ".pypirc")
+    parser = configparser.RawConfigParser()
+    parser.read(path)
+    return dict(parser["pypi"]) if parser.has_section("pypi") else {}
+
+
+def read_metadata(path):
+    """
+        Return the fields of the legacy upload form for a wheel, read from its
+        ``METADATA`` file.
+    """
+    from email.parser import HeaderParser
+
+    try:
+        with zipfile.ZipFile(path) as wheel:
+            name = next(n for n in wheel.namelist() if n.endswith(".dist-info/METADATA"))
+            content = wheel.read(name).decode("utf-8")
+    except (OSError, zipfile.BadZipFile, StopIteration):
+        raise InvalidDistributionError("'{}' is not a valid wheel.".format(path))
+    meta = HeaderParser().parsestr(content)
+    if not meta["Name"] or not meta["Version"]:
+        raise InvalidMetaError(
+            "The metadata of '{}' has no name or version.".format(path)
+        )
+    return {
+        "metadata_version": meta["Metadata-Version"],
+        "name": meta["Name"],
+        "version": meta["Version"],
+        "summary": meta["Summary"],
+        "home_page": meta["Home-page"],
+        "author": meta["Author"],
+        "author_email": meta["Author-email"],
+        "license": meta["License"],
+        "description": meta.get_payload(),
+        "description_content_type": meta["Description-Content-Type"],
+        "classifiers": meta.get_all("Classifier", []),
+        "requires_dist": meta.get_all("Requires-Dist", []),
+        "filetype": "bdist_wheel",
+        "pyversion": os.path.basename(path).split("-")[-3],
+    }
+
+
+def get_uploader(**options):
+    """
+        Return an uploader for these options, reusing the one made earlier in this
+        process so that its connections are reused.
+    """
+    key = tuple(sorted(options.items()))
+    if key not in _uploaders:
+        _uploaders[key] = Uploader(**options)
+    return _uploaders[key]
+
+
+@instrument("upload", exclude=("close",))
+class Uploader:
+    def __init__(
+        self,
+        repository_url=None,
+        username=None,
+        password=None,
+        index_url=None,
+        skip_existing=True,
+        retries=3,
+        backoff=1.0,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        pypirc = read_pypirc()
+        self.repository_url = (
+            repository_url
+            or os.getenv("TWINE_REPOSITORY_URL")
+            or pypirc.get("repository")
+            or DEFAULT_REPOSITORY
+        )
+        self.username = username or os.getenv("TWINE_USERNAME") or pypirc.get("username")
+        self.password = password or os.getenv("TWINE_PASSWORD") or pypirc.get("password")
+        self.index_url = index_url or KNOWN_INDEXES.get(self.repository_url)
+        self.skip_existing = skip_existing
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if self.username is not None:
+                session.auth = (self.username, self.password or "")
+            session.headers["User-Agent"] = "astrocyte"
+            self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def exists(self, name, version):
+        """
+            Check the JSON API of the index for a release. Always ``False`` when the
+            index of the repository is unknown.
+        """
+        if self.index_url is None:
+            return False
+        url = "{}/{}/{}/json".format(self.index_url.rstrip("/"), name, version)
+        response = self._request("GET", url)
+        return response.status_code == 200
+
+    def upload(self, paths, report=print):
+        """
+            Upload wheels, skipping releases that already exist on the index.
+
+            :param report: Called with the messages about skipped files.
+
+            :returns: The uploaded paths.
+            :rtype: list
+        """
+        if not paths:
+            raise InvalidDistributionError("No distributions to upload.")
+        uploaded = []
+        checked = {}
+        for path in paths:
+            fields = read_metadata(path)
+            release = (fields["name"], fields["version"])
+            if self.skip_existing:
+                if release not in checked:
+                    checked[release] = self.exists(*release)
+                if checked[release]:
+                    report("Skipping", os.path.basename(path), "(already exists)")
+                    continue
+            if self.upload_file(path, fields, report):
+                uploaded.append(path)
+        return uploaded
+
+    def upload_file(self, path, fields, report=print):
+        """
+            Upload one file with the given form fields.
+
+            :returns: ``False`` if the file already existed and was skipped.
+        """
+        with open(path, "rb") as f:
+            content = f.read()
+        data = [(":action", "file_upload"), ("protocol_version", "1")]
+        data.append(("md5_digest", hashlib.md5(content).hexdigest()))
+        data.append(("sha256_digest", hashlib.sha256(content).hexdigest()))
+        data.append(
+            ("blake2_256_digest", hashlib.blake2b(content, digest_size=32).hexdigest())
+        )
+        for key, value in fields.items():
+            values = value if isinstance(value, list) else [value]
+            data.extend((key, v) for v in values if v is not None)
+        files = {"content": (os.path.basename(path), content, "application/octet-stream")}
+        response = self._request("POST", self.repository_url, data=data, files=files)
+        if response.status_code < 300:
+            return True
+        reason = "{} {}".format(response.status_code, response.reason)
+        if response.status_code in (401, 403):
+            raise AuthenticationError(
+                "Could not authenticate to {}: {}".format(self.repository_url, reason)
+            )
+        if response.status_code in (400, 409) and "already exist" in response.reason:
+            if self.skip_existing:
+                report("Skipping", os.path.basename(path), "(already exists)")
+                return False
+        if response.status_code == 400:
+            raise InvalidMetaError(
+                "{} was rejected: {}".format(os.path.basename(path), reason)
+            )
+        raise RepositoryError(
+            "Could not upload {}: {}".format(os.path.basename(path), reason),
+            response.status_code,
+        )
+
+    def _request(self, method, url, **kwargs):
+        import requests
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise UploadError("Could not connect to {}: {}".format(url, e))
+            else:
+                if response.status_code not in RETRY_STATUS or last:
+                    return response
+            time.sleep(self.backoff * 2 ** attempt)
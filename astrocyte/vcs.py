@@ -0,0 +1,311 @@
+"""
+    Version control backends of packages. Every backend creates the repository of a new
+    package and commits the paths Astrocyte touched:
+
+    * ``gitpython``: Commits through GitPython, which runs ``git`` commands.
+    * ``direct``: Writes the git objects, index and refs directly, without running any
+      process. Files are committed as they are on disk: gitattributes filters and line
+      ending conversion are not applied.
+    * ``none``: Doesn't keep any history, for throwaway packages.
+
+    The backend is chosen by the ``ASTRO_VCS`` environment variable, or else the ``vcs``
+    key of the package data, and defaults to ``gitpython``.
+"""
+
+import os, time, zlib, struct, hashlib
+from .exceptions import AstroError
+from .profiling import instrument
+
+DEFAULT_BACKEND = "gitpython"
+_chunk_size = 1000
+
+
+def get_backend_name(pkg_data=None):
+    return os.getenv("ASTRO_VCS") or (pkg_data or {}).get("vcs") or DEFAULT_BACKEND
+
+
+def get_backend(path, name=None):
+    """
+        Return the backend called ``name`` for the repository at ``path``.
+    """
+    name = name or get_backend_name()
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise AstroError(
+            "Unknown VCS backend '{}', choose from: {}".format(name, ", ".join(BACKENDS))
+        ) from None
+    return backend(path)
+
+
+@instrument("vcs")
+class GitPythonBackend:
+    def __init__(self, path):
+        self.path = path
+        self._repo = None
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            from git import Repo
+
+            self._repo = Repo(self.path)
+        return self._repo
+
+    def init(self):
+        from git import Repo
+
+        self._repo = Repo.init(self.path)
+
+    def commit(self, paths, message, author, email):
+        """
+            Stage ``paths``, relative to the repository, and commit them.
+        """
+        from git import Actor
+
+        # Stage only the given paths, so that git doesn't scan the whole tree.
+        existing = sorted(p for p in paths if os.path.exists(os.path.join(self.path, p)))
+        missing = sorted(set(paths).difference(existing))
+        # Chunk the paths to stay under the argument length limit of the OS.
+        for i in range(0, len(existing), _chunk_size):
+            self.repo.git.add("--", *existing[i : i + _chunk_size])
+        for i in range(0, len(missing), _chunk_size):
+            chunk = missing[i : i + _chunk_size]
+            self.repo.git.rm("--cached", "--ignore-unmatch", "-q", "--", *chunk)
+        actor = Actor(author, email)
+        self.repo.index.commit(message, author=actor, committer=actor)
+
+
+class NoneBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def init(self):
+        pass
+
+    def commit(self, paths, message, author, email):
+        pass
+
+
+class _IndexEntry:
+    def __init__(self, path, sha, mode, stat_fields):
+        self.path = path
+        self.sha = sha
+        self.mode = mode
+        self.stat_fields = stat_fields
+
+
+@instrument("vcs", exclude=("write_object",))
+class DirectBackend:
+    """
+        Writes loose objects, a version 2 index and the branch ref of a git repository
+        without running git.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.git_dir = os.path.join(path, ".git")
+        if os.path.isfile(self.git_dir):
+            # Worktrees and submodules point to their git directory.
+            with open(self.git_dir, "r") as f:
+                target = f.read().strip()[len("gitdir: ") :]
+            self.git_dir = os.path.normpath(os.path.join(path, target))
+
+    def init(self):
+        for folder in ("objects", "refs/heads", "refs/tags"):
+            os.makedirs(os.path.join(self.git_dir, folder), exist_ok=True)
+        head = os.path.join(self.git_dir, "HEAD")
+        if not os.path.exists(head):
+            _write(head, b"ref: refs/heads/master\n")
+            _write(
+                os.path.join(self.git_dir, "config"),
+                b"[core]\n\trepositoryformatversion = 0\n\tfilemode = true\n"
+                + b"\tbare = false\n\tlogallrefupdates = true\n",
+            )
+
+    def commit(self, paths, message, author, email):
+        """
+            Stage ``paths``, relative to the repository, and commit them.
+        """
+        entries = self.read_index()
+        for path in paths:
+            key = path.replace(os.sep, "/").encode()
+            full_path = os.path.join(self.path, path)
+            try:
+                stat = os.lstat(full_path)
+            except FileNotFoundError:
+                entries.pop(key, None)
+                continue
+            if os.path.islink(full_path):
+                data = os.readlink(full_path).encode()
+                mode = 0o120000
+            else:
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                mode = 0o100755 if stat.st_mode & 0o100 else 0o100644
+            sha = self.write_object(b"blob", data)
+            entries[key] = _IndexEntry(key, sha, mode, _stat_fields(stat))
+        self.write_index(entries)
+        tree = self.write_tree(entries)
+        ref, parent = self.read_head()
+        signature = "{} <{}> {} {}".format(author, email, int(time.time()), _timezone())
+        lines = ["tree " + tree.hex()]
+        if parent is not None:
+            lines.append("parent " + parent)
+        lines.append("author " + signature)
+        lines.append("committer " + signature)
+        body = ("\n".join(lines) + "\n\n" + message).encode("utf-8")
+        sha = self.write_object(b"commit", body).hex()
+        _write(os.path.join(self.git_dir, ref), (sha + "\n").encode())
+        return sha
+
+    def write_object(self, kind, data):
+        """
+            Write a loose object, unless it exists.
+
+            :returns: The binary SHA-1 of the object.
+        """
+        content = kind + b" " + str(len(data)).encode() + b"\0" + data
+        sha = hashlib.sha1(content).digest()
+        hexsha = sha.hex()
+        path = os.path.join(self.git_dir, "objects", hexsha[:2], hexsha[2:])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write(path, zlib.compress(content, 1))
+        return sha
+
+    def write_tree(self, entries):
+        """
+            Write the trees of the index entries.
+
+            :returns: The binary SHA-1 of the root tree.
+        """
+        root = {}
+        for key, entry in entries.items():
+            *folders, name = key.split(b"/")
+            node = root
+            for folder in folders:
+                node = node.setdefault(folder, {})
+            node[name] = entry
+        return self._write_node(root)
+
+    def _write_node(self, node):
+        items = []
+        for name, child in node.items():
+            if isinstance(child, dict):
+                # Git sorts folders as if their name ended with a slash.
+                items.append((name + b"/", b"40000 " + name, self._write_node(child)))
+            else:
+                mode = "{:o}".format(child.mode).encode()
+                items.append((name, mode + b" " + name, child.sha))
+        data = b"".join(entry + b"\0" + sha for _, entry, sha in sorted(items))
+        return self.write_object(b"tree", data)
+
+    def read_head(self):
+        """
+            Return the ref that HEAD points to and the commit it points to, or ``None``
+            for an unborn branch.
+        """
+        with open(os.path.join(self.git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            raise AstroError("Can't commit on a detached HEAD, check out a branch.")
+        ref = head[len("ref: ") :]
+        try:
+            with open(os.path.join(self.git_dir, ref), "r") as f:
+                return ref, f.read().strip()
+        except FileNotFoundError:
+            pass
+        try:
+            with open(os.path.join(self.git_dir, "packed-refs"), "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref:
+                        return ref, parts[0]
+        except FileNotFoundError:
+            pass
+        return ref, None
+
+    def read_index(self):
+        """
+            Return the entries of the index by path. Extensions are dropped: git
+            rebuilds them when it needs them.
+        """
+        try:
+            with open(os.path.join(self.git_dir, "index"), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        signature, version, count = struct.unpack_from(">4sLL", data)
+        if signature != b"DIRC" or version not in (2, 3):
+            raise AstroError(
+                "Index version {} isn't supported by the direct VCS backend.".format(
+                    version
+                )
+            )
+        entries = {}
+        offset = 12
+        for _ in range(count):
+            fields = struct.unpack_from(">10L20sH", data, offset)
+            flags = fields[11]
+            start = offset + 62
+            if flags & 0x4000:
+                # Version 3 extended flags, such as intent-to-add.
+                raise AstroError(
+                    "Extended index flags aren't supported by the direct VCS backend."
+                )
+            end = data.index(b"\0", start)
+            path = data[start:end]
+            if flags & 0x3000:
+                raise AstroError("Can't commit while the index has merge conflicts.")
+            entries[path] = _IndexEntry(path, fields[10], fields[6], fields[:10])
+            # Entries are padded with 1 to 8 NUL bytes to a multiple of 8 bytes.
+            offset += (62 + len(path) + 8) & ~7
+        return entries
+
+    def write_index(self, entries):
+        data = [struct.pack(">4sLL", b"DIRC", 2, len(entries))]
+        for path in sorted(entries):
+            entry = entries[path]
+            fields = list(entry.stat_fields)
+            fields[6] = entry.mode
+            length = 62 + len(path)
+            data.append(
+                struct.pack(">10L20sH", *fields, entry.sha, min(len(path), 0xFFF))
+            )
+            data.append(path + b"\0" * (((length + 8) & ~7) - length))
+        content = b"".join(data)
+        _write(
+            os.path.join(self.git_dir, "index"), content + hashlib.sha1(content).digest()
+        )
+
+
+def _stat_fields(stat):
+    return (
+        int(stat.st_ctime) & 0xFFFFFFFF,
+        stat.st_ctime_ns % 1000000000,
+        int(stat.st_mtime) & 0xFFFFFFFF,
+        stat.st_mtime_ns % 1000000000,
+        stat.st_dev & 0xFFFFFFFF,
+        stat.st_ino & 0xFFFFFFFF,
+        0,
+        stat.st_uid & 0xFFFFFFFF,
+        stat.st_gid & 0xFFFFFFFF,
+        stat.st_size & 0xFFFFFFFF,
+    )
+
+
+def _timezone():
+    offset = time.localtime().tm_gmtoff // 60
+    sign = "-" if offset < 0 else "+"
+    return "{}{:02d}{:02d}".format(sign, abs(offset) // 60, abs(offset) % 60)
+
+
+def _write(path, data):
+    tmp_path = path + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+BACKENDS = {"gitpython": GitPythonBackend, "direct": DirectBackend, "none": NoneBackend}
@@ -0,0 +1,304 @@
+"""
+    Watches the ``mod`` directory of a package and keeps ``__init__.py`` in sync with it.
+    Changes are picked up with inotify where available, or by polling, and bursts of
+    changes are debounced into a single sync. Events for files that the last sync wrote
+    or removed itself are ignored, as long as the files are still as it left them. A
+    sync only touches the affected assets:
+
+    * Files not named after the package are imported, as by ``astro add mod``.
+    * New files are registered, files that are gone are unregistered.
+    * A file that disappears while a file with the same content appears is a rename.
+    * Modified files are sanitized again and their registration is updated.
+"""
+
+import os, sys, time, select, struct
+from .exceptions import AstroError
+from .profiling import instrument
+
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_DELETE = 0x200
+_event = struct.Struct("iIII")
+
+
+class Changes:
+    """
+        Assets affected by a sync.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.renamed = []
+        self.removed = []
+        self.updated = []
+        self.failed = []
+
+    def messages(self):
+        return (
+            ["Added " + name for name in self.added]
+            + ["Renamed {} to {}".format(old, new) for old, new in self.renamed]
+            + ["Removed " + name for name in self.removed]
+            + ["Updated " + name for name in self.updated]
+        )
+
+    def __bool__(self):
+        return bool(self.added or self.renamed or self.removed or self.updated)
+
+
+@instrument("watch", exclude=("run",))
+class Watcher:
+    def __init__(self, pkg, debounce=0.3, interval=1.0, polling=False):
+        self.pkg = pkg
+        self.debounce = debounce
+        self.interval = interval
+        self.polling = polling
+        # Signatures of the files that the last sync wrote or removed, by name.
+        self._written = {}
+
+    def sync(self):
+        """
+            Bring the registered assets in line with the files in the ``mod`` directory
+            and commit the changes.
+
+            :rtype: :class:`Changes`
+        """
+        from . import _import_mod_job
+
+        with self.pkg.lock():
+            pkg = self.pkg
+            changes = Changes()
+            written = []
+            changed, removed = pkg.manifest.refresh()
+            prefix = "glia__{}__".format(pkg.name)
+            with pkg.transaction() as init_file:
+                registered = {
+                    tagline[len("#-mod_") :]
+                    for tagline in init_file.taglines()
+                    if tagline.startswith("#-mod_" + prefix)
+                }
+                own = {name for name in pkg.manifest.names() if _is_own(name, prefix)}
+                # Import the files that were dropped in with a name of their own.
+                scans = {}
+                hashes = {}
+                for name in changed:
+                    if _is_own(name, prefix):
+                        continue
+                    path = pkg.get_mod_path(name + ".mod")
+                    try:
+                        target = pkg.get_import_name(path)
+                    except AstroError as e:
+                        changes.failed.append((name, str(e)))
+                        continue
+                    if target in own or target in scans:
+                        reason = "'{}' already exists.".format(target)
+                        changes.failed.append((name, reason))
+                        continue
+                    pkg.protect(path, pkg.get_mod_path(target + ".mod"))
+                    scans[target] = _import_mod_job(
+                        path, pkg.get_mod_path(target + ".mod"), target
+                    )
+                    hashes[target] = pkg.manifest.get(name)["hash"]
+                    os.remove(path)
+                    pkg.touch(path, pkg.get_mod_path(target + ".mod"))
+                    written.extend((path, pkg.get_mod_path(target + ".mod")))
+                    pkg.manifest.forget(name)
+                own.update(scans)
+                gone = registered - own
+                # A file that is gone and a new file with the same content are a rename.
+                renames = {}
+                for name in sorted(gone):
+                    if name in removed:
+                        renames.setdefault(removed[name]["hash"], name)
+                for name in sorted(own - registered):
+                    digest = hashes.get(name) or pkg.manifest.get(name)["hash"]
+                    old = renames.pop(digest, None)
+                    if old is not None:
+                        gone.remove(old)
+                        init_file.rename("#-mod_" + old, "#-mod_" + name, old, name)
+                        changes.renamed.append((old, name))
+                    else:
+                        changes.added.append(name)
+                    self._register(name, scans.get(name))
+                for name in sorted(gone):
+                    init_file.remove("#-mod_" + name)
+                    changes.removed.append(name)
+                for name in changed:
+                    if name in registered and name in own:
+                        self._register(name)
+                        changes.updated.append(name)
+                names = changes.added + changes.removed + changes.updated
+                names.extend(name for pair in changes.renamed for name in pair)
+                pkg.touch(*(pkg.get_mod_path(name + ".mod") for name in names))
+                written.extend(pkg.get_mod_path(name + ".mod") for name in names)
+            messages = changes.messages()
+            if len(messages) == 1:
+                pkg.commit(messages[0])
+            elif messages:
+                pkg.commit(
+                    "Synced {} mod files\n\n".format(len(messages)) + "\n".join(messages)
+                )
+            self._written = {os.path.basename(path): _stat(path) for path in written}
+            return changes
+
+    def _get_external(self, names):
+        # The changed files, except the ones that the last sync left as they are.
+        mod_path = self.pkg.get_mod_path()
+        return {
+            name
+            for name in names
+            if name not in self._written
+            or self._written[name] != _stat(os.path.join(mod_path, name))
+        }
+
+    def _register(self, name, scan=None):
+        from . import Mod
+
+        mod = Mod(self.pkg, name, scan=scan)
+        statements = [(s.kind, s.name) for s in mod.scan.name_statements]
+        if statements != [(mod.get_name_statement(), name)]:
+            mod.sanitize_mod_file()
+
+    def run(self, once=False, after=None):
+        """
+            Sync, then keep syncing after every burst of changes until interrupted.
+
+            :param once: Only sync once.
+            :param after: Called without arguments after every sync that changed
+              something, to link or build the package for example.
+        """
+        self._sync(after)
+        if once:
+            return
+        source = get_source(self.pkg.get_mod_path(), self.polling, self.interval)
+        print("Watching", self.pkg.get_mod_path(), "for changes")
+        try:
+            while True:
+                names = source.wait(None)
+                if not names:
+                    continue
+                burst = names
+                while burst:
+                    burst = source.wait(self.debounce)
+                    names |= burst
+                if self._get_external(names):
+                    self._sync(after)
+        finally:
+            source.close()
+
+    def _sync(self, after):
+        try:
+            changes = self.sync()
+        except (AstroError, OSError) as e:
+            print("Sync failed:", e, file=sys.stderr)
+            return
+        for message in changes.messages():
+            print(message)
+        for name, reason in changes.failed:
+            print("Skipped {}: {}".format(name, reason), file=sys.stderr)
+        if changes and after is not None:
+            after()
+
+
+def _is_own(name, prefix):
+    return name.startswith(prefix) and len(name.split("__")) == 4
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def get_source(path, polling=False, interval=1.0):
+    """
+        Return an inotify event source for the folder, or a polling source if inotify
+        isn't available or ``polling`` is set.
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifySource(path)
+        except (OSError, AttributeError):
+            pass
+    return PollingSource(path, interval)
+
+
+class InotifySource:
+    def __init__(self, path):
+        import ctypes, ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+
+    def wait(self, timeout):
+        """
+            Wait for changes to mod files, at most ``timeout`` seconds.
+
+            :returns: The names of the mod files that changed.
+            :rtype: set
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 65536)
+        offset = 0
+        names = set()
+        while offset < len(data):
+            _, _, _, length = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if name.endswith(b".mod"):
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self._snapshot = self.snapshot()
+
+    def snapshot(self):
+        try:
+            entries = list(os.scandir(self.path))
+        except FileNotFoundError:
+            return {}
+        return {
+            entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in entries
+            if entry.name.endswith(".mod")
+        }
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            time.sleep(
+                self.interval if remaining is None else min(self.interval, remaining)
+            )
+            snapshot = self.snapshot()
+            if snapshot != self._snapshot:
+                names = {
+                    name
+                    for name in snapshot.keys() | self._snapshot.keys()
+                    if snapshot.get(name) != self._snapshot.get(name)
+                }
+                self._snapshot = snapshot
+                return names
+
+    def close(self):
+        pass
@@ -0,0 +1,142 @@
+"""
+    Native wheel writer for packages with the layout generated by Astrocyte. The wheel
+    is written directly with :mod:`zipfile`, without running ``setup.py``. Packages with
+    a custom ``setup.py`` should keep using the setuptools backend.
+"""
+
+import os, re, time, base64, hashlib, zipfile
+from . import __version__
+from .profiling import profiled
+
+#: Timestamp of the files in the wheel, unless ``SOURCE_DATE_EPOCH`` is set.
+DEFAULT_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+TAG = "py3-none-any"
+CLASSIFIERS = [
+    "Programming Language :: Python :: 3",
+    "Operating System :: OS Independent",
+]
+
+
+def escape(name):
+    return re.sub(r"[^\w\d.]+", "_", name, flags=re.UNICODE)
+
+
+def get_wheel_name(pkg):
+    return "{}-{}-{}.whl".format(escape(pkg.name), escape(pkg.version), TAG)
+
+
+def get_dist_info(pkg):
+    return "{}-{}.dist-info".format(escape(pkg.name), escape(pkg.version))
+
+
+def get_date_time():
+    epoch = os.getenv("SOURCE_DATE_EPOCH")
+    if epoch is None:
+        return DEFAULT_DATE_TIME
+    return time.gmtime(max(int(epoch), 315532800))[:6]
+
+
+def metadata(pkg):
+    lines = [
+        "Metadata-Version: 2.1",
+        "Name: " + pkg.name,
+        "Version: " + pkg.version,
+        "Summary: Glia package of NEURON models",
+        "Home-page: https://github.com/dbbs-lab/glia",
+        "Author: " + pkg.data["author"],
+        "Author-email: " + pkg.data["email"],
+        "License: GPLv3",
+    ]
+    lines.extend("Classifier: " + c for c in CLASSIFIERS)
+    lines.append("Requires-Dist: nrn-glia>=" + pkg.glia_version)
+    lines.append("Description-Content-Type: text/markdown")
+    try:
+        with open(os.path.join(pkg.path, "README.md"), "r") as f:
+            description = f.read()
+    except FileNotFoundError:
+        description = ""
+    return "\n".join(lines) + "\n\n" + description
+
+
+def wheel_metadata():
+    return (
+        "Wheel-Version: 1.0\n"
+        + "Generator: astrocyte ({})\n".format(__version__)
+        + "Root-Is-Purelib: true\n"
+        + "Tag: {}\n".format(TAG)
+    )
+
+
+def entry_points(pkg):
+    return "[glia.package]\n{0} = {0}\n".format(pkg.name)
+
+
+def get_package_files(pkg):
+    """
+        Return the sorted archive names and paths of the files in the package folder:
+        its Python modules, its mod files and the index of their interfaces.
+    """
+    source = pkg.get_source_path()
+    # Like `setup.py` of the package, which only lists the index in new packages.
+    interfaces = pkg.ships_interfaces()
+    files = []
+    for root, dirs, filenames in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            rel = os.path.relpath(path, source)
+            if filename.endswith(".py") or (
+                os.path.dirname(rel) == "mod"
+                and (
+                    filename.endswith(".mod")
+                    or (filename == "interfaces.json" and interfaces)
+                )
+            ):
+                arcname = "/".join([pkg.name] + rel.split(os.sep))
+                files.append((arcname, path))
+    return sorted(files)
+
+
+def _record_hash(data):
+    digest = hashlib.sha256(data).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+@profiled(category="build")
+def build_wheel(pkg, dist_dir=None):
+    """
+        Write the wheel of a package. The wheel is reproducible: files are sorted and
+        get a fixed timestamp.
+
+        :param dist_dir: Target folder, defaults to the ``dist`` folder of the package.
+        :returns: Path of the wheel.
+    """
+    dist_dir = dist_dir or os.path.join(pkg.path, "dist")
+    os.makedirs(dist_dir, exist_ok=True)
+    dist_info = get_dist_info(pkg)
+    entries = []
+    for arcname, path in get_package_files(pkg):
+        with open(path, "rb") as f:
+            entries.append((arcname, f.read()))
+    entries.append((dist_info + "/METADATA", metadata(pkg).encode("utf-8")))
+    entries.append((dist_info + "/WHEEL", wheel_metadata().encode("utf-8")))
+    entries.append((dist_info + "/entry_points.txt", entry_points(pkg).encode("utf-8")))
+    entries.append((dist_info + "/top_level.txt", (pkg.name + "\n").encode("utf-8")))
+    record = "".join(
+        "{},{},{}\n".format(arcname, _record_hash(data), len(data))
+        for arcname, data in entries
+    )
+    record += dist_info + "/RECORD,,\n"
+    entries.append((dist_info + "/RECORD", record.encode("utf-8")))
+
+    wheel_path = os.path.join(dist_dir, get_wheel_name(pkg))
+    date_time = get_date_time()
+    tmp_path = wheel_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as wheel:
+        for arcname, data in entries:
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.external_attr = 0o644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            wheel.writestr(info, data)
+    os.replace(tmp_path, wheel_path)
+    return wheel_path
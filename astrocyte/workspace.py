@@ -0,0 +1,179 @@
+"""
+    Workspaces group many packages under one root folder so that they can be built,
+    installed and uploaded together. The root is marked by an ``.astro-workspace`` file
+    containing a JSON object. Its ``packages`` key lists the package folders relative to
+    the root; if it is absent, every folder under the root with an ``.astro/pkg`` file
+    is a package of the workspace.
+"""
+
+import os, json, contextlib, traceback
+from .exceptions import AstroError, BuildError
+from .profiling import instrument
+
+WORKSPACE_FILE = ".astro-workspace"
+
+
+@instrument("workspace", exclude=("get_package_paths",))
+class Workspace:
+    def __init__(self, root, packages=None):
+        self.root = os.path.abspath(root)
+        self._packages = packages
+
+    def get_package_paths(self):
+        """
+            Return the absolute paths of the packages in the workspace.
+        """
+        if self._packages is not None:
+            return [os.path.normpath(os.path.join(self.root, p)) for p in self._packages]
+        return discover_packages(self.root)
+
+    def run(self, action, jobs=1, **options):
+        """
+            Run an action on every package of the workspace, ``jobs`` packages at a time
+            in worker processes. The output of each package is logged to
+            ``.astro/logs/<action>.log`` in the package. Wheels that the native
+            installer can handle are installed together, in this process.
+
+            :param action: ``"build"``, ``"install"`` or ``"upload"``.
+            :param options: Options of the action, such as ``force``, ``backend``,
+              ``install`` and ``upload`` for builds, and ``upload_options`` for the
+              :class:`.upload.Uploader`. Each worker process reuses one uploader.
+            :returns: The outcome of each package.
+            :rtype: list of :class:`PackageResult`
+        """
+        paths = self.get_package_paths()
+        results = {}
+        if action == "install":
+            results = _install_batch(paths, options)
+        remaining = [path for path in paths if path not in results]
+        if jobs <= 1 or len(remaining) <= 1:
+            for path in remaining:
+                results[path] = _run_package(action, path, options)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    path: executor.submit(_run_package, action, path, options)
+                    for path in remaining
+                }
+                for path, future in futures.items():
+                    try:
+                        results[path] = future.result()
+                    except Exception as e:
+                        # The package couldn't be sent to, or run by, a worker process.
+                        results[path] = PackageResult(path, False, None, str(e))
+        return [results[path] for path in paths]
+
+
+class PackageResult:
+    def __init__(self, path, ok, log, error=None):
+        self.path = path
+        self.ok = ok
+        self.log = log
+        self.error = error
+
+
+def find_workspace(path=None):
+    """
+        Return the workspace containing ``path``. Without a workspace file in ``path`` or
+        any of its parents, ``path`` is the root of a workspace discovering its packages.
+    """
+    path = os.path.abspath(path or os.getcwd())
+    current = path
+    while True:
+        workspace_file = os.path.join(current, WORKSPACE_FILE)
+        if os.path.isfile(workspace_file):
+            with open(workspace_file, "r") as f:
+                content = f.read()
+            data = json.loads(content) if content.strip() else {}
+            return Workspace(current, data.get("packages"))
+        parent = os.path.dirname(current)
+        if parent == current:
+            return Workspace(path)
+        current = parent
+
+
+def discover_packages(root):
+    """
+        Return the sorted paths of all packages under ``root``. Hidden folders and the
+        folders inside packages are not searched.
+    """
+    found = []
+    for folder, dirs, files in os.walk(root):
+        if os.path.isfile(os.path.join(folder, ".astro", "pkg")):
+            found.append(folder)
+            dirs[:] = []
+            continue
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+    return sorted(found)
+
+
+def _install_batch(paths, options):
+    # Install the wheels the native installer can handle in this process, scanning
+    # the installed distributions and importing Glia only once.
+    from . import get_package
+    from .install import Wheel, requires_pip, install_wheels, get_installed_names
+
+    installed = get_installed_names()
+    results = {}
+    for path in paths:
+        try:
+            pkg = get_package(path)
+            backend = options.get("backend") or pkg.data.get("install_backend", "native")
+            if backend != "native":
+                continue
+            distfile = pkg.get_distribution()
+            wheel = Wheel(distfile)
+            reason = requires_pip(wheel, installed)
+            wheel.close()
+            if reason is None:
+                install_wheels([distfile])
+                results[path] = PackageResult(path, True, None)
+        except AstroError as e:
+            results[path] = PackageResult(path, False, None, str(e))
+    if any(result.ok for result in results.values()) and not os.getenv("CI"):
+        import glia
+    return results
+
+
+def _run_package(action, path, options):
+    # Module level so that it can be sent to worker processes.
+    from . import get_package
+
+    try:
+        pkg = get_package(path)
+        # The log is written in `.astro`, make sure that it's ignored.
+        pkg.ignore_local_files()
+    except Exception as e:
+        return PackageResult(path, False, None, str(e))
+    log_dir = os.path.join(path, ".astro", "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    log = os.path.join(log_dir, action + ".log")
+    with open(log, "w") as f:
+        with contextlib.redirect_stdout(f), contextlib.redirect_stderr(f):
+            try:
+                ok = _run_action(action, pkg, options)
+            except Exception as e:
+                traceback.print_exc()
+                return PackageResult(path, False, log, str(e))
+    return PackageResult(path, ok, log)
+
+
+def _run_action(action, pkg, options):
+    if action == "build":
+        if options.get("check") and pkg.check(compiler=options.get("compiler")):
+            raise BuildError("Mod files failed to compile, build aborted.")
+        pkg.build(force=options.get("force"), backend=options.get("backend"))
+        if pkg.built() and options.get("install"):
+            pkg.install()
+        if pkg.built() and options.get("upload"):
+            pkg.upload(**options.get("upload_options", {}))
+        return pkg.built()
+    elif action == "install":
+        pkg.install(backend=options.get("backend"))
+        return True
+    elif action == "upload":
+        pkg.upload(**options.get("upload_options", {}))
+        return True
+    raise AstroError("Unknown workspace action '{}'.".format(action))
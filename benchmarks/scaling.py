@@ -0,0 +1,310 @@
+"""
+    Scaling benchmark of package operations. Synthetic packages with increasing numbers
+    of mod files are created and every operation is timed in-process, on a fresh
+    :class:`~astrocyte.Package` like a separate ``astro`` invocation would load it.
+    ``edit``, ``rm`` and ``lookup`` are the mean of ``--ops`` operations.
+
+    The run fails if the time of an operation grows faster than ``n ** --max-exponent``
+    with the number of mods ``n``, which catches quadratic paths on any machine. Times
+    are also expressed as ratios to a calibration workload that writes and parses mod
+    files, and compared to the ratios of a stored baseline: the run fails if an
+    operation became slower than ``--tolerance`` times its baseline on the same machine
+    speed. The default packages of 1 000 to 50 000 mods take a few minutes, pass
+    ``-n 100,1000`` for a quick run.
+
+    Usage::
+
+        python benchmarks/scaling.py [-n 1000,10000,50000] [--json FILE]
+        python benchmarks/scaling.py --update-baseline
+"""
+
+import os, re, sys, json, math, time, random, argparse, tempfile, shutil, contextlib
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, root)
+import astrocyte
+from astrocyte.cli import create_package
+from astrocyte.install import install_wheels, uninstall_distribution
+
+default_baseline = os.path.join(os.path.dirname(__file__), "scaling-baseline.json")
+steps = ("create", "add", "load", "lookup", "edit", "rm", "build", "install")
+
+mod_template = """TITLE Synthetic mechanism {index}
+
+NEURON {{
+  {kind} {name}
+  RANGE gbar, g
+}}
+
+PARAMETER {{
+  gbar = 0.1 (S/cm2)
+{parameters}}}
+
+ASSIGNED {{
+  g (S/cm2)
+}}
+
+BREAKPOINT {{
+  g = gbar
+}}
+"""
+
+
+def write_mods(folder, count, size, point_processes, artificial_cells, seed=0):
+    """
+        Write ``count`` mod files of about ``size`` lines, of which the given fractions
+        are point processes and artificial cells.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        draw = rng.random()
+        if draw < point_processes:
+            kind = "POINT_PROCESS"
+        elif draw < point_processes + artificial_cells:
+            kind = "ARTIFICIAL_CELL"
+        else:
+            kind = "SUFFIX"
+        name = "Synth{:05d}".format(i)
+        parameters = "".join("  p{} = {}\n".format(j, j) for j in range(size))
+        with open(os.path.join(folder, name + ".mod"), "w") as f:
+            f.write(
+                mod_template.format(index=i, kind=kind, name=name, parameters=parameters)
+            )
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    f(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def calibrate(repeat=5):
+    """
+        Time a fixed workload of writing and parsing mod files, the unit of the ratios
+        that are compared against the baseline.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        tmp = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            write_mods(tmp, 1000, 20, 0.2, 0.05)
+            for name in sorted(os.listdir(tmp)):
+                with open(os.path.join(tmp, name)) as f:
+                    re.findall(r"^\s*(\w+) = ", f.read(), re.MULTILINE)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            shutil.rmtree(tmp)
+    return best
+
+
+def run(count, args, tmp):
+    """
+        Time every step on a package of ``count`` mods.
+
+        :returns: Seconds per step.
+    """
+    src = os.path.join(tmp, "src")
+    os.mkdir(src)
+    write_mods(src, count, args.size, args.point_processes, args.artificial_cells)
+    pkg_dir = os.path.join(tmp, "synth-pkg")
+    cli_args = argparse.Namespace(folder=pkg_dir, vcs=args.vcs)
+    presets = {"author": "bench", "email": "bench@example.com", "pkg_name": "synth"}
+    names = [
+        "Synth{:05d}".format(i) for i in random.Random(1).sample(range(count), args.ops)
+    ]
+    timings = {}
+    timings["create"] = timed(create_package, cli_args, presets)
+    pkg = astrocyte.get_package(pkg_dir)
+    timings["add"] = timed(pkg.add_mod_files, [src], workers=args.jobs)
+
+    def load():
+        pkg = astrocyte.get_package(pkg_dir)
+        pkg.manifest.assets
+        return pkg
+
+    timings["load"] = timed(load)
+    pkg = load()
+    timings["lookup"] = (
+        sum(timed(pkg.find_mod_candidate, "__{}__".format(name)) for name in names)
+        / args.ops
+    )
+
+    def edit(name):
+        load().edit_asset("__{}__".format(name), name=name + "e")
+
+    timings["edit"] = sum(timed(edit, name) for name in names) / args.ops
+
+    def rm(name):
+        pkg = load()
+        asset = "glia__synth__{}e__0".format(name)
+        with pkg.transaction():
+            pkg.remove_mod_file(asset)
+        pkg.commit("Removed " + asset)
+
+    timings["rm"] = sum(timed(rm, name) for name in names) / args.ops
+
+    def build():
+        load().build(force=True, backend=args.build_backend)
+
+    timings["build"] = timed(build)
+    wheels = [os.path.join(pkg_dir, "dist", f) for f in os.listdir(pkg_dir + "/dist")]
+    wheels = [path for path in wheels if path.endswith(".whl")]
+    site = os.path.join(tmp, "site-packages")
+    os.mkdir(site)
+    timings["install"] = timed(install_wheels, wheels[-1:], site)
+    uninstall_distribution("synth", [site])
+    return {step: round(seconds, 6) for step, seconds in timings.items()}
+
+
+def compare(results, baseline, tolerance, floor):
+    """
+        Return the steps that became slower than ``tolerance`` times the baseline,
+        after scaling it to the calibration of this machine. Differences under
+        ``floor`` seconds are noise.
+    """
+    regressions = []
+    for count, timings in results["timings"].items():
+        for step, seconds in timings.items():
+            ratio = baseline["ratios"].get(count, {}).get(step)
+            if ratio is None:
+                continue
+            base = ratio * results["calibration"]
+            if seconds > base * tolerance and seconds - base > floor:
+                regressions.append(
+                    "{} with {} mods: {:.3f} s, baseline {:.3f} s ({:.1f}x)".format(
+                        step, count, seconds, base, seconds / base
+                    )
+                )
+    return regressions
+
+
+def check_growth(results, max_exponent, floor):
+    """
+        Return the steps whose time grows faster than ``n ** max_exponent`` between
+        consecutive mod counts. No step should need more than linear time: even single
+        mod operations rewrite ``__init__.py`` and refresh the manifest.
+    """
+    failures = []
+    counts = sorted(results["timings"], key=int)
+    for small, large in zip(counts, counts[1:]):
+        for step in steps:
+            before = results["timings"][small].get(step)
+            after = results["timings"][large].get(step)
+            if before is None or after is None or after < floor:
+                continue
+            exponent = math.log(after / before) / math.log(int(large) / int(small))
+            if exponent > max_exponent:
+                failures.append(
+                    "{} grows as n^{:.2f} from {} to {} mods, limit n^{:.2f}".format(
+                        step, exponent, small, large, max_exponent
+                    )
+                )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1].strip())
+    parser.add_argument(
+        "-n",
+        "--mods",
+        default="1000,10000,50000",
+        help="Comma separated numbers of mods.",
+    )
+    parser.add_argument("--size", type=int, default=20, help="Parameters per mod.")
+    parser.add_argument(
+        "--point-processes", type=float, default=0.2, help="Fraction of point processes."
+    )
+    parser.add_argument(
+        "--artificial-cells",
+        type=float,
+        default=0.05,
+        help="Fraction of artificial cells.",
+    )
+    parser.add_argument(
+        "--ops", type=int, default=20, help="Edits, removals and lookups."
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Import workers.")
+    parser.add_argument("--vcs", default="direct", help="VCS backend of the packages.")
+    parser.add_argument(
+        "--build-backend", default="native", choices=("native", "setuptools")
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--baseline", default=default_baseline, help="Baseline file.")
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store the results as baseline."
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=1.5, help="Allowed slowdown factor."
+    )
+    parser.add_argument(
+        "--max-exponent", type=float, default=1.5, help="Allowed growth exponent."
+    )
+    parser.add_argument(
+        "--floor", type=float, default=0.02, help="Seconds under which times are noise."
+    )
+    args = parser.parse_args()
+    counts = [int(n) for n in args.mods.split(",")]
+
+    config = {
+        "size": args.size,
+        "point_processes": args.point_processes,
+        "artificial_cells": args.artificial_cells,
+        "ops": args.ops,
+        "jobs": args.jobs,
+        "vcs": args.vcs,
+        "build_backend": args.build_backend,
+    }
+    results = {"python": sys.version.split()[0], "config": config}
+    results["calibration"] = round(calibrate(), 6)
+    results["timings"], results["ratios"] = {}, {}
+    print("Calibration {:.3f} s".format(results["calibration"]))
+    for count in counts:
+        if count < args.ops:
+            parser.error("Every package needs at least --ops mods.")
+        tmp = tempfile.mkdtemp()
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                timings = run(count, args, tmp)
+        finally:
+            shutil.rmtree(tmp)
+        results["timings"][str(count)] = timings
+        results["ratios"][str(count)] = {
+            step: round(seconds / results["calibration"], 4)
+            for step, seconds in timings.items()
+        }
+        print(
+            "{:>6} mods ".format(count)
+            + " ".join("{} {:.3f} s".format(step, timings[step]) for step in steps)
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        # Absolute times only hold on this machine, the ratios are stored.
+        baseline = {key: value for key, value in results.items() if key != "timings"}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print("Stored the results as baseline in", args.baseline)
+        return
+
+    failures = check_growth(results, args.max_exponent, args.floor)
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("No baseline found at", args.baseline)
+    else:
+        if baseline.get("config") != config or "ratios" not in baseline:
+            print("The baseline was made with another configuration, not compared.")
+        else:
+            failures.extend(compare(results, baseline, args.tolerance, args.floor))
+    if failures:
+        print("\nREGRESSIONS:", *failures, sep="\n  ", file=sys.stderr)
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+    Startup benchmark of the ``astro`` command line interface. Every command is run in a
+    fresh interpreter, the way CI pipelines invoke ``astro``, and timed end to end.
+
+    Usage::
+
+        python benchmarks/startup.py [-n REPEAT] [--json FILE]
+"""
+
+import os, sys, json, time, argparse, tempfile, shutil, statistics, subprocess
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+cli = "from astrocyte.cli import astrocyte_cli; astrocyte_cli()"
+# Modules that `astro --help` should not need.
+heavy_modules = ("git", "appdirs", "subprocess", "twine", "requests")
+
+mod_source = """NEURON {
+  SUFFIX bench
+  RANGE gbar
+}
+
+PARAMETER {
+  gbar = 0.1
+}
+"""
+
+
+def astro(*args, cwd=None):
+    env = dict(os.environ, PYTHONPATH=root)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", cli] + list(args),
+        cwd=cwd,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def summarize(timings):
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "runs": len(timings),
+    }
+
+
+def loaded_heavy_modules():
+    script = (
+        "import sys; sys.argv = ['astro', '--help']\n"
+        "try:\n"
+        "    " + cli + "\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sorted(m for m in sys.modules if m.split('.')[0] in {})))".format(
+            repr(heavy_modules)
+        )
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", script],
+        env=dict(os.environ, PYTHONPATH=root),
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    return out.split("\n")[-2].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1].strip())
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="Runs per command.")
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0]}
+    results["help"] = summarize([astro("--help") for _ in range(args.repeat)])
+    tmp = tempfile.mkdtemp()
+    try:
+        astro(
+            "create",
+            "package",
+            "bench-pkg",
+            "--name=bench_pkg",
+            "--author=bench",
+            "--email=bench@example.com",
+            cwd=tmp,
+        )
+        pkg_dir = os.path.join(tmp, "bench-pkg")
+        mod_file = os.path.join(tmp, "bench.mod")
+        with open(mod_file, "w") as f:
+            f.write(mod_source)
+        results["add_mod"] = summarize(
+            [
+                astro("add", "mod", mod_file, "-n", "bench{}".format(i), cwd=pkg_dir)
+                for i in range(args.repeat)
+            ]
+        )
+    finally:
+        shutil.rmtree(tmp)
+    results["help_heavy_modules"] = loaded_heavy_modules()
+
+    for name in ("help", "add_mod"):
+        print(
+            "astro {:<10} min {min_ms:7.1f} ms  median {median_ms:7.1f} ms".format(
+                name.replace("_", " "), **results[name]
+            )
+        )
+    print(
+        "Heavy modules loaded by --help:",
+        ", ".join(results["help_heavy_modules"]) or "none",
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,6 @@ setuptools.setup(
         "nrn-glia>=0.1.8",
         "setuptools",
         "gitpython>=3.0.0",
-        "twine>=3.0.0",
         "requests",
         "appdirs>=1.4.3",
     ],
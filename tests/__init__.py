@@ -0,0 +1,57 @@
+"""
+    Fixtures shared by the test suites: mod files and packages in temporary folders.
+"""
+
+import os, sys, tempfile, shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+mod_template = """NEURON {{
+  {kind} {name}
+  RANGE gbar
+}}
+
+PARAMETER {{
+  gbar = 0.1 (S/cm2)
+}}
+"""
+
+
+def mod_source(name, kind="SUFFIX"):
+    """
+        Return the source of a mod file of the mechanism ``name``.
+    """
+    return mod_template.format(kind=kind, name=name)
+
+
+def write_mod(folder, name, kind="SUFFIX"):
+    """
+        Write the mod file of the mechanism ``name`` to ``folder``.
+
+        :returns: Path of the mod file.
+    """
+    path = os.path.join(folder, name + ".mod")
+    with open(path, "w") as f:
+        f.write(mod_source(name, kind))
+    return path
+
+
+def make_dir(test):
+    """
+        Make a temporary folder that is removed after the ``test``.
+    """
+    folder = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, folder)
+    return folder
+
+
+def make_package(folder, name=None):
+    """
+        Create a package in ``folder``, committed with the direct backend.
+
+        :returns: Path of the package.
+    """
+    from astrocyte import api
+
+    api.create_package(folder, "Dude", "d@e.com", name=name, vcs="direct")
+    return folder
@@ -0,0 +1,88 @@
+import unittest, os, sys, io, threading, contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte import api
+from astrocyte.exceptions import AstroError
+from tests import make_dir, make_package, write_mod
+
+
+class TestAPI(unittest.TestCase):
+    """
+        Check that the API returns its outcomes instead of printing them, and can be
+        used from threads.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.mods = [
+            write_mod(self.dir, name, kind)
+            for name, kind in (
+                ("Kv", "SUFFIX"),
+                ("Na", "SUFFIX"),
+                ("Syn", "POINT_PROCESS"),
+            )
+        ]
+
+    def test_operations(self):
+        cwd = os.getcwd()
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = api.create_package(
+                os.path.join(self.dir, "pkg"), "Dude", "d@e.com", vcs="direct"
+            )
+            path = result.package.path
+            self.assertEqual("pkg", result.package.name)
+            result = api.add_mods(path, [self.mods[0]], name="kdr")
+            self.assertEqual([(self.mods[0], "glia__pkg__kdr__0")], result.imported)
+            missing = os.path.join(self.dir, "missing", "*.mod")
+            result = api.add_mods(path, self.mods[1:] + [missing])
+            self.assertFalse(result)
+            self.assertEqual([(missing, "No mod files found.")], result.failed)
+            self.assertEqual(2, len(result.imported))
+            result = api.edit_asset(path, "__Na__", variant="fast")
+            self.assertEqual("glia__pkg__Na__0", result.old_name)
+            self.assertEqual("glia__pkg__Na__fast", result.new_name)
+            result = api.remove_assets(path, "Syn")
+            self.assertEqual(["glia__pkg__Syn__0"], result.removed)
+            with self.assertRaises(AstroError):
+                api.remove_assets(path, "Syn")
+            result = api.build(path, backend="native")
+            self.assertTrue(result.built)
+            self.assertFalse(result.cached)
+            self.assertTrue(os.path.isfile(result.wheel))
+            self.assertIn("Glia package built.", result.messages)
+            result = api.build(path, backend="native")
+            self.assertTrue(result.cached)
+            self.assertFalse(api.commit(path).committed)
+        self.assertEqual("", output.getvalue())
+        self.assertEqual(cwd, os.getcwd())
+        pkg = astrocyte.get_package(path)
+        self.assertEqual(
+            ["glia__pkg__Na__fast", "glia__pkg__kdr__0"], pkg.manifest.names()
+        )
+
+    def test_threads(self):
+        paths = [make_package(os.path.join(self.dir, "pkg" + str(i))) for i in range(2)]
+        errors = []
+
+        def add(path, mod):
+            try:
+                api.add_mods(path, [mod])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=add, args=(path, mod))
+            for path in paths
+            for mod in self.mods
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        for path in paths:
+            pkg = astrocyte.get_package(path)
+            self.assertEqual(3, len(pkg.manifest.names()))
+            with open(pkg.get_source_path("__init__.py")) as f:
+                self.assertEqual(3, f.read().count("#-mod_"))
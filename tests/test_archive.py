@@ -0,0 +1,131 @@
+import unittest, os, sys, io, subprocess, shutil, tarfile, zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte import api
+from astrocyte.archive import iter_mod_files
+from astrocyte.exceptions import AstroError
+from tests import make_dir, make_package, mod_source, write_mod
+
+
+# A model collection as it's downloaded: mod files mixed with hoc and C files.
+collection = {
+    "model/mechanisms/Kv.mod": mod_source("Kv"),
+    "model/mechanisms/Na.mod": mod_source("Na").replace("\n", "\r\n"),
+    "model/mechanisms/helper.c": "int helper() { return 0; }\n",
+    "model/init.hoc": 'load_file("nrngui.hoc")\n',
+}
+
+
+class TestArchive(unittest.TestCase):
+    """
+        Check that mod files are imported from archives and git repositories without
+        extracting them.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.path = make_package(os.path.join(self.dir, "pkg"))
+
+    def assertImported(self, result, source):
+        self.assertTrue(result)
+        self.assertEqual(
+            [
+                (source + ":model/mechanisms/Kv.mod", "glia__pkg__Kv__0"),
+                (source + ":model/mechanisms/Na.mod", "glia__pkg__Na__0"),
+            ],
+            result.imported,
+        )
+        pkg = astrocyte.get_package(self.path)
+        self.assertEqual(["glia__pkg__Kv__0", "glia__pkg__Na__0"], pkg.manifest.names())
+        self.assertEqual(
+            ["glia__pkg__Kv__0.mod", "glia__pkg__Na__0.mod"],
+            sorted(os.listdir(pkg.get_mod_path())),
+        )
+        with open(pkg.get_mod_path("glia__pkg__Na__0.mod"), "rb") as f:
+            content = f.read()
+        self.assertIn(b"SUFFIX glia__pkg__Na__0", content)
+        self.assertNotIn(b"\r", content)
+        with open(pkg.get_source_path("__init__.py")) as f:
+            self.assertEqual(2, f.read().count("#-mod_"))
+
+    def test_zip(self):
+        source = os.path.join(self.dir, "model.zip")
+        with zipfile.ZipFile(source, "w") as archive:
+            for name, content in collection.items():
+                archive.writestr(name, content)
+        self.assertImported(api.add_mods(self.path, [source]), source)
+
+    def test_tar(self):
+        source = os.path.join(self.dir, "model.tar.gz")
+        with tarfile.open(source, "w:gz") as archive:
+            for name, content in collection.items():
+                data = content.encode()
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self.assertImported(api.add_mods(self.path, [source]), source)
+
+    @unittest.skipIf(shutil.which("git") is None, "git isn't installed")
+    def test_git(self):
+        repo = os.path.join(self.dir, "repo")
+        for name, content in collection.items():
+            os.makedirs(os.path.join(repo, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(repo, name), "w", newline="") as f:
+                f.write(content)
+        env = dict(os.environ, GIT_AUTHOR_NAME="Dude", GIT_AUTHOR_EMAIL="d@e.com")
+        env.update(GIT_COMMITTER_NAME="Dude", GIT_COMMITTER_EMAIL="d@e.com")
+        for command in (["init", "-q"], ["add", "."], ["commit", "-qm", "Model"]):
+            subprocess.run(
+                ["git", "-c", "core.autocrlf=false", *command],
+                cwd=repo,
+                env=env,
+                check=True,
+            )
+        # Only committed files of the revision are imported.
+        write_mod(os.path.join(repo, "model"), "Ca")
+        source = "git+" + repo + "#HEAD"
+        self.assertImported(api.add_mods(self.path, [source]), source)
+        result = api.add_mods(self.path, ["git+" + repo + "#missing"])
+        self.assertIn("`git archive` of", result.failed[0][1])
+
+    def test_errors(self):
+        source = os.path.join(self.dir, "broken.zip")
+        with open(source, "w") as f:
+            f.write("Not a zip file")
+        empty = os.path.join(self.dir, "empty.tar")
+        tarfile.open(empty, "w").close()
+        mod = write_mod(self.dir, "Kv")
+        listfile = "@" + os.path.join(self.dir, "missing.txt")
+        # Unreadable archives and list files are reported without aborting the batch.
+        result = api.add_mods(self.path, [source, empty, listfile, mod])
+        self.assertEqual([(mod, "glia__pkg__Kv__0")], result.imported)
+        self.assertEqual(
+            [source, empty, listfile], [source for source, _ in result.failed]
+        )
+        self.assertIn("Can't read archive", result.failed[0][1])
+        self.assertEqual("No mod files found.", result.failed[1][1])
+        self.assertIn("Can't read list file", result.failed[2][1])
+        with self.assertRaises(AstroError):
+            api.add_mods(self.path, [empty], name="x")
+
+    def test_stream(self):
+        # Members are passed on as they're read: the ones before a truncated part of
+        # the archive are imported, then the archive is reported.
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode="w") as archive:
+            for name, content in (("Kv.mod", mod_source("Kv")), ("Na.mod", "x" * 10000)):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content.encode()))
+        source = os.path.join(self.dir, "truncated.tar")
+        with open(source, "wb") as f:
+            f.write(data.getvalue()[:5000])
+        members = iter_mod_files(source)
+        self.assertEqual(source + ":Kv.mod", str(next(members)))
+        with self.assertRaises(AstroError):
+            next(members)
+        result = api.add_mods(self.path, [source])
+        self.assertEqual([(source + ":Kv.mod", "glia__pkg__Kv__0")], result.imported)
+        self.assertEqual(source, result.failed[0][0])
+        self.assertIn("unexpected end of data", result.failed[0][1])
@@ -1,4 +1,4 @@
-import unittest, os, sys, argparse
+import unittest, os, sys, argparse, tempfile, shutil
 
 unittest.TestLoader.sortTestMethodsUsing = None
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -43,8 +43,243 @@ class TestCLI(unittest.TestCase):
         # Add point process
         run_cli_command("add mod ../tests/mod/NMDA.mod")
 
+    def test_2_add_mod_bulk(self):
+        mod_dir = os.path.abspath(os.path.join("..", "tests", "mod"))
+        bulk_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(bulk_dir, "nested"))
+        shutil.copy2(
+            os.path.join(mod_dir, "Kca1_1.mod"), os.path.join(bulk_dir, "KBulk.mod")
+        )
+        shutil.copy2(
+            os.path.join(mod_dir, "NMDA.mod"),
+            os.path.join(bulk_dir, "nested", "NBulk.mod"),
+        )
+        shutil.copy2(
+            os.path.join(mod_dir, "NMDA.mod"), os.path.join(bulk_dir, "Glob.mod")
+        )
+        listfile = os.path.join(bulk_dir, "mods.txt")
+        with open(listfile, "w") as f:
+            f.write("nested/NBulk.mod\nmissing.mod\n")
+        # Add a directory, a glob and a listfile with one missing entry.
+        self.assertRaises(
+            astrocyte.cli.AstroError,
+            run_cli_command,
+            "add mod {} {} @{}".format(
+                os.path.join(bulk_dir, "nested"),
+                os.path.join(bulk_dir, "G*.mod"),
+                listfile,
+            ),
+        )
+        pkg = astrocyte.get_package()
+        self.assertNotIn("my_test", sys.modules, "Package imported to read version")
+        self.assertEqual(
+            ["glia__my_test__Glob__0", "glia__my_test__NBulk__0"],
+            sorted(pkg.get_mod_candidates("Bulk") + pkg.get_mod_candidates("Glob")),
+        )
+        # Check that a single commit was made for the batch.
+        head = pkg.repo.head.commit
+        self.assertTrue(head.message.startswith("Added 2 mod files"))
+        self.assertEqual("Added glia__my_test__NMDA__0", head.parents[0].message)
+        # Check the asset manifest, which should not be tracked.
+        self.assertEqual(
+            "POINT_PROCESS", pkg.manifest.get("glia__my_test__Glob__0")["kind"]
+        )
+        self.assertEqual("SUFFIX", pkg.manifest.get("glia__my_test__Kca1_1__0")["kind"])
+        self.assertNotIn(".astro/manifest", pkg.repo.git.ls_files().split())
+        shutil.rmtree(bulk_dir)
+
     def test_3_build(self):
         run_cli_command("build")
+        import zipfile, json
+
+        with zipfile.ZipFile(astrocyte.get_package().get_distribution()) as wheel:
+            index = json.loads(wheel.read("my_test/mod/interfaces.json"))
+        nmda = index["mods"]["glia__my_test__NMDA__0"]
+        self.assertEqual("POINT_PROCESS", nmda["kind"])
+        self.assertEqual(["i"], nmda["nonspecific_current"])
+
+    def test_3_build_cached(self):
+        head = astrocyte.get_package().repo.head.commit
+        run_cli_command("build")
+        pkg = astrocyte.get_package()
+        self.assertEqual("0.0.1", pkg.version)
+        self.assertEqual(head, pkg.repo.head.commit, "Unchanged package was rebuilt")
+        self.assertFalse(pkg.repo.is_dirty(untracked_files=True))
+        run_cli_command("build --force --backend native")
+        pkg = astrocyte.get_package()
+        self.assertEqual("0.0.2", pkg.version)
+        # Native wheels are reproducible.
+        from astrocyte.wheel import build_wheel
+
+        with open(pkg.get_distribution(), "rb") as f:
+            first = f.read()
+        dist_dir = tempfile.mkdtemp()
+        with open(build_wheel(pkg, dist_dir), "rb") as f:
+            self.assertEqual(first, f.read())
+        shutil.rmtree(dist_dir)
+        # The package is a workspace of one package.
+        run_cli_command("build --all -j 2")
+        self.assertTrue(os.path.exists(os.path.join(".astro", "logs", "build.log")))
+        self.assertEqual("0.0.2", astrocyte.get_package().version)
+
+    def test_3_check(self):
+        # A stand-in for nrnivmodl that rejects point processes and logs its runs.
+        tmp = tempfile.mkdtemp()
+        compiler = os.path.join(tmp, "compiler.py")
+        runs = os.path.join(tmp, "runs.txt")
+        with open(compiler, "w") as f:
+            f.write(
+                "import sys\n"
+                "open({!r}, 'a').write(sys.argv[1] + '\\n')\n".format(runs)
+                + "source = open(sys.argv[1]).read()\n"
+                "open(sys.argv[1][:-4] + '.c', 'w').write(source)\n"
+                "sys.exit('POINT_PROCESS' in source.split('ENDCOMMENT')[-1])\n"
+            )
+        os.environ["ASTRO_NMODL_COMPILER"] = sys.executable + " " + compiler
+        try:
+            mods = sorted(n + ".mod" for n in astrocyte.get_package().manifest.names())
+
+            def get_runs():
+                with open(runs) as f:
+                    return sorted(f.read().split())
+
+            self.assertRaises(astrocyte.cli.AstroError, run_cli_command, "check -j 2")
+            self.assertEqual(mods, get_runs())
+            # Unchanged mod files aren't compiled again, unless the cache is skipped.
+            self.assertRaises(astrocyte.cli.AstroError, run_cli_command, "check")
+            self.assertEqual(mods, get_runs())
+            self.assertRaises(
+                astrocyte.cli.AstroError, run_cli_command, "check --no-cache"
+            )
+            self.assertEqual(sorted(mods * 2), get_runs())
+            pkg = astrocyte.get_package()
+            failed = {r.name: r for r in pkg.check()}
+            self.assertTrue(all(r.cached for r in failed.values()))
+            self.assertNotIn("glia__my_test__Kca1_1__0", failed)
+            self.assertIn("glia__my_test__NMDA__0", failed)
+            artifacts = failed["glia__my_test__NMDA__0"].artifacts
+            self.assertTrue(
+                os.path.isfile(os.path.join(artifacts, "glia__my_test__NMDA__0.c"))
+            )
+            # Without the cache, earlier entries are replaced.
+            stale = os.path.join(artifacts, "stale.c")
+            open(stale, "w").close()
+            results = pkg.check(use_cache=False)
+            self.assertFalse(any(r.cached for r in results))
+            self.assertFalse(os.path.exists(stale))
+            self.assertTrue(
+                os.path.isfile(os.path.join(artifacts, "glia__my_test__NMDA__0.c"))
+            )
+            cache = os.path.dirname(os.path.dirname(artifacts))
+            self.assertEqual(
+                [os.path.basename(os.path.dirname(artifacts))], os.listdir(cache)
+            )
+            self.assertRaises(astrocyte.cli.BuildError, run_cli_command, "build --check")
+            self.assertEqual("0.0.2", astrocyte.get_package().version)
+        finally:
+            del os.environ["ASTRO_NMODL_COMPILER"]
+            shutil.rmtree(tmp)
+
+    def test_3_profile(self):
+        import json
+
+        with tempfile.TemporaryDirectory() as tmp:
+            trace = os.path.join(tmp, "trace.json")
+            os.environ["ASTRO_PROFILE"] = trace
+            try:
+                run_cli_command("--profile add mod ../tests/mod/NMDA.mod -n Profiled")
+            finally:
+                del os.environ["ASTRO_PROFILE"]
+            self.assertFalse(astrocyte.profiling.enabled())
+            with open(trace) as f:
+                events = json.load(f)["traceEvents"]
+            with open(trace[:-5] + ".txt") as f:
+                summary = f.read()
+        names = {e["name"] for e in events}
+        self.assertIn("Package.add_mod_file", names)
+        self.assertIn("InitFile.flush", names)
+        self.assertIn("GitPythonBackend.commit", names)
+        self.assertIn("Package.add_mod_file", summary)
+        self.assertIn("Processes started:", summary)
+        if hasattr(sys, "addaudithook"):
+            self.assertTrue(any(e["cat"] == "spawn" for e in events))
+        # Without audit hooks, the commands that were run are counted from their spans.
+        profiler = astrocyte.profiling.Profiler(trace)
+        profiler.add("git", "process", 0, 1)
+        profiler.add("git", "process", 1, 2)
+        profiler.add("Package.build", "astro", 0, 2)
+        hook = getattr(sys, "addaudithook", None)
+        try:
+            if hook is not None:
+                del sys.addaudithook
+            summary = profiler.summary()
+        finally:
+            if hook is not None:
+                sys.addaudithook = hook
+        self.assertIn("Processes started: 2\n         2  git\n", summary)
+
+    def test_3_watch(self):
+        from astrocyte.watch import Watcher
+
+        pkg = astrocyte.get_package()
+        shutil.copy2(
+            os.path.join("..", "tests", "mod", "Kca1_1.mod"),
+            pkg.get_mod_path("Dropped.mod"),
+        )
+        run_cli_command("watch --once")
+        self.assertFalse(os.path.exists(pkg.get_mod_path("Dropped.mod")))
+        self.assertEqual("Added glia__my_test__Dropped__0", pkg.repo.head.commit.message)
+        watcher = Watcher(astrocyte.get_package())
+        os.rename(
+            pkg.get_mod_path("glia__my_test__Dropped__0.mod"),
+            pkg.get_mod_path("glia__my_test__Moved__0.mod"),
+        )
+        changes = watcher.sync()
+        self.assertEqual(
+            [("glia__my_test__Dropped__0", "glia__my_test__Moved__0")], changes.renamed
+        )
+        with open(pkg.get_source_path("__init__.py")) as f:
+            init = f.read()
+        self.assertNotIn("Dropped", init)
+        self.assertIn("('Moved', '0', 'SUFFIX'),  #-mod_glia__my_test__Moved__0", init)
+        with open(pkg.get_mod_path("glia__my_test__Moved__0.mod")) as f:
+            self.assertIn("SUFFIX glia__my_test__Moved__0", f.read())
+        self.assertFalse(watcher.sync())
+        os.remove(pkg.get_mod_path("glia__my_test__Moved__0.mod"))
+        self.assertEqual(["glia__my_test__Moved__0"], watcher.sync().removed)
+        with open(pkg.get_source_path("__init__.py")) as f:
+            self.assertNotIn("Moved", f.read())
+        self.assertEqual("Removed glia__my_test__Moved__0", pkg.repo.head.commit.message)
+
+    def test_3_batch(self):
+        pkg = astrocyte.get_package()
+        head = pkg.repo.head.commit
+        with open("notes.txt", "w") as f:
+            f.write("Not an asset")
+        # Defer the commits of separate commands to `astro commit`.
+        run_cli_command("--no-commit edit Glob --name Globbed")
+        run_cli_command("--no-commit add mod ../tests/mod/NMDA.mod -n Deferred")
+        self.assertNotIn("ASTRO_NO_COMMIT", os.environ)
+        self.assertEqual(head, pkg.repo.head.commit)
+        self.assertTrue(os.path.exists(os.path.join(".astro", "pending")))
+        run_cli_command("commit -m Grouped")
+        self.assertEqual(head, pkg.repo.head.commit.parents[0])
+        self.assertTrue(pkg.repo.head.commit.message.startswith("Grouped"))
+        tracked = pkg.repo.git.ls_files().split()
+        self.assertIn("my_test/mod/glia__my_test__Globbed__0.mod", tracked)
+        self.assertIn("my_test/mod/glia__my_test__Deferred__0.mod", tracked)
+        self.assertNotIn("my_test/mod/glia__my_test__Glob__0.mod", tracked)
+        self.assertNotIn("notes.txt", tracked)
+        # Batch operations into a single commit.
+        head = pkg.repo.head.commit
+        pkg = astrocyte.get_package()
+        with pkg.batch("Batched"):
+            pkg.edit_asset("Globbed", name="Glob")
+            pkg.add_mod_file("../tests/mod/Kca1_1.mod", name="Batched")
+        self.assertEqual(head, pkg.repo.head.commit.parents[0])
+        self.assertTrue(pkg.repo.head.commit.message.startswith("Batched\n\nRenamed"))
+        self.assertEqual("", pkg.repo.git.status("--porcelain", "my_test"))
+        os.remove("notes.txt")
 
     def test_4_install(self):
         run_cli_command("install")
@@ -59,5 +294,4 @@ class TestCLI(unittest.TestCase):
             + os.getenv("API_USERNAME")
             + " --password="
             + os.getenv("API_PASSWORD")
-            + " --forget"
         )
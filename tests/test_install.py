@@ -0,0 +1,75 @@
+import unittest, os, sys, zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from astrocyte.install import Wheel, install_wheel, uninstall_distribution, requires_pip
+from astrocyte.wheel import _record_hash
+from astrocyte.exceptions import BuildError
+from tests import make_dir
+
+
+def make_wheel(folder, version, files, requires=(), corrupt=False):
+    dist_info = "stand_in-{}.dist-info".format(version)
+    entries = dict(files)
+    entries[dist_info + "/METADATA"] = "Name: stand-in\nVersion: {}\n".format(
+        version
+    ) + "".join("Requires-Dist: {}\n".format(r) for r in requires)
+    entries[dist_info + "/WHEEL"] = "Wheel-Version: 1.0\nRoot-Is-Purelib: true\n"
+    record = "".join(
+        "{},{},\n".format(name, _record_hash(data.encode()))
+        for name, data in entries.items()
+    )
+    entries[dist_info + "/RECORD"] = record + dist_info + "/RECORD,,\n"
+    if corrupt:
+        entries[next(iter(files))] = "corrupted"
+    path = os.path.join(folder, "stand_in-{}-py3-none-any.whl".format(version))
+    with zipfile.ZipFile(path, "w") as wheel:
+        for name, data in entries.items():
+            wheel.writestr(name, data)
+    return path
+
+
+class TestInstaller(unittest.TestCase):
+    """
+        Check that wheels are unpacked and removed by their RECORD.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.target = os.path.join(self.dir, "site-packages")
+        os.mkdir(self.target)
+
+    def test_install(self):
+        old = make_wheel(
+            self.dir,
+            "1.0",
+            {"stand_in/__init__.py": "v = 1", "stand_in/mod/old.mod": "NEURON {}"},
+        )
+        new = make_wheel(self.dir, "1.1", {"stand_in/__init__.py": "v = 2"})
+        dist_info = install_wheel(old, self.target)
+        self.assertTrue(os.path.isfile(os.path.join(self.target, "stand_in/mod/old.mod")))
+        with open(os.path.join(dist_info, "INSTALLER")) as f:
+            self.assertEqual("astrocyte\n", f.read())
+        # Installing a new version removes the files of the old one.
+        dist_info = install_wheel(new, self.target)
+        self.assertEqual(
+            ["stand_in", "stand_in-1.1.dist-info"], sorted(os.listdir(self.target))
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.target, "stand_in", "mod")))
+        with open(os.path.join(dist_info, "RECORD")) as f:
+            record = f.read()
+        self.assertIn("stand_in-1.1.dist-info/INSTALLER,sha256=", record)
+        self.assertTrue(uninstall_distribution("Stand_In", [self.target]))
+        self.assertEqual([], os.listdir(self.target))
+        self.assertFalse(uninstall_distribution("stand-in", [self.target]))
+
+    def test_invalid(self):
+        corrupt = make_wheel(self.dir, "1.0", {"stand_in/a.py": "a"}, corrupt=True)
+        self.assertRaises(BuildError, install_wheel, corrupt, self.target)
+        escape = make_wheel(self.dir, "1.1", {"../escape.py": "a"})
+        self.assertRaises(BuildError, install_wheel, escape, self.target)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "escape.py")))
+        missing = make_wheel(self.dir, "1.2", {}, requires=["not-installed>=1"])
+        wheel = Wheel(missing)
+        self.assertIn("not-installed", requires_pip(wheel, installed=set()))
+        self.assertIsNone(requires_pip(wheel, installed={"not-installed"}))
+        wheel.close()
@@ -0,0 +1,122 @@
+import unittest, os, sys, subprocess, shutil, textwrap
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte import api
+from astrocyte.journal import PackageLock
+from tests import make_dir, make_package, write_mod
+
+root = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _git(path, *args):
+    return subprocess.run(
+        ["git", *args], cwd=path, stdout=subprocess.PIPE, check=True
+    ).stdout.decode()
+
+
+class TestJournal(unittest.TestCase):
+    """
+        Check that package mutations take turns and that interrupted or failed ones
+        are rolled back or completed.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.path = make_package(os.path.join(self.dir, "pkg"))
+        api.add_mods(self.path, [write_mod(self.dir, "Kv")])
+        self.old_mod = os.path.join(self.path, "pkg", "mod", "glia__pkg__Kv__0.mod")
+        self.new_mod = os.path.join(self.path, "pkg", "mod", "glia__pkg__kdr__0.mod")
+        self.init = os.path.join(self.path, "pkg", "__init__.py")
+
+    def interrupt(self, patch):
+        # Rename the asset in a process that dies at the patched function.
+        script = textwrap.dedent(
+            """
+            import os, sys
+            sys.path.insert(0, {!r})
+            import astrocyte
+            pkg = astrocyte.get_package({!r})
+            {} = lambda *args: os._exit(3)
+            pkg.edit_asset("Kv", name="kdr")
+            """
+        ).format(root, self.path, patch)
+        process = subprocess.run([sys.executable, "-c", script])
+        self.assertEqual(3, process.returncode)
+        self.assertTrue(os.path.exists(os.path.join(self.path, ".astro", "journal")))
+
+    def test_rollback_interrupted(self):
+        with open(self.init) as f:
+            init = f.read()
+        self.interrupt("pkg.commit")
+        self.assertTrue(os.path.exists(self.new_mod))
+        pkg = astrocyte.get_package(self.path)
+        pkg.messages = []
+        with pkg.lock():
+            pass
+        self.assertEqual(["Rolled back an interrupted operation."], pkg.messages)
+        self.assertTrue(os.path.exists(self.old_mod))
+        self.assertFalse(os.path.exists(self.new_mod))
+        self.assertFalse(os.path.exists(os.path.join(self.path, ".astro", "journal")))
+        with open(self.init) as f:
+            self.assertEqual(init, f.read())
+        self.assertEqual(["glia__pkg__Kv__0"], pkg.manifest.names())
+
+    @unittest.skipIf(shutil.which("git") is None, "git isn't installed")
+    def test_roll_forward(self):
+        self.interrupt("pkg.vcs.commit")
+        pkg = astrocyte.get_package(self.path)
+        pkg.messages = []
+        pkg.edit_asset("kdr", variant="fast")
+        self.assertEqual("Made the commit of an interrupted operation.", pkg.messages[0])
+        log = _git(self.path, "log", "--format=%s").split("\n")
+        self.assertEqual(["Renamed kdr.0 to kdr.fast", "Renamed Kv.0 to kdr.0"], log[:2])
+        self.assertEqual("", _git(self.path, "status", "--porcelain"))
+
+    def test_rollback_error(self):
+        pkg = astrocyte.get_package(self.path)
+        with open(self.init) as f:
+            init = f.read()
+        with self.assertRaises(RuntimeError):
+            with pkg.lock():
+                pkg.defer_commits = True
+                pkg.edit_asset("Kv", name="kdr")
+                raise RuntimeError("Failure after the rename")
+        self.assertTrue(os.path.exists(self.old_mod))
+        self.assertFalse(os.path.exists(self.new_mod))
+        with open(self.init) as f:
+            self.assertEqual(init, f.read())
+        self.assertEqual(["glia__pkg__Kv__0"], pkg.manifest.names())
+
+    def test_processes(self):
+        lock_path = os.path.join(self.path, ".astro", "lock")
+        script = textwrap.dedent(
+            """
+            import sys
+            sys.path.insert(0, {!r})
+            from astrocyte.journal import PackageLock
+            lock = PackageLock({!r})
+            lock.acquire()
+            print("locked", flush=True)
+            sys.stdin.read()
+            """
+        ).format(root, lock_path)
+        process = subprocess.Popen(
+            [sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self.assertEqual(b"locked\n", process.stdout.readline())
+        waits = []
+        lock = PackageLock(lock_path)
+
+        def on_wait():
+            waits.append(True)
+            # Let the other process release the lock.
+            process.stdin.close()
+
+        self.assertTrue(lock.acquire(on_wait=on_wait))
+        self.assertFalse(lock.acquire())
+        lock.release()
+        lock.release()
+        process.wait()
+        process.stdout.close()
+        self.assertEqual([True], waits)
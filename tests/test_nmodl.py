@@ -0,0 +1,87 @@
+import unittest, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from astrocyte import nmodl
+
+source = """TITLE A NEURON mechanism
+COMMENT
+NEURON {
+  POINT_PROCESS Fake
+}
+ENDCOMMENT
+NEURON {
+  SUFFIX hh : POINT_PROCESS in a trailing comment
+  RANGE gbar
+}
+VERBATIM
+  ARTIFICIAL_CELL Fake
+ENDVERBATIM
+"""
+
+
+class TestScanner(unittest.TestCase):
+    """
+        Check that the NMODL scanner ignores comments and renames mechanisms.
+    """
+
+    def test_scan(self):
+        scan = nmodl.scan(source)
+        self.assertEqual("SUFFIX", scan.kind)
+        self.assertEqual((6, 7), scan.neuron_block)
+        self.assertEqual(["hh"], [s.name for s in scan.name_statements])
+        self.assertEqual([("COMMENT", 1, 5), ("VERBATIM", 10, 12)], scan.regions)
+
+    def test_rename(self):
+        lines = nmodl.scan(source).rename("glia__pkg__hh__0")
+        self.assertEqual("NEURON {\n", lines[6])
+        self.assertEqual("SUFFIX glia__pkg__hh__0\n", lines[7])
+        self.assertEqual("   : POINT_PROCESS in a trailing comment\n", lines[8])
+        self.assertEqual("  POINT_PROCESS Fake\n", lines[3])
+        scan = nmodl.scan(lines)
+        self.assertEqual(["glia__pkg__hh__0"], [s.name for s in scan.name_statements])
+
+    def test_interface(self):
+        scan = nmodl.scan(
+            "NEURON {\n"
+            "  SUFFIX kca RANGE gbar, g : RANGE fake\n"
+            "  GLOBAL q10\n"
+            "  USEION k READ ek WRITE ik\n"
+            "  USEION ca READ cai, cao VALENCE 2\n"
+            "  NONSPECIFIC_CURRENT il\n"
+            "}\n"
+            "PARAMETER {\n"
+            "  gbar = 1e-3 (S/cm2) <0, 1e9>\n"
+            "  q10 = 3\n"
+            "COMMENT\n"
+            "  fake = 1\n"
+            "ENDCOMMENT\n"
+            "  cai (mM) el = -54.3 (mV) }\n"
+        )
+        interface = scan.interface()
+        self.assertEqual(["gbar", "g"], interface["range"])
+        self.assertEqual(["q10"], interface["global"])
+        self.assertEqual(["il"], interface["nonspecific_current"])
+        self.assertEqual(
+            {
+                "k": {"read": ["ek"], "write": ["ik"], "valence": None},
+                "ca": {"read": ["cai", "cao"], "write": [], "valence": 2.0},
+            },
+            interface["ions"],
+        )
+        self.assertEqual(
+            {
+                "gbar": {"value": 0.001, "units": "S/cm2", "limits": [0.0, 1e9]},
+                "q10": {"value": 3.0, "units": None, "limits": None},
+                "cai": {"value": None, "units": "mM", "limits": None},
+                "el": {"value": -54.3, "units": "mV", "limits": None},
+            },
+            interface["parameters"],
+        )
+
+    def test_inline_block(self):
+        scan = nmodl.scan("NEURON { POINT_PROCESS syn RANGE g }\n")
+        self.assertEqual("POINT_PROCESS", scan.kind)
+        lines = scan.rename("glia__pkg__syn__0")
+        self.assertEqual(
+            ["NEURON {\n", "POINT_PROCESS glia__pkg__syn__0\n", "RANGE g }\n"], lines
+        )
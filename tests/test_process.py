@@ -0,0 +1,41 @@
+import unittest, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from astrocyte.process import run_command
+from astrocyte.exceptions import CommandTimeoutError
+
+
+class TestRunCommand(unittest.TestCase):
+    """
+        Check that commands are streamed without blocking on either pipe.
+    """
+
+    def test_streams(self):
+        # Fill the stderr pipe before writing to stdout.
+        script = "import sys; sys.stderr.write('e' * 500000); print('a'); print('b')"
+        lines = []
+        result = run_command(
+            [sys.executable, "-c", script], on_stdout=lines.append, capture_limit=1000
+        )
+        self.assertTrue(result)
+        # Only the tail of the output is kept.
+        self.assertEqual(
+            "[... 499000 characters truncated ...]\n" + "e" * 1000, result.stderr
+        )
+        self.assertEqual(["a\n", "b\n"], [l.replace("\r", "") for l in lines])
+
+    def test_capture(self):
+        script = "print('x' * 999999); print('end')"
+        result = run_command(
+            [sys.executable, "-c", script], on_stdout=None, capture_limit=10
+        )
+        self.assertEqual(
+            "[... 999994 characters truncated ...]\nxxxxx\nend\n",
+            result.stdout.replace("\r", ""),
+        )
+        result = run_command([sys.executable, "-c", "print('short')"], on_stdout=None)
+        self.assertEqual("short\n", result.stdout.replace("\r", ""))
+
+    def test_timeout(self):
+        cmnd = [sys.executable, "-c", "import time; time.sleep(10)"]
+        self.assertRaises(CommandTimeoutError, run_command, cmnd, timeout=0.2)
@@ -0,0 +1,134 @@
+import unittest, os, sys, io, argparse, subprocess, shutil, contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte import api
+from astrocyte.exceptions import AstroError, MultipleMatchesError, NameCollisionError
+from tests import make_dir, make_package, write_mod
+
+
+class TestRename(unittest.TestCase):
+    """
+        Check that bulk edits plan all renames, refuse collisions and make a single
+        commit.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.path = make_package(os.path.join(self.dir, "pkg"))
+        mods = [write_mod(self.dir, name) for name in ("Kv1", "Kv2", "Kv3", "Na")]
+        api.add_mods(self.path, mods)
+
+    def assertAssets(self, names):
+        pkg = astrocyte.get_package(self.path)
+        self.assertEqual(names, pkg.manifest.names())
+        self.assertEqual(names, sorted(f[:-4] for f in os.listdir(pkg.get_mod_path())))
+        with open(pkg.get_source_path("__init__.py")) as f:
+            init = f.read()
+        for name in names:
+            self.assertIn("#-mod_" + name + "\n", init)
+            with open(pkg.get_mod_path(name + ".mod")) as f:
+                self.assertIn("SUFFIX " + name + "\n", f.read())
+
+    def test_variant(self):
+        result = api.edit_assets(self.path, "Kv", variant="fast", dry_run=True)
+        self.assertFalse(result.applied)
+        self.assertEqual(3, len(result.renames))
+        self.assertAssets(
+            [
+                "glia__pkg__Kv1__0",
+                "glia__pkg__Kv2__0",
+                "glia__pkg__Kv3__0",
+                "glia__pkg__Na__0",
+            ]
+        )
+        result = api.edit_assets(self.path, "Kv", variant="fast")
+        self.assertEqual(
+            [
+                ("glia__pkg__Kv1__0", "glia__pkg__Kv1__fast"),
+                ("glia__pkg__Kv2__0", "glia__pkg__Kv2__fast"),
+                ("glia__pkg__Kv3__0", "glia__pkg__Kv3__fast"),
+            ],
+            result.renames,
+        )
+        self.assertAssets(
+            [
+                "glia__pkg__Kv1__fast",
+                "glia__pkg__Kv2__fast",
+                "glia__pkg__Kv3__fast",
+                "glia__pkg__Na__0",
+            ]
+        )
+        if shutil.which("git") is not None:
+            log = subprocess.run(
+                ["git", "log", "--format=%s"],
+                cwd=self.path,
+                stdout=subprocess.PIPE,
+                check=True,
+            ).stdout.decode()
+            self.assertTrue(log.startswith("Renamed 3 assets\nAdded 4 mod files\n"))
+
+    def test_regex(self):
+        api.edit_assets(self.path, r"__Kv2__", name="Kv1b", regex=True)
+        # Kv1 takes over the name of Kv1b, which is renamed in the same edit.
+        result = api.edit_assets(self.path, r"__(Kv1b?)__", name=r"\1b", regex=True)
+        self.assertEqual(
+            [
+                ("glia__pkg__Kv1__0", "glia__pkg__Kv1b__0"),
+                ("glia__pkg__Kv1b__0", "glia__pkg__Kv1bb__0"),
+            ],
+            result.renames,
+        )
+        self.assertAssets(
+            [
+                "glia__pkg__Kv1b__0",
+                "glia__pkg__Kv1bb__0",
+                "glia__pkg__Kv3__0",
+                "glia__pkg__Na__0",
+            ]
+        )
+
+    def test_cli(self):
+        from astrocyte.cli import edit_mod_file
+
+        pkg = astrocyte.get_package(self.path)
+        args = argparse.Namespace(
+            pkg=pkg,
+            asset="Kv[12]",
+            name=None,
+            variant="slow",
+            all_matches=True,
+            regex=False,
+            dry_run=True,
+        )
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            edit_mod_file(args)
+        self.assertEqual(
+            "glia__pkg__Kv1__0 -> glia__pkg__Kv1__slow\n"
+            + "glia__pkg__Kv2__0 -> glia__pkg__Kv2__slow\n"
+            + "Dry run, 2 assets would be renamed.\n",
+            output.getvalue(),
+        )
+        args.all_matches = args.dry_run = False
+        with self.assertRaises(MultipleMatchesError):
+            edit_mod_file(args)
+
+    def test_errors(self):
+        with self.assertRaises(NameCollisionError):
+            api.edit_assets(self.path, "Kv", name="Kv")
+        with self.assertRaises(NameCollisionError):
+            api.edit_assets(self.path, "Kv1", name="Na")
+        with self.assertRaises(AstroError):
+            api.edit_assets(self.path, "Kv", name="bad__name")
+        with self.assertRaises(AstroError):
+            api.edit_assets(self.path, "(", name="x", regex=True)
+        with self.assertRaises(AstroError):
+            api.edit_assets(self.path, "Kv", name=r"\2", regex=True)
+        self.assertAssets(
+            [
+                "glia__pkg__Kv1__0",
+                "glia__pkg__Kv2__0",
+                "glia__pkg__Kv3__0",
+                "glia__pkg__Na__0",
+            ]
+        )
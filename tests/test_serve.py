@@ -0,0 +1,173 @@
+import unittest, os, sys, stat, json, argparse, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte, astrocyte.cli
+from astrocyte.exceptions import AstroError, MultipleMatchesError
+from astrocyte.exceptions import InterpreterMismatchError
+from astrocyte.serve import Server, connect, METHOD_NOT_FOUND, INVALID_PARAMS
+from tests import make_dir, make_package, write_mod
+
+
+@unittest.skipIf(os.name != "posix", "The daemon needs Unix domain sockets")
+class TestServe(unittest.TestCase):
+    """
+        Check that the daemon runs commands on the packages it keeps loaded, and that
+        the CLI forwards to it.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.socket = os.path.join(self.dir, "astro.sock")
+        path = make_package(os.path.join(self.dir, "pkg"), name="served")
+        self.path = os.path.realpath(path)
+        self.mods = [write_mod(self.dir, name) for name in ("Kv", "Na", "Ca")]
+        self.server = Server(self.socket)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def call(self, method, **params):
+        with connect(self.socket) as client:
+            return client.call(method, params)
+
+    def test_commands(self):
+        result = self.call("add", path=self.path, files=self.mods[:1], name="kv")
+        self.assertEqual("Added mod file.\n", result["output"])
+        self.call("add", path=self.path, files=self.mods[1:])
+        self.call("edit", path=self.path, asset="__kv__", variant="fast")
+        # Changes made without the daemon are picked up.
+        astrocyte.get_package(self.path).remove_mod_file("glia__served__Ca__0")
+        candidates = self.call("candidates", path=self.path, name="served")
+        self.assertEqual(
+            ["glia__served__Na__0", "glia__served__kv__fast"], candidates["candidates"]
+        )
+        with self.assertRaises(AstroError):
+            self.call("rm", path=self.path, name="Na", confirmed=["glia__served__Ca__0"])
+        self.call("rm", path=self.path, name="Na", confirmed=["glia__served__Na__0"])
+        pkg = astrocyte.get_package(self.path)
+        self.assertEqual(["glia__served__kv__fast"], pkg.manifest.names())
+        with open(pkg.get_source_path("__init__.py")) as f:
+            self.assertIn("('kv', 'fast', 'SUFFIX'),", f.read())
+        self.assertEqual([self.path], self.call("ping")["packages"])
+
+    def test_errors(self):
+        self.call("add", path=self.path, files=self.mods)
+        with self.assertRaises(MultipleMatchesError):
+            self.call("edit", path=self.path, asset="served", name="x")
+        with connect(self.socket) as client:
+            client._file.write(b'{"jsonrpc": "2.0", "id": 1, "method": "fly"}\n')
+            client._file.write(b'{"jsonrpc": "2.0", "id": 2, "method": "ping",')
+            client._file.write(b' "params": {"height": 1}}\nnot json\n')
+            client._file.flush()
+            errors = [
+                json.loads(client._file.readline())["error"]["code"] for _ in range(3)
+            ]
+        self.assertEqual([METHOD_NOT_FOUND, INVALID_PARAMS, -32700], errors)
+
+    def test_concurrent(self):
+        errors = []
+
+        def add(mod):
+            try:
+                self.call("add", path=self.path, files=[mod])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=add, args=(mod,)) for mod in self.mods]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        pkg = astrocyte.get_package(self.path)
+        self.assertEqual(3, len(pkg.manifest.names()))
+        with open(pkg.get_source_path("__init__.py")) as f:
+            self.assertEqual(3, f.read().count("#-mod_"))
+
+    def test_forward(self):
+        os.environ["ASTRO_SOCKET"] = self.socket
+        cwd = os.getcwd()
+        os.chdir(self.path)
+        astrocyte.cli._exit_on_fail = False
+        argv = sys.argv
+        try:
+            sys.argv = ["astro", "add", "mod", os.path.relpath(self.mods[0])]
+            astrocyte.cli.astrocyte_cli()
+            self.assertEqual(
+                ["glia__served__Kv__0"],
+                self.call("candidates", path=self.path, name="Kv")["candidates"],
+            )
+            sys.argv = ["astro", "rm", "mod", "Kv", "-f"]
+            astrocyte.cli.astrocyte_cli()
+        finally:
+            sys.argv = argv
+            os.chdir(cwd)
+            del os.environ["ASTRO_SOCKET"]
+            astrocyte.cli._exit_on_fail = True
+        self.assertEqual([self.path], self.call("ping")["packages"])
+        self.assertEqual([], astrocyte.get_package(self.path).manifest.names())
+
+    def test_interpreter(self):
+        with self.assertRaises(InterpreterMismatchError):
+            self.call("add", path=self.path, files=self.mods, interpreter=["x", "/venv"])
+        # The CLI of another interpreter runs the command itself.
+        os.environ["ASTRO_SOCKET"] = self.socket
+        get_interpreter = astrocyte.serve.get_interpreter
+        astrocyte.serve.get_interpreter = lambda: ["x", "/venv"]
+        cwd = os.getcwd()
+        os.chdir(self.path)
+        try:
+            args = argparse.Namespace(
+                func=astrocyte.cli.add_mod_file,
+                no_daemon=False,
+                profile=None,
+                files=self.mods[:1],
+                name=None,
+                variant="0",
+                jobs=1,
+            )
+            self.assertFalse(astrocyte.cli._forward(args))
+        finally:
+            os.chdir(cwd)
+            astrocyte.serve.get_interpreter = get_interpreter
+            del os.environ["ASTRO_SOCKET"]
+        self.assertEqual([], self.call("ping")["packages"])
+
+    def test_build_output(self):
+        self.call("add", path=self.path, files=self.mods[:1])
+        result = self.call("build", path=self.path, backend="setuptools")
+        # Printed by `setup.py bdist_wheel`, which runs in a subprocess.
+        self.assertIn("running bdist_wheel", result["output"])
+        self.assertIn("Glia package built.", result["output"])
+
+    def test_socket_checks(self):
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.socket).st_mode))
+        # Something else at the path is neither connected to nor replaced.
+        path = os.path.join(self.dir, "file.sock")
+        with open(path, "w") as f:
+            f.write("Not a socket")
+        with self.assertRaises(AstroError):
+            connect(path)
+        with self.assertRaises(AstroError):
+            Server(path)
+        self.assertTrue(os.path.isfile(path))
+        # The folder in `/tmp` is created private, and refused if it isn't.
+        folder = os.path.join(self.dir, "private")
+        get_private_folder = astrocyte.serve._get_private_folder
+        astrocyte.serve._get_private_folder = lambda: folder
+        try:
+            path = os.path.join(folder, "astro.sock")
+            self.assertIsNone(connect(path))
+            Server(path).server_close()
+            self.assertEqual(0o700, stat.S_IMODE(os.stat(folder).st_mode))
+            os.chmod(folder, 0o755)
+            with self.assertRaises(AstroError):
+                connect(path)
+            with self.assertRaises(AstroError):
+                Server(path)
+        finally:
+            astrocyte.serve._get_private_folder = get_private_folder
@@ -0,0 +1,125 @@
+import unittest, os, sys, time, threading, tempfile, shutil, zipfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from astrocyte.upload import Uploader
+from astrocyte.exceptions import (
+    UploadError,
+    AuthenticationError,
+    InvalidDistributionError,
+)
+
+
+class StandInIndex(BaseHTTPRequestHandler):
+    # Responses to the next requests, by method; 200 when exhausted. `None` responds
+    # after the client gave up on it.
+    responses = {"GET": [], "POST": []}
+    requests = []
+
+    def respond(self, method):
+        queue = self.responses[method]
+        status = queue.pop(0) if queue else 200
+        if status is None:
+            time.sleep(0.5)
+            status = 200
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        except OSError:
+            pass
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path, b""))
+        self.respond("GET")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.requests.append(("POST", self.path, body))
+        self.respond("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_wheel(folder, version):
+    path = os.path.join(folder, "stand_in-{}-py3-none-any.whl".format(version))
+    with zipfile.ZipFile(path, "w") as wheel:
+        wheel.writestr(
+            "stand_in-{}.dist-info/METADATA".format(version),
+            "Metadata-Version: 2.1\nName: stand-in\nVersion: {}\n"
+            "Author-email: dude@example.com\nClassifier: A\nClassifier: B\n\n"
+            "Readme\n".format(version),
+        )
+    return path
+
+
+class TestUploader(unittest.TestCase):
+    """
+        Check the legacy upload protocol against a stand-in index.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInIndex)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}".format(cls.server.server_port)
+        cls.dist = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.dist)
+
+    def setUp(self):
+        StandInIndex.requests.clear()
+        StandInIndex.responses["GET"].clear()
+        StandInIndex.responses["POST"].clear()
+        self.uploader = Uploader(
+            repository_url=self.url + "/legacy/",
+            index_url=self.url + "/pypi",
+            username="dude",
+            password="bruv",
+            backoff=0,
+        )
+
+    def tearDown(self):
+        self.uploader.close()
+
+    def test_upload(self):
+        wheels = [make_wheel(self.dist, "1.0"), make_wheel(self.dist, "1.1")]
+        # 1.0 already exists, the first upload of 1.1 hits a server error.
+        StandInIndex.responses["GET"].extend([200, 404])
+        StandInIndex.responses["POST"].append(503)
+        self.assertEqual(wheels[1:], self.uploader.upload(wheels))
+        methods = [r[0] for r in StandInIndex.requests]
+        self.assertEqual(["GET", "GET", "POST", "POST"], methods)
+        self.assertEqual("/pypi/stand-in/1.0/json", StandInIndex.requests[0][1])
+        body = StandInIndex.requests[-1][2]
+        self.assertIn(b'name=":action"\r\n\r\nfile_upload', body)
+        self.assertIn(b'name="sha256_digest"', body)
+        self.assertEqual(2, body.count(b'name="classifiers"'))
+        self.assertIn(b'filename="stand_in-1.1-py3-none-any.whl"', body)
+
+    def test_errors(self):
+        wheel = make_wheel(self.dist, "2.0")
+        StandInIndex.responses["GET"].append(404)
+        StandInIndex.responses["POST"].append(403)
+        self.assertRaises(AuthenticationError, self.uploader.upload, [wheel])
+        self.assertRaises(InvalidDistributionError, self.uploader.upload, [])
+        invalid = os.path.join(self.dist, "invalid.whl")
+        with open(invalid, "w") as f:
+            f.write("not a zip")
+        self.assertRaises(InvalidDistributionError, self.uploader.upload, [invalid])
+
+    def test_timeout(self):
+        uploader = Uploader(index_url=self.url + "/pypi", backoff=0, timeout=0.2)
+        # The request that times out is retried.
+        StandInIndex.responses["GET"].extend([None, 404])
+        self.assertFalse(uploader.exists("stand-in", "3.0"))
+        self.assertEqual(2, len(StandInIndex.requests))
+        uploader.retries = 0
+        StandInIndex.responses["GET"].append(None)
+        self.assertRaises(UploadError, uploader.exists, "stand-in", "3.0")
+        uploader.close()
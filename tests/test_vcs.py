@@ -0,0 +1,159 @@
+import unittest, os, sys, shutil, subprocess, zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte.cli import create_package
+from astrocyte.vcs import DirectBackend
+from tests import make_dir, make_package, write_mod
+
+
+def git(path, *args):
+    return subprocess.run(
+        ["git"] + list(args),
+        cwd=path,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@unittest.skipIf(shutil.which("git") is None, "git is needed to verify repositories")
+class TestDirectBackend(unittest.TestCase):
+    """
+        Check that the direct backend writes repositories that git accepts.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+
+    def test_commits(self):
+        vcs = DirectBackend(self.dir)
+        vcs.init()
+        write(os.path.join(self.dir, "a.txt"), "a")
+        write(os.path.join(self.dir, "pkg", "mod", "b.mod"), "b")
+        write(os.path.join(self.dir, "pkg-c.txt"), "c")
+        first = vcs.commit(
+            ["a.txt", "pkg/mod/b.mod", "pkg-c.txt"], "First", "Dude", "d@e.com"
+        )
+        os.remove(os.path.join(self.dir, "a.txt"))
+        write(os.path.join(self.dir, "pkg", "mod", "b.mod"), "bb")
+        second = vcs.commit(["a.txt", "pkg/mod/b.mod"], "Second", "Dude", "d@e.com")
+        git(self.dir, "fsck", "--strict")
+        self.assertEqual("", git(self.dir, "status", "--porcelain"))
+        self.assertEqual(second + "\n" + first + "\n", git(self.dir, "rev-list", "HEAD"))
+        self.assertEqual("bb", git(self.dir, "show", "HEAD:pkg/mod/b.mod"))
+        self.assertEqual(
+            "Dude <d@e.com>\n", git(self.dir, "log", "-1", "--format=%an <%ae>")
+        )
+        # Continue on an index and refs written by git.
+        write(os.path.join(self.dir, "d.txt"), "d")
+        git(self.dir, "add", "d.txt")
+        git(
+            self.dir,
+            "-c",
+            "user.name=x",
+            "-c",
+            "user.email=x@y.z",
+            "commit",
+            "-qm",
+            "Git",
+        )
+        git(self.dir, "pack-refs", "--all")
+        write(os.path.join(self.dir, "e.txt"), "e")
+        vcs.commit(["e.txt"], "Third", "Dude", "d@e.com")
+        git(self.dir, "fsck", "--strict")
+        self.assertEqual("", git(self.dir, "status", "--porcelain"))
+        self.assertEqual(
+            "Third\nGit\nSecond\nFirst\n", git(self.dir, "log", "--format=%s")
+        )
+
+    def test_create_package(self):
+        args = type("Namespace", (object,), {"folder": os.path.join(self.dir, "direct")})
+        args.vcs = "direct"
+        presets = {"author": "Dude", "email": "d@e.com", "pkg_name": "direct"}
+        create_package(args, presets)
+        pkg = astrocyte.get_package(args.folder)
+        self.assertEqual("direct", pkg.data["vcs"])
+        mod_file = os.path.join(os.path.dirname(__file__), "mod", "NMDA.mod")
+        if os.path.exists(mod_file):
+            pkg.add_mod_file(mod_file)
+        git(args.folder, "fsck", "--strict")
+        self.assertEqual("", git(args.folder, "status", "--porcelain"))
+        # Throwaway packages don't get a repository.
+        args.folder = os.path.join(self.dir, "none")
+        args.vcs = "none"
+        create_package(args, presets)
+        self.assertFalse(os.path.exists(os.path.join(args.folder, ".git")))
+
+
+@unittest.skipIf(shutil.which("git") is None, "git is needed to verify repositories")
+class TestLocalFiles(unittest.TestCase):
+    """
+        Check that the local state in `.astro` never leaves the work tree changed.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.path = make_package(os.path.join(self.dir, "pkg"))
+        self.mod = write_mod(self.dir, "Kv")
+
+    def build(self):
+        pkg = astrocyte.get_package(self.path)
+        pkg.add_mod_file(self.mod)
+        pkg.build(backend="native")
+        self.assertTrue(pkg.built())
+        self.assertTrue(os.path.exists(os.path.join(self.path, ".astro", "build")))
+        self.assertEqual("", git(self.path, "status", "--porcelain"))
+
+    def test_build(self):
+        self.build()
+        self.assertNotIn("Ignored", git(self.path, "log", "--format=%s"))
+        pkg = astrocyte.get_package(self.path)
+        with zipfile.ZipFile(pkg.get_distribution()) as wheel:
+            self.assertIn("pkg/mod/interfaces.json", wheel.namelist())
+
+    def test_legacy(self):
+        # Older versions added the files to the ignore file one by one.
+        write(os.path.join(self.path, ".astro", ".gitignore"), "manifest\n")
+        git(
+            self.path,
+            "-c",
+            "user.name=x",
+            "-c",
+            "user.email=x@y.z",
+            "commit",
+            "-qam",
+            "_",
+        )
+        self.build()
+        log = git(self.path, "log", "--format=%s").split("\n")
+        self.assertIn("Ignored the local files of Astrocyte", log)
+
+    def test_legacy_interfaces(self):
+        # Older versions didn't ship the interfaces of the mod files.
+        for name, line in (("setup.py", "interfaces.json"), (".gitignore", "interfaces")):
+            with open(os.path.join(self.path, name)) as f:
+                lines = [l for l in f.read().split("\n") if line not in l]
+            write(os.path.join(self.path, name), "\n".join(lines))
+        git(
+            self.path,
+            "-c",
+            "user.name=x",
+            "-c",
+            "user.email=x@y.z",
+            "commit",
+            "-qam",
+            "_",
+        )
+        self.build()
+        pkg = astrocyte.get_package(self.path)
+        self.assertFalse(pkg.ships_interfaces())
+        self.assertFalse(os.path.exists(pkg.get_mod_path("interfaces.json")))
+        with zipfile.ZipFile(pkg.get_distribution()) as wheel:
+            self.assertNotIn("pkg/mod/interfaces.json", wheel.namelist())
@@ -0,0 +1,111 @@
+import unittest, os, sys, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte.watch import Watcher, get_source
+from tests import make_dir, make_package, mod_source, write_mod
+
+
+class TestSources(unittest.TestCase):
+    """
+        Check that the event sources notice changes to mod files only.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+
+    def write_later(self, name):
+        def write():
+            with open(os.path.join(self.dir, name), "w") as f:
+                f.write("NEURON {}")
+
+        timer = threading.Timer(0.1, write)
+        timer.start()
+        return timer
+
+    def check_source(self, source):
+        try:
+            self.assertFalse(source.wait(0.1))
+            self.write_later("other.txt").join()
+            self.assertFalse(source.wait(0.3))
+            self.write_later("new.mod")
+            self.assertTrue(source.wait(5))
+        finally:
+            source.close()
+
+    def test_inotify(self):
+        source = get_source(self.dir)
+        if source.__class__.__name__ != "InotifySource":
+            self.skipTest("inotify isn't available")
+        self.check_source(source)
+
+    def test_polling(self):
+        self.check_source(get_source(self.dir, polling=True, interval=0.05))
+
+
+class TestSync(unittest.TestCase):
+    """
+        Check that a sync registers, updates and unregisters the mod files that were
+        added, modified and deleted, and that its own writes don't trigger another.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.pkg = astrocyte.get_package(make_package(os.path.join(self.dir, "pkg")))
+        self.watcher = Watcher(self.pkg)
+        self.path = self.pkg.get_mod_path("glia__pkg__Kv__0.mod")
+
+    def read_init(self):
+        with open(self.pkg.get_source_path("__init__.py")) as f:
+            return f.read()
+
+    def add(self):
+        write_mod(self.pkg.get_mod_path(), "Kv")
+        return self.watcher.sync()
+
+    def test_add(self):
+        changes = self.add()
+        self.assertEqual(["glia__pkg__Kv__0"], changes.added)
+        self.assertFalse(os.path.exists(self.pkg.get_mod_path("Kv.mod")))
+        with open(self.path) as f:
+            self.assertIn("SUFFIX glia__pkg__Kv__0", f.read())
+        self.assertIn("#-mod_glia__pkg__Kv__0", self.read_init())
+        self.assertEqual(["glia__pkg__Kv__0"], self.pkg.manifest.names())
+        self.assertFalse(self.watcher.sync())
+
+    def test_modify(self):
+        self.add()
+        digest = self.pkg.manifest.get("glia__pkg__Kv__0")["hash"]
+        # Written with the original name statement, which is sanitized again.
+        with open(self.path, "w") as f:
+            f.write(mod_source("Kv").replace("0.1", "0.25"))
+        changes = self.watcher.sync()
+        self.assertEqual(["glia__pkg__Kv__0"], changes.updated)
+        with open(self.path) as f:
+            content = f.read()
+        self.assertIn("SUFFIX glia__pkg__Kv__0", content)
+        self.assertIn("gbar = 0.25", content)
+        self.assertNotEqual(digest, self.pkg.manifest.get("glia__pkg__Kv__0")["hash"])
+        self.assertIn("#-mod_glia__pkg__Kv__0", self.read_init())
+
+    def test_delete(self):
+        self.add()
+        os.remove(self.path)
+        changes = self.watcher.sync()
+        self.assertEqual(["glia__pkg__Kv__0"], changes.removed)
+        self.assertNotIn("glia__pkg__Kv__0", self.read_init())
+        self.assertEqual([], self.pkg.manifest.names())
+
+    def test_own_writes(self):
+        source = get_source(self.pkg.get_mod_path(), polling=True, interval=0.01)
+        try:
+            self.add()
+            names = source.wait(0.1)
+            self.assertIn("glia__pkg__Kv__0.mod", names)
+            self.assertEqual(set(), self.watcher._get_external(names))
+            with open(self.path, "a") as f:
+                f.write("\n")
+            names = source.wait(0.1)
+            self.assertEqual({"glia__pkg__Kv__0.mod"}, self.watcher._get_external(names))
+        finally:
+            source.close()
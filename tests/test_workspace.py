@@ -0,0 +1,66 @@
+import unittest, os, sys, json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import astrocyte
+from astrocyte import api
+from astrocyte.workspace import Workspace, find_workspace, WORKSPACE_FILE
+from tests import make_dir, make_package, write_mod
+
+
+class TestWorkspace(unittest.TestCase):
+    """
+        Check that workspaces find their packages and run actions on them in worker
+        processes.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        os.mkdir(os.path.join(self.dir, "packages"))
+        self.paths = []
+        for name in ("alpha", "beta"):
+            path = make_package(os.path.join(self.dir, "packages", name))
+            api.add_mods(path, [write_mod(self.dir, name.title())])
+            self.paths.append(path)
+        # Not a package of the workspace.
+        os.makedirs(os.path.join(self.dir, ".hidden", ".astro"))
+        open(os.path.join(self.dir, ".hidden", ".astro", "pkg"), "w").close()
+
+    def test_discover(self):
+        workspace = find_workspace(self.paths[0])
+        self.assertEqual(self.paths[0], workspace.root)
+        self.assertEqual(self.paths, Workspace(self.dir).get_package_paths())
+        with open(os.path.join(self.dir, WORKSPACE_FILE), "w") as f:
+            json.dump({"packages": ["packages/beta"]}, f)
+        workspace = find_workspace(os.path.join(self.paths[0], "alpha"))
+        self.assertEqual(self.dir, workspace.root)
+        self.assertEqual(self.paths[1:], workspace.get_package_paths())
+
+    def test_build(self):
+        results = Workspace(self.dir).run("build", jobs=2, backend="native")
+        self.assertEqual(self.paths, [result.path for result in results])
+        self.assertTrue(all(result.ok for result in results))
+        for path, result in zip(self.paths, results):
+            self.assertEqual(
+                os.path.join(path, ".astro", "logs", "build.log"), result.log
+            )
+            with open(result.log) as f:
+                self.assertIn("Glia package built.", f.read())
+            wheel = astrocyte.get_package(path).get_distribution()
+            self.assertTrue(wheel.endswith(".whl") and os.path.isfile(wheel))
+
+    def test_errors(self):
+        # Failures are reported per package, also from the worker processes.
+        results = Workspace(self.dir).run("fly", jobs=2)
+        self.assertEqual([False, False], [result.ok for result in results])
+        self.assertEqual(
+            ["Unknown workspace action 'fly'."] * 2, [result.error for result in results]
+        )
+        with open(results[0].log) as f:
+            self.assertIn("Traceback", f.read())
+
+    def test_worker_errors(self):
+        # Packages that can't be sent to the worker processes fail one by one.
+        results = Workspace(self.dir).run("build", jobs=2, callback=lambda: None)
+        self.assertEqual(self.paths, [result.path for result in results])
+        self.assertEqual([False, False], [result.ok for result in results])
+        self.assertTrue(all(result.error and result.log is None for result in results))
@@ -0,0 +1,156 @@
+import unittest, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from astrocyte import InitFile, Writer
+from astrocyte.templates import parse_template
+from tests import make_dir
+
+
+# Template of the packages created before the asset table.
+legacy_template = """import os
+
+__version__ = "0.0.0"
+
+class Package:
+  def __init__(self):
+    self.mods = []
+
+class Mod:
+  pass
+
+def package():
+  pkg = Package()
+  pkg.path = os.path.dirname(__file__)
+  pkg.name = os.path.basename(pkg.path)
+
+  return pkg
+"""
+
+
+class Mod:
+    def __init__(self, name, variant="0", statement="SUFFIX"):
+        self.asset_name = name
+        self.variant = variant
+        self._name_statement = statement
+        self.writer = Writer(self)
+
+    def get_writername(self):
+        return "mod_glia__pkg__{}__{}".format(self.asset_name, self.variant)
+
+
+class TestInitFile(unittest.TestCase):
+    """
+        Check that the in-memory model of __init__.py applies and flushes changes.
+    """
+
+    def setUp(self):
+        self.dir = make_dir(self)
+        self.path = os.path.join(self.dir, "pkg", "__init__.py")
+        os.mkdir(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write(
+                parse_template(
+                    "__init__.py",
+                    {"name": "pkg", "astro_version": "0", "glia_version": "0"},
+                )
+            )
+
+    def read(self):
+        with open(self.path, "r") as f:
+            return f.read()
+
+    def load(self):
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location("pkg", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def test_table(self):
+        init_file = InitFile(self.path)
+        self.assertTrue(init_file.table)
+        mods = [Mod("A"), Mod("B", statement="POINT_PROCESS"), Mod("C")]
+        for mod in mods:
+            init_file.update(mod.writer)
+        mods[2]._name_statement = "ARTIFICIAL_CELL"
+        init_file.update(mods[2].writer)
+        init_file.flush()
+        init_file = InitFile(self.path)
+        self.assertEqual(
+            ["#-mod_glia__pkg__A__0", "#-mod_glia__pkg__B__0", "#-mod_glia__pkg__C__0"],
+            init_file.taglines(),
+        )
+        init_file.remove("#-mod_glia__pkg__A__0")
+        init_file.rename(
+            "#-mod_glia__pkg__C__0", "#-mod_glia__pkg__D__0", "pkg__C__0", "pkg__D__0"
+        )
+        mods[2].asset_name = "D"
+        init_file.update(mods[2].writer)
+        init_file.update(Mod("E", "1").writer)
+        init_file.flush()
+        content = self.read()
+        self.assertNotIn("#-mod_glia__pkg__A__0", content)
+        self.assertIn("('D', '0', 'ARTIFICIAL_CELL'),  #-mod_glia__pkg__D__0", content)
+        # The package builds its mod records from the table when they're first used.
+        pkg = self.load().package()
+        self.assertIsNone(pkg._mods)
+        records = [(m.asset_name, m.variant, m.namespace) for m in pkg.mods]
+        self.assertEqual(
+            [("B", "0", "glia__pkg"), ("D", "0", "glia__pkg"), ("E", "1", "glia__pkg")],
+            records,
+        )
+        self.assertTrue(pkg.mods[0]._is_point_process)
+        self.assertTrue(pkg.mods[1]._is_artificial_cell)
+        self.assertEqual("SUFFIX", pkg.mods[2]._name_statement)
+        self.assertIs(pkg, pkg.mods[0].pkg)
+
+    def test_glia(self):
+        try:
+            from glia.assets import Package
+        except ImportError:
+            self.skipTest("Glia isn't installed")
+        init_file = InitFile(self.path)
+        init_file.update(Mod("A").writer)
+        init_file.update(Mod("B", "fast", "POINT_PROCESS").writer)
+        init_file.flush()
+        remote = self.load().package()
+        # Glia loads the mod records of installed packages like this.
+        pkg = Package(remote.name, remote.path)
+        pkg._load_remote_mods(remote)
+        self.assertEqual(
+            ["glia__pkg__A__0", "glia__pkg__B__fast"], [mod.mod_name for mod in pkg.mods],
+        )
+        self.assertEqual([False, True], [mod.is_point_process for mod in pkg.mods])
+
+    def test_legacy(self):
+        with open(self.path, "w") as f:
+            f.write(legacy_template)
+        init_file = InitFile(self.path)
+        self.assertFalse(init_file.table)
+        mods = [Mod("A"), Mod("B"), Mod("C")]
+        for mod in mods:
+            init_file.update(mod.writer)
+        mods[1].temperature = 32
+        init_file.update(mods[1].writer)
+        self.assertNotIn("#-mod_glia__pkg__A__0", self.read(), "Written before flush")
+        init_file.flush()
+        content = self.read()
+        for tag in ("A__0", "B__0", "C__0"):
+            self.assertIn("#-mod_glia__pkg__" + tag, content)
+        self.assertIn("mod_glia__pkg__B__0.temperature = 32", content)
+        self.assertTrue(content.rstrip().endswith("return pkg"))
+        # Reparse the flushed file and remove and rename blocks.
+        init_file = InitFile(self.path)
+        self.assertIn("#-mod_glia__pkg__B__0", init_file)
+        init_file.remove("#-mod_glia__pkg__A__0")
+        init_file.rename(
+            "#-mod_glia__pkg__C__0", "#-mod_glia__pkg__D__0", "pkg__C__0", "pkg__D__0"
+        )
+        init_file.flush()
+        content = self.read()
+        self.assertNotIn("pkg__A__0", content)
+        self.assertNotIn("pkg__C__0", content)
+        self.assertIn("#-mod_glia__pkg__D__0", content)
+        self.assertEqual(2, content.count("#-##"))
+        self.assertEqual(2, content.count("#-Generated by Astrocyte"))